@@ -0,0 +1,70 @@
+"""
+Compares the ways Smores can dump render data: marshmallow's dump, the generated dumpers
+(compiled_dumps=True) and the plain dict fast path (plain=True).
+
+	$ PYTHONPATH=. python benchmarks/bench_dump.py --rows 1000 --repeat 5
+"""
+import argparse
+import decimal
+import timeit
+from marshmallow import fields
+from smores import Smores, Schema, Nested, TemplateString
+
+
+class BenchTag(Schema):
+	label = fields.String()
+	weight = fields.Integer()
+
+
+class BenchRow(Schema):
+	id = fields.Integer()
+	name = fields.String()
+	email = fields.Email()
+	price = fields.Decimal(as_string=True)
+	active = fields.Boolean()
+	tags = Nested(BenchTag, many=True)
+
+
+class BenchUser(Schema):
+	name = fields.String()
+	rows = Nested(BenchRow, many=True)
+	_default_template = TemplateString("{{ name }}")
+
+
+TEMPLATE = "{% for row in benchuser.rows %}{{ row.name }} {{ row.price }} {{ row.tags|length }}\n{% endfor %}"
+
+
+def make_data(rows):
+	return dict(benchuser=dict(name='Bench', rows=[
+		dict(id=i, name='row %s' % i, email='row%s@example.com' % i, price=decimal.Decimal(i) / 4, active=bool(i % 2),
+		     tags=[dict(label='tag %s' % j, weight=j) for j in range(3)])
+		for i in range(rows)
+	]))
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+	parser.add_argument('--rows', type=int, default=1000, help='rows per render')
+	parser.add_argument('--repeat', type=int, default=5, help='renders per mode')
+	args = parser.parse_args()
+
+	data = make_data(args.rows)
+	modes = [
+		('marshmallow', Smores(), {}),
+		('compiled_dumps', Smores(compiled_dumps=True), {}),
+		('plain', Smores(), dict(plain=True)),
+	]
+
+	outputs = set()
+	for name, smores, kwargs in modes:
+		smores.add_schemas([BenchTag, BenchRow, BenchUser])
+		render = lambda: smores.render(data, TEMPLATE, **kwargs)
+		outputs.add(render())
+		seconds = min(timeit.repeat(render, number=1, repeat=args.repeat))
+		print('%-16s %8.1f ms/render  %8.1f us/row' % (name, seconds * 1000, seconds * 1e6 / args.rows))
+
+	assert len(outputs) == 1, 'modes rendered different output'
+
+
+if __name__ == '__main__':
+	main()
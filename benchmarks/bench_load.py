@@ -0,0 +1,293 @@
+"""
+Drives one shared Smores instance from many threads with a mix of renders and keystroke-by-keystroke
+autocompletes and tag searches, and reports the latency percentiles and throughput of each.
+
+	$ PYTHONPATH=. python benchmarks/bench_load.py --threads 16 --seconds 10
+	$ PYTHONPATH=. python benchmarks/bench_load.py --threads 8 --processes 4 --lazy --churn
+
+Every result is checked against the result of the same call made single-threaded before the load starts,
+so besides exceptions the run catches thread-safety bugs that corrupt the shared caches.  --churn registers
+and removes a schema in a loop while the load runs, which invalidates the caches keyed by the registered
+schemas; every call is made once more after the load, single-threaded, to catch caches left stale.
+--switch-interval makes thread switches, and so races, more frequent.  The exit status is 1 if any call
+failed or returned a wrong result.
+"""
+import argparse
+import random
+import sys
+import threading
+import time
+import traceback
+from multiprocessing import Pool
+from marshmallow import fields
+from smores import Smores, Schema, Nested, TemplateString
+
+TEMPLATES = [
+	"{loaduser.name} <{loaduser.email}>",
+	"{loaduser}",
+	"{loaduser.address.city}, {loaduser.address.geo.lat} {loaduser.orders:2.items:1.sku}",
+	"{loaduser.orders}",
+	"{% for order in loaduser.orders %}{order.id}: {% for item in order.items %}{item.sku} x{item.quantity} "
+	"{% endfor %}\n{% endfor %}",
+	"{loaduser.summary} {loaduser.company.name}",
+]
+
+# tag paths typed one keystroke at a time
+TYPED_TAGS = [
+	'loaduser.name',
+	'loaduser.address.geo.lat',
+	'loaduser.orders:1.items:2.sku',
+	'loaduser.company.catch_phrase',
+	'loaduser.summary',
+	'loadorder.items',
+	'churnschema.value',
+]
+
+
+def make_schemas(fields_count):
+	"""Synthetic LoadUser schemas with orders of items, an address and a company, fields_count extra fields each"""
+	def extra():
+		return dict(('extra%s' % i, fields.String()) for i in range(fields_count))
+
+	class LoadGeo(Schema):
+		lat = fields.Float()
+		lng = fields.Float()
+
+	class LoadAddress(Schema):
+		street = fields.String()
+		city = fields.String()
+		geo = Nested(LoadGeo)
+		_default_template = TemplateString("{{ street }}, {{ city }}")
+
+	class LoadCompany(Schema):
+		name = fields.String()
+		catch_phrase = fields.String()
+		_default_template = TemplateString("{{ name }}")
+
+	LoadItem = type('LoadItem', (Schema,), dict(
+		extra(), sku=fields.String(), quantity=fields.Integer(),
+		_default_template=TemplateString("{{ sku }} x{{ quantity }}; ")))
+
+	LoadOrder = type('LoadOrder', (Schema,), dict(
+		extra(), id=fields.Integer(), items=Nested(LoadItem, many=True),
+		_default_template=TemplateString("#{{ id }}: {{ items }}\n")))
+
+	LoadUser = type('LoadUser', (Schema,), dict(
+		extra(), name=fields.String(), email=fields.Email(), address=Nested(LoadAddress), company=Nested(LoadCompany),
+		orders=Nested(LoadOrder, many=True),
+		summary=TemplateString("{{ name }} ordered {{ orders|length }} times from {{ address.city }}"),
+		_default_template=TemplateString("{{ name }} ({{ company }})")))
+
+	return [LoadGeo, LoadAddress, LoadCompany, LoadItem, LoadOrder, LoadUser]
+
+
+def make_users(count, orders, items, fields_count):
+	extra = dict(('extra%s' % i, 'extra %s' % i) for i in range(fields_count))
+	users = []
+	for u in range(count):
+		users.append(dict(
+			extra, name='User %s' % u, email='user%s@example.com' % u,
+			address=dict(street='%s Main St' % u, city='City %s' % (u % 7), geo=dict(lat=u / 10.0, lng=-u / 10.0)),
+			company=dict(name='Company %s' % (u % 3), catch_phrase='Phrase %s' % u),
+			orders=[dict(extra, id=u * 100 + o, items=[dict(extra, sku='SKU-%s-%s' % (o, i), quantity=i + 1)
+			                                           for i in range(items)])
+			        for o in range(orders)]))
+	return users
+
+
+class ChurnSchema(Schema):
+	value = fields.String()
+
+
+# state of the current process, see _setup
+_state = {}
+
+
+def _setup(args):
+	smores = Smores()
+	smores.add_schemas(make_schemas(args.fields))
+	users = make_users(args.users, args.orders, args.items, args.fields)
+	fragments = sorted(set(tag[:i] for tag in TYPED_TAGS for i in range(1, len(tag) + 1)))
+
+	# single-threaded results every concurrent call is checked against, the first one is the result once the
+	# load is over, the second one the result while ChurnSchema is registered
+	expected = {}
+	for u, user in enumerate(users):
+		for t, template in enumerate(TEMPLATES):
+			expected['render', u, t] = [smores.render(dict(loaduser=user), template, lazy=args.lazy)]
+	for fragment in fragments:
+		expected['autocomplete', fragment] = [smores.autocomplete(fragment)]
+		expected['search', fragment] = [smores.search_tags(fragment)]
+	if args.churn:
+		with smores.with_schemas(ChurnSchema):
+			for fragment in fragments:
+				expected['autocomplete', fragment].append(smores.autocomplete(fragment))
+				expected['search', fragment].append(smores.search_tags(fragment))
+
+	if args.freeze:
+		smores.freeze(TEMPLATES)
+	_state.update(args=args, smores=smores, users=users, fragments=fragments, expected=expected)
+
+
+def _random_key(rng):
+	args, draw = _state['args'], rng.random()
+	if draw < args.render_ratio:
+		return 'render', rng.randrange(len(_state['users'])), rng.randrange(len(TEMPLATES))
+	if draw < args.render_ratio + args.search_ratio:
+		return 'search', rng.choice(_state['fragments'])
+	return 'autocomplete', rng.choice(_state['fragments'])
+
+
+def _call(key, settled=False):
+	"""
+	Makes the call of key, ('render', user index, template index), ('autocomplete', fragment) or
+	('search', fragment)
+
+	# Returns:
+		tuple: (seconds, error), error is None for a correct result.  Once settled, only the result without
+			ChurnSchema is correct.
+	"""
+	args, smores = _state['args'], _state['smores']
+	started = time.time()
+	try:
+		if key[0] == 'render':
+			result = smores.render(dict(loaduser=_state['users'][key[1]]), TEMPLATES[key[2]], lazy=args.lazy)
+		elif key[0] == 'search':
+			result = smores.search_tags(key[1])
+		else:
+			result = smores.autocomplete(key[1])
+	except Exception:
+		return time.time() - started, traceback.format_exc()
+
+	seconds = time.time() - started
+	expected = _state['expected'][key]
+	if result not in (expected[:1] if settled else expected):
+		return seconds, 'wrong result%s for %r: %r' % (' after the load' if settled else '', key[1:], result)
+	return seconds, None
+
+
+def _churn(stop):
+	smores = _state['smores']
+	while not stop.is_set():
+		smores.add_schemas([ChurnSchema])
+		smores.remove_schemas([ChurnSchema])
+
+
+def _run(seed):
+	"""Runs the threads of one process, returns {operation: [seconds]}, errors, and the wall time"""
+	args = _state['args']
+	latencies = dict(render=[], autocomplete=[], search=[])
+	errors = []
+	deadline = time.time() + args.seconds
+	lock = threading.Lock()
+
+	def worker(index):
+		rng = random.Random(seed * 1000 + index)
+		own = dict(render=[], autocomplete=[], search=[])
+		own_errors = []
+		while time.time() < deadline:
+			key = _random_key(rng)
+			seconds, error = _call(key)
+			own[key[0]].append(seconds)
+			if error is not None:
+				own_errors.append('%s: %s' % (key[0], error))
+		with lock:
+			for operation, values in own.items():
+				latencies[operation].extend(values)
+			errors.extend(own_errors)
+
+	stop = threading.Event()
+	threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+	if args.churn:
+		threads.append(threading.Thread(target=_churn, args=(stop,)))
+	started = time.time()
+	for thread in threads:
+		thread.start()
+	for thread in threads[:args.threads]:
+		thread.join()
+	stop.set()
+	for thread in threads[args.threads:]:
+		thread.join()
+	wall = time.time() - started
+
+	for key in sorted(_state['expected']):
+		error = _call(key, settled=True)[1]
+		if error is not None:
+			errors.append('%s: %s' % (key[0], error))
+	return latencies, errors, wall
+
+
+def _percentile(values, percent):
+	"""Nearest-rank percentile of sorted values"""
+	if not values:
+		return float('nan')
+	return values[min(len(values) - 1, max(0, int(round(percent / 100.0 * len(values))) - 1))]
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+	parser.add_argument('--threads', type=int, default=8, help='threads calling the shared instance per process')
+	parser.add_argument('--processes', type=int, default=1, help='forked processes, each running --threads threads')
+	parser.add_argument('--seconds', type=float, default=5, help='duration of the load')
+	parser.add_argument('--render-ratio', type=float, default=0.3, help='share of the calls that are renders')
+	parser.add_argument('--search-ratio', type=float, default=0.2,
+	                    help='share of the calls that are tag searches, the rest are autocompletes')
+	parser.add_argument('--users', type=int, default=20, help='distinct users rendered')
+	parser.add_argument('--orders', type=int, default=5, help='orders per user')
+	parser.add_argument('--items', type=int, default=4, help='items per order')
+	parser.add_argument('--fields', type=int, default=10, help='extra plain fields per user, order and item')
+	parser.add_argument('--lazy', action='store_true', help='render with lazy=True')
+	parser.add_argument('--freeze', action='store_true', help='freeze the instance before the load')
+	parser.add_argument('--churn', action='store_true', help='register and remove a schema in a loop during the load')
+	parser.add_argument('--switch-interval', type=float, metavar='SECONDS',
+	                    help='how often the interpreter switches threads, lower it (ex. 1e-6) to make races likelier')
+	args = parser.parse_args()
+	if args.churn and args.freeze:
+		parser.error('--churn can not change the schemas of a frozen instance')
+
+	_setup(args)
+	if args.switch_interval is not None:
+		if hasattr(sys, 'setswitchinterval'):
+			sys.setswitchinterval(args.switch_interval)
+		else:
+			# python 2 switches every n bytecodes, 100 by default: about 1e-5s
+			sys.setcheckinterval(max(1, int(args.switch_interval * 1e7)))
+	if args.processes > 1:
+		# the workers fork with the instance and expected results already built
+		pool = Pool(args.processes)
+		try:
+			runs = pool.map(_run, range(args.processes))
+		finally:
+			pool.close()
+			pool.join()
+	else:
+		runs = [_run(0)]
+
+	latencies = dict(render=[], autocomplete=[], search=[])
+	errors = []
+	for run_latencies, run_errors, _ in runs:
+		for operation, values in run_latencies.items():
+			latencies[operation].extend(values)
+		errors.extend(run_errors)
+	seconds = max(wall for _, _, wall in runs)
+
+	print('%s process(es) x %s thread(s) for %.1fs%s%s%s' % (
+		args.processes, args.threads, seconds, ', lazy' if args.lazy else '', ', frozen' if args.freeze else '',
+		', with schema churn' if args.churn else ''))
+	print('%-13s %9s %9s %9s %9s %9s %9s' % ('', 'calls', 'calls/s', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms'))
+	for operation in ('render', 'autocomplete', 'search'):
+		values = sorted(latencies[operation])
+		print('%-13s %9d %9.0f %9.2f %9.2f %9.2f %9.2f' % (
+			operation, len(values), len(values) / seconds, _percentile(values, 50) * 1000,
+			_percentile(values, 90) * 1000, _percentile(values, 99) * 1000, (values[-1] if values else 0) * 1000))
+
+	if errors:
+		print('%s failed or wrong calls, first ones:' % len(errors))
+		for error in errors[:5]:
+			print(error.rstrip())
+		return 1
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,191 @@
+"""
+Measures the peak memory of render, get_tags and autocomplete as the number of related rows, the nesting depth
+and the number of TemplateString fields grow, and fails when a case goes over its threshold.
+
+	$ PYTHONPATH=. python benchmarks/bench_memory.py
+	$ PYTHONPATH=. python benchmarks/bench_memory.py --case render/rows --scale 2
+
+Peaks are measured with tracemalloc when it's available (python 3, or pytracemalloc on python 2).  Otherwise each
+case runs in a forked process and the peak is the growth of its max resident set size, which is coarser
+(it counts whole pages and never shrinks) so its thresholds only catch large regressions.
+"""
+import argparse
+import os
+import resource
+import sys
+import traceback
+from collections import namedtuple
+from marshmallow import fields
+from smores import Smores, Schema, Nested, TemplateString
+
+try:
+	import tracemalloc
+except ImportError:
+	tracemalloc = None
+
+
+class MemTag(Schema):
+	label = fields.String()
+	weight = fields.Integer()
+	_default_template = TemplateString("{{ label }}")
+
+
+class MemRow(Schema):
+	id = fields.Integer()
+	name = fields.String()
+	email = fields.Email()
+	tags = Nested(MemTag, many=True)
+	_default_template = TemplateString("{{ name }} <{{ email }}> {{ tags }}\n")
+
+
+class MemUser(Schema):
+	name = fields.String()
+	rows = Nested(MemRow, many=True)
+	_default_template = TemplateString("{{ name }}")
+
+
+class MemNode(Schema):
+	name = fields.String()
+	child = Nested('self')
+	_default_template = TemplateString("{{ name }}/{{ child }}")
+
+
+def _wide_schema(count):
+	attrs = dict(('field%s' % i, fields.String()) for i in range(count))
+	attrs.update(('template%s' % i, TemplateString("{{ field%s }}-{{ field%s }}" % (i, i))) for i in range(count))
+	attrs['_default_template'] = TemplateString("".join("{{ template%s }}" % i for i in range(count)))
+	return type('MemWide', (Schema,), attrs)
+
+
+def _smores(*schemas):
+	smores = Smores()
+	smores.add_schemas(list(schemas))
+	return smores
+
+
+def render_rows(rows):
+	smores = _smores(MemTag, MemRow, MemUser)
+	data = dict(memuser=dict(name='Mem', rows=[
+		dict(id=i, name='row %s' % i, email='row%s@example.com' % i, tags=[dict(label='tag %s' % j, weight=j) for j in range(3)])
+		for i in range(rows)
+	]))
+	return lambda: smores.render(data, "{memuser.name}\n{memuser.rows}")
+
+
+def render_depth(depth):
+	smores = _smores(MemNode)
+	node = None
+	for i in range(depth):
+		node = dict(name='node %s' % i, child=node)
+	return lambda: smores.render(dict(memnode=node), "{memnode}")
+
+
+def render_templates(count):
+	schema = _wide_schema(count)
+	smores = _smores(schema)
+	data = dict(memwide=dict(('field%s' % i, 'value %s' % i) for i in range(count)))
+	return lambda: smores.render(data, "{memwide}")
+
+
+def get_tags_templates(count):
+	smores = _smores(_wide_schema(count), MemTag, MemRow, MemUser, MemNode)
+	return lambda: smores.get_tags()
+
+
+def autocomplete_templates(count):
+	smores = _smores(_wide_schema(count), MemTag, MemRow, MemUser, MemNode)
+	return lambda: [smores.autocomplete(fragment) for fragment in ('memwide.templ', 'memuser.rows:1.tags:2.la', 'memnode.child.child.')]
+
+
+Case = namedtuple('Case', ('name', 'size', 'threshold', 'make'))
+
+# thresholds are peak MB, about twice the measured peaks to absorb allocator and platform noise
+CASES = [
+	Case('render/rows', 100, 4, render_rows),
+	Case('render/rows', 1000, 12, render_rows),
+	Case('render/rows', 2000, 20, render_rows),
+	Case('render/depth', 5, 3, render_depth),
+	Case('render/depth', 20, 8, render_depth),
+	Case('render/templates', 10, 3, render_templates),
+	Case('render/templates', 100, 12, render_templates),
+	Case('get_tags/templates', 10, 1, get_tags_templates),
+	Case('get_tags/templates', 200, 2, get_tags_templates),
+	Case('autocomplete/templates', 10, 1, autocomplete_templates),
+	Case('autocomplete/templates', 200, 2, autocomplete_templates),
+]
+
+# the rss fallback also counts interpreter pages touched for the first time, it gets a fixed allowance on top
+RSS_ALLOWANCE = 4
+
+
+def _peak_tracemalloc(case, size):
+	run = case.make(size)
+	tracemalloc.start()
+	try:
+		run()
+		return tracemalloc.get_traced_memory()[1] / (1024.0 * 1024)
+	finally:
+		tracemalloc.stop()
+
+
+def _max_rss():
+	# kilobytes on linux, bytes on darwin
+	max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	return max_rss / (1024.0 * 1024) if sys.platform == 'darwin' else max_rss / 1024.0
+
+
+def _peak_rss(case, size):
+	read, write = os.pipe()
+	pid = os.fork()
+	if pid == 0:
+		os.close(read)
+		status = 1
+		try:
+			run = case.make(size)
+			before = _max_rss()
+			run()
+			os.write(write, repr(_max_rss() - before).encode('ascii'))
+			status = 0
+		except Exception:
+			traceback.print_exc()
+			sys.stderr.flush()
+		finally:
+			os._exit(status)
+
+	os.close(write)
+	output = os.read(read, 64)
+	os.close(read)
+	_, status = os.waitpid(pid, 0)
+	if status != 0:
+		raise RuntimeError('case %s(%s) failed' % (case.name, size))
+	return float(output)
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+	parser.add_argument('--case', action='append', help='only run cases with this name (repeatable)')
+	parser.add_argument('--scale', type=float, default=1, help='multiplies the sizes, thresholds scale along')
+	args = parser.parse_args()
+
+	measure, allowance = (_peak_tracemalloc, 0) if tracemalloc is not None else (_peak_rss, RSS_ALLOWANCE)
+	print('measuring with %s' % ('tracemalloc' if tracemalloc is not None else 'max rss'))
+
+	failed = []
+	for case in CASES:
+		if args.case and case.name not in args.case:
+			continue
+		size = int(case.size * args.scale)
+		threshold = case.threshold * max(args.scale, 1) + allowance
+		peak = measure(case, size)
+		over = peak > threshold
+		print('%-24s %6s %8.1f MB  (threshold %6.1f MB)%s' % (case.name, size, peak, threshold, '  OVER' if over else ''))
+		if over:
+			failed.append(case)
+
+	if failed:
+		print('%s case(s) over their memory threshold' % len(failed))
+		sys.exit(1)
+
+
+if __name__ == '__main__':
+	main()
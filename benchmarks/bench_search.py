@@ -0,0 +1,55 @@
+"""
+Times Smores.search_tags on generated schemas with tens of thousands of tag paths.
+
+	$ PYTHONPATH=. python benchmarks/bench_search.py --levels 8 --fields 20
+"""
+import argparse
+import timeit
+from marshmallow import fields
+from smores import Smores, Schema, Nested
+
+QUERIES = ['field7', 'fiel', 'ield1', 'fieldd3', 'level3.field', 'level1.level2.field3', 'nosuchfield', 'fi']
+
+
+def make_schemas(levels, field_count, branches):
+	"""Schemas SearchLevel0..n, each with field_count fields and branches Nested fields to the next level"""
+	schemas = []
+	child = None
+	for level in reversed(range(levels)):
+		attrs = dict(('field%s_%s' % (i, level), fields.String()) for i in range(field_count))
+		if child is not None:
+			attrs.update(('level%s_%s' % (level + 1, i), Nested(child, many=i % 2 == 0)) for i in range(branches))
+		child = type('SearchLevel%s' % level, (Schema,), attrs)
+		schemas.append(child)
+	return schemas
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+	parser.add_argument('--levels', type=int, default=8, help='depth of the Nested schemas')
+	parser.add_argument('--fields', type=int, default=20, help='plain fields per schema')
+	parser.add_argument('--branches', type=int, default=3, help='Nested fields per schema')
+	parser.add_argument('--number', type=int, default=200, help='searches per query')
+	args = parser.parse_args()
+
+	smores = Smores()
+	schemas = make_schemas(args.levels, args.fields, args.branches)
+	smores.add_schemas(schemas[-1])
+
+	started = timeit.default_timer()
+	paths = len(smores.get_tags())
+	smores.search_tags('')
+	print('%s tag paths, index built in %.1f ms' % (paths, (timeit.default_timer() - started) * 1000))
+
+	for query in QUERIES:
+		seconds = min(timeit.repeat(lambda: smores.search_tags(query), number=args.number, repeat=3)) / args.number
+		print('%-14r %8.1f us  %s' % (query, seconds * 1e6, smores.search_tags(query, limit=3)))
+
+	started = timeit.default_timer()
+	smores.add_schemas(schemas[-2])
+	smores.search_tags('')
+	print('adding a root schema re-indexed in %.1f ms' % ((timeit.default_timer() - started) * 1000))
+
+
+if __name__ == '__main__':
+	main()
@@ -90,6 +90,9 @@ setup(
     tests_require=test_deps,
     install_requires=REQUIRED,
     include_package_data=True,
+    entry_points={
+        'console_scripts': ['smores=smores.cli:main'],
+    },
     license='MIT',
     classifiers=[
         # Trove classifiers
@@ -108,7 +111,6 @@ setup(
     ],
 	extras_require = {
 	    'test': test_deps,
-		'utils': ['bs4'],
 		'docs': ['pydocmd', 'mkdocs', 'recommonmark']
 	},
     # $ setup.py publish support.
@@ -1,2 +1,7 @@
-from .smores import Smores, AutocompleteResponse, TemplateString, TemplateFile, Schema, Nested
-__all__ = ['Smores', 'AutocompleteResponse', 'TemplateString', 'TemplateFile', 'Schema', 'Nested']
+from .smores import Smores, AutocompleteResponse, AutocompleteSession, UnknownTag, TemplateString, TemplateFile, Schema, Nested
+from .cache import LRUCache, FragmentCache
+from .limits import RenderLimits, RenderLimitExceeded
+from .metrics import Metrics, to_prometheus
+from .profile import RenderProfile
+__all__ = ['Smores', 'AutocompleteResponse', 'AutocompleteSession', 'UnknownTag', 'TemplateString', 'TemplateFile', 'Schema', 'Nested', 'LRUCache', 'FragmentCache',
+           'RenderLimits', 'RenderLimitExceeded', 'Metrics', 'to_prometheus', 'RenderProfile']
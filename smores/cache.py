@@ -0,0 +1,268 @@
+import hashlib
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from marshmallow.compat import basestring
+
+
+def _sizeof(value):
+	if isinstance(value, basestring):
+		return len(value.encode('utf-8') if not isinstance(value, bytes) else value)
+	return sys.getsizeof(value)
+
+
+def fingerprint(data):
+	"""
+	Computes a stable fingerprint for plain data (dicts, lists and scalars).
+
+	# Arguments:
+		data (object): the data passed to render
+
+	# Returns:
+		str|None: hex digest of the data, None if data contains anything but json types (ex. ORM models)
+	"""
+	try:
+		serialized = json.dumps(data, sort_keys=True, separators=(',', ':'))
+	except (TypeError, ValueError):
+		return None
+	return hashlib.sha1(serialized.encode('utf-8')).hexdigest()
+
+
+class LRUCache(object):
+	"""
+	A thread safe least-recently-used cache with optional time-to-live and size accounting.
+	Entries can be tagged so that they may be invalidated together.
+
+	# Arguments:
+		max_entries (int|None): maximum number of entries kept
+		max_bytes (int|None): maximum total size of the cached values
+		ttl (float|None): seconds an entry stays valid
+		sizeof (function): returns the size in bytes of a cached value
+	"""
+
+	def __init__(self, max_entries=1024, max_bytes=None, ttl=None, sizeof=_sizeof):
+		self.max_entries = max_entries
+		self.max_bytes = max_bytes
+		self.ttl = ttl
+		self.sizeof = sizeof
+
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self.bytes = 0
+
+		self._entries = OrderedDict()
+		self._tags = {}
+		self._lock = threading.Lock()
+
+	def __len__(self):
+		return len(self._entries)
+
+	def __contains__(self, key):
+		with self._lock:
+			return self._lookup(key) is not None
+
+	def get(self, key, default=None):
+		"""
+		Returns the cached value for key, marking it as recently used
+
+		# Arguments:
+			key (hashable): cache key
+			default (object): returned when key is not cached
+		"""
+		with self._lock:
+			entry = self._lookup(key)
+			if entry is None:
+				self.misses += 1
+				return default
+			self.hits += 1
+			return entry[0]
+
+	def set(self, key, value, tags=()):
+		"""
+		Caches value under key, evicting least recently used entries if over the limits
+
+		# Arguments:
+			key (hashable): cache key
+			value (object): value to cache
+			tags (iterable): tags that can later be passed to invalidate
+		"""
+		size = self.sizeof(value)
+		if self.max_bytes is not None and size > self.max_bytes:
+			return
+
+		expires = time.time() + self.ttl if self.ttl is not None else None
+		tags = tuple(tags)
+
+		with self._lock:
+			entry = self._entries.pop(key, None)
+			if entry is not None:
+				self._discard(key, entry)
+
+			self._entries[key] = (value, size, expires, tags)
+			self.bytes += size
+			for tag in tags:
+				self._tags.setdefault(tag, set()).add(key)
+
+			while self._entries and (
+					(self.max_entries is not None and len(self._entries) > self.max_entries) or
+					(self.max_bytes is not None and self.bytes > self.max_bytes)):
+				oldest_key = next(iter(self._entries))
+				self._discard(oldest_key, self._entries.pop(oldest_key))
+				self.evictions += 1
+
+	def invalidate(self, tag):
+		"""
+		Drops every entry cached with tag
+
+		# Arguments:
+			tag (hashable): a tag passed to set
+
+		# Returns:
+			int: number of entries dropped
+		"""
+		with self._lock:
+			keys = self._tags.pop(tag, ())
+			for key in keys:
+				entry = self._entries.pop(key, None)
+				if entry is not None:
+					self._discard(key, entry)
+			return len(keys)
+
+	def clear(self):
+		"""Drops every entry"""
+		with self._lock:
+			self._entries.clear()
+			self._tags.clear()
+			self.bytes = 0
+
+	@property
+	def stats(self):
+		"""
+		# Returns:
+			dict: hits, misses, evictions, entries and bytes of the cache
+		"""
+		return dict(hits=self.hits, misses=self.misses, evictions=self.evictions,
+		            entries=len(self._entries), bytes=self.bytes)
+
+	def _discard(self, key, entry):
+		self.bytes -= entry[1]
+		for tag in entry[3]:
+			keys = self._tags.get(tag)
+			if keys is not None:
+				keys.discard(key)
+				if not keys:
+					del self._tags[tag]
+
+	def _lookup(self, key):
+		entry = self._entries.pop(key, None)
+		if entry is None:
+			return None
+		if entry[2] is not None and entry[2] < time.time():
+			self._discard(key, entry)
+			return None
+		self._entries[key] = entry
+		return entry
+
+
+class FragmentCache(LRUCache):
+	"""
+	Caches rendered TemplateString fragments, keyed by (schema class, field name, object key).  The object
+	key is the TemplateString's cache_key(obj) when given.  Without a cache_key, fragments are only cached
+	by the identity of obj within a `batch()`, during which the rendered objects must not change.  Hits and
+	misses are counted per schema field so the cache can be tuned.
+
+	# Arguments:
+		max_entries (int|None): maximum number of fragments kept
+		**kwargs: passed on to LRUCache
+
+	# Example:
+		smores = Smores(fragment_cache=FragmentCache())
+
+		with smores.fragment_cache.batch():
+			for user in users:
+				smores.render(dict(user=user), template)
+	"""
+
+	def __init__(self, max_entries=4096, **kwargs):
+		# entries are (owner, fragment) pairs, only the fragment counts towards max_bytes
+		kwargs.setdefault('sizeof', lambda entry: _sizeof(entry[1]))
+		super(FragmentCache, self).__init__(max_entries=max_entries, **kwargs)
+		self._counters = {}
+		self._local = threading.local()
+
+	def fetch(self, schema_class, field_name, obj, render, cache_key=None):
+		"""
+		Returns the cached fragment for obj, rendering and caching it on a miss
+
+		# Arguments:
+			schema_class (SchemaMeta): schema the TemplateString belongs to
+			field_name (str): name of the TemplateString field
+			obj (object): the unserialized obj being rendered
+			render (function): renders the fragment
+			cache_key (function|None): returns a key (ex. id and version) for obj, identity is used within a batch if None
+
+		# Returns:
+			string: the rendered fragment
+		"""
+		if cache_key is not None:
+			key = (schema_class, field_name, cache_key(obj))
+			owner = None
+			tags = ()
+		else:
+			batch = getattr(self._local, 'batch', None)
+			if batch is None:
+				# identity keyed fragments would keep obj alive and go stale when it changes
+				self._count(schema_class, field_name, 1)
+				return render()
+			key = (schema_class, field_name, id(obj))
+			owner = obj
+			tags = (batch,)
+
+		cached = self.get(key)
+		# the obj is kept with identity keyed fragments so a recycled id can't return a stale fragment
+		if cached is not None and cached[0] is owner:
+			self._count(schema_class, field_name, 0)
+			return cached[1]
+
+		self._count(schema_class, field_name, 1)
+		fragment = render()
+		self.set(key, (owner, fragment), tags)
+		return fragment
+
+	def _count(self, schema_class, field_name, index):
+		with self._lock:
+			counter = self._counters.get((schema_class, field_name))
+			if counter is None:
+				counter = self._counters[(schema_class, field_name)] = [0, 0]
+			counter[index] += 1
+
+	@property
+	def counters(self):
+		"""
+		# Returns:
+			dict: {'<Schema>.<field>': {'hits': int, 'misses': int}}
+		"""
+		with self._lock:
+			counters = [(key, tuple(counter)) for key, counter in self._counters.items()]
+		return dict(('%s.%s' % (schema_class.__name__, field_name), dict(hits=hits, misses=misses))
+		            for (schema_class, field_name), (hits, misses) in counters)
+
+	@contextmanager
+	def batch(self):
+		"""
+		Context manager within which fragments without a cache_key are cached by the identity of their obj.
+		Those fragments are dropped on exit.
+		"""
+		if getattr(self._local, 'batch', None) is not None:
+			yield self
+		else:
+			self._local.batch = batch = object()
+			try:
+				yield self
+			finally:
+				self._local.batch = None
+				self.invalidate(batch)
@@ -3,6 +3,10 @@
 lookup of schemas, which may be used with
 class:`fields.Nested <marshmallow.fields.Nested>`.
 
+Classes are held by weak reference so that schemas created dynamically (ex. per request)
+are garbage collected once nothing else refers to them.  A class referred to by name from the
+Nested field of a registered class is kept alive for as long as that class is.
+
 .. warning::
 
     This module is treated as private API.
@@ -10,19 +14,70 @@ class:`fields.Nested <marshmallow.fields.Nested>`.
 """
 from __future__ import unicode_literals
 
+from weakref import WeakSet, WeakValueDictionary
+
+from marshmallow.compat import basestring
 from marshmallow.exceptions import RegistryError
 
 # {
-#   <class_name>: <list of class objects>
-#   <module_path_to_class>: <list of class objects>
+#   <class_name>: {<module>: <class object>}
 # }
 _registry = {}
 
+# {
+#   <module_path_to_class>: <class object>
+# }
+_fullpaths = WeakValueDictionary()
+
+# {
+#   <class_name or module_path_to_class>: WeakSet(<classes with a Nested field referring to it>)
+# }
+_referrers = {}
+
+# attribute of a class holding the classes it refers to by name, so they live as long as it does
+_REFERENCES_ATTR = '_registry_references'
+
+# number of class names after the last sweep of names whose classes were all collected
+_swept_size = [0]
+
+
+def _sweep():
+    """Drops class names whose classes have all been garbage collected."""
+    for classname in [name for name, classes in _registry.items() if not len(classes)]:
+        # the class may have been collected between listing and deleting
+        if not len(_registry.get(classname, ())):
+            _registry.pop(classname, None)
+    for name in [name for name, referrers in _referrers.items() if not len(referrers)]:
+        if not len(_referrers.get(name, ())):
+            _referrers.pop(name, None)
+    _swept_size[0] = len(_registry)
+
+
+def _referenced_names(cls):
+    """Names of the classes referred to by name from Nested fields of cls."""
+    names = set()
+    for field in getattr(cls, '_declared_fields', {}).values():
+        nested = getattr(field, 'nested', None)
+        if isinstance(nested, basestring) and nested != 'self':
+            names.add(nested)
+    return names
+
+
+def _reference(referrer, cls):
+    """Keeps cls alive for as long as referrer is."""
+    references = referrer.__dict__.get(_REFERENCES_ATTR)
+    if references is None:
+        references = []
+        setattr(referrer, _REFERENCES_ATTR, references)
+    if not any(ref is cls for ref in references):
+        references.append(cls)
+
 
 def register(classname, cls):
     """Add a class to the registry of serializer classes. When a class is
     registered, an entry for both its classname and its full, module-qualified
-    path are added to the registry.
+    path are added to the registry. Registering a class with the same name in
+    the same module replaces the previous one.
 
     Example: ::
 
@@ -32,8 +87,11 @@ def register(classname, cls):
         register('MyClass', MyClass)
         # Registry:
         # {
-        #   'MyClass': [path.to.MyClass],
-        #   'path.to.MyClass': [path.to.MyClass],
+        #   'MyClass': {'path.to': path.to.MyClass},
+        # }
+        # Full paths:
+        # {
+        #   'path.to.MyClass': path.to.MyClass,
         # }
 
     """
@@ -42,35 +100,52 @@ def register(classname, cls):
     # Full module path to the class
     # e.g. user.schemas.UserSchema
     fullpath = '.'.join([module, classname])
-    # If the class is already registered; need to check if the entries are
-    # in the same module as cls to avoid having multiple instances of the same
-    # class in the registry
-    if classname in _registry and not \
-            any(each.__module__ == module for each in _registry[classname]):
-        _registry[classname].append(cls)
-    else:
-        _registry[classname] = [cls]
+
+    classes = _registry.get(classname)
+    if classes is None:
+        classes = _registry[classname] = WeakValueDictionary()
+    classes[module] = cls
 
     # Also register the full path
-    _registry.setdefault(fullpath, []).append(cls)
+    _fullpaths[fullpath] = cls
+
+    # keep the classes cls refers to by name alive, and cls alive for the classes referring to it
+    for name in _referenced_names(cls):
+        _referrers.setdefault(name, WeakSet()).add(cls)
+        for referenced in list(_registry.get(name, {}).values()) + [_fullpaths.get(name)]:
+            if referenced is not None:
+                _reference(cls, referenced)
+    for name in (classname, fullpath):
+        for referrer in list(_referrers.get(name, ())):
+            _reference(referrer, cls)
+
+    # sweep dead names once the registry has doubled, keeping registration amortized O(1)
+    if len(_registry) > 2 * max(_swept_size[0], 64):
+        _sweep()
     return None
 
+
 def get_class(classname, all=False):
     """Retrieve a class from the registry.
 
     :raises: marshmallow.exceptions.RegistryError if the class cannot be found
         or if there are multiple entries for the given class name.
     """
-    try:
-        classes = _registry[classname]
-    except KeyError:
-        raise RegistryError('Class with name {0!r} was not found. You may need '
-            'to import the class.'.format(classname))
+    classes = _registry.get(classname)
+    classes = list(classes.values()) if classes is not None else []
+
+    if not classes:
+        cls = _fullpaths.get(classname)
+        if cls is None:
+            raise RegistryError('Class with name {0!r} was not found. You may need '
+                'to import the class.'.format(classname))
+        classes = [cls]
+
     if len(classes) > 1:
         if all:
-            return _registry[classname]
+            return classes
         raise RegistryError('Multiple classes with name {0!r} '
             'were found. Please use the full, '
             'module-qualified path.'.format(classname))
     else:
-        return _registry[classname][0]
+        return classes[0]
@@ -0,0 +1,181 @@
+"""
+Renders a template against every record of a JSON Lines file
+
+	$ smores --schemas myapp.schemas --root user --template "Hi {user.name}" < users.jsonl > letters.jsonl
+	$ smores --schemas myapp.schemas --root user --template-file letter.txt --input users.jsonl \
+		--output-dir letters --name-key id --workers 4
+
+Each record is the data passed to `Smores.render`, a mapping of root names to data, or the data of a single
+root when --root is given.  Outputs are written as they're rendered, in the order of the input, either as
+JSON Lines ({"line": 1, "output": "..."}) or as one file per record, a record whose file name is already
+taken by an earlier one gets its line number appended (ex. 42-7.txt).  Records that fail to render are
+reported (as {"line": 1, "error": "..."} in JSON Lines) without stopping the batch, the exit status is 1 if
+any failed.  Throughput is reported on stderr at the end.
+"""
+import argparse
+import importlib
+import io
+import itertools
+import json
+import os
+import re
+import sys
+import time
+from multiprocessing import Pool
+from .smores import Smores
+
+# state of the current process (main or pool worker), see _init_worker
+_worker = {}
+
+
+def _init_worker(options):
+	"""Builds the Smores instance of a process from the parsed command-line options"""
+	if os.getcwd() not in sys.path:
+		sys.path.insert(0, os.getcwd())
+
+	smores = Smores()
+	for name in options['schemas']:
+		smores.add_module_schemas(importlib.import_module(name))
+	_worker.clear()
+	_worker.update(options, smores=smores)
+
+
+def _render_line(numbered_line):
+	"""
+	Renders the record of one input line
+
+	# Arguments:
+		numbered_line (tuple): (line number, line)
+
+	# Returns:
+		tuple: (line number, record name, output, error), the name is None without --name-key
+	"""
+	number, line = numbered_line
+	name = None
+	try:
+		record = json.loads(line)
+		if _worker['name_key']:
+			name = record.get(_worker['name_key']) if isinstance(record, dict) else None
+		data = {_worker['root']: record} if _worker['root'] else record
+		output = _worker['smores'].render(data, _worker['template'], fallback_value=_worker['fallback'],
+		                                  lazy=_worker['lazy'])
+		return number, name, output, None
+	except Exception as e:
+		return number, name, None, u'%s: %s' % (type(e).__name__, e)
+
+
+def _numbered_lines(stream):
+	for number, line in enumerate(stream, 1):
+		if line.strip():
+			yield number, line
+
+
+def _file_name(name, number, extension, taken):
+	"""
+	Output file name of a record, a name already taken by an earlier record of the batch (case-insensitively,
+	as on some filesystems) gets the line number appended
+
+	# Arguments:
+		name: record name, None without --name-key
+		number (int): line number
+		extension (str): file extension
+		taken (set): lowercased file names written so far, the returned name is added
+
+	# Returns:
+		unicode: file name
+	"""
+	stem = re.sub(r'[^\w.-]', '_', u'%s' % (number if name is None else name)).lstrip('.') or u'%s' % number
+	stems = itertools.chain([stem, u'%s-%s' % (stem, number)],
+	                        (u'%s-%s-%s' % (stem, number, i) for i in itertools.count(2)))
+	file_name = next(s + extension for s in stems if (s + extension).lower() not in taken)
+	taken.add(file_name.lower())
+	return file_name
+
+
+def _parser():
+	parser = argparse.ArgumentParser(prog='smores', description=__doc__.strip().splitlines()[0])
+	parser.add_argument('--schemas', action='append', required=True, metavar='MODULE',
+	                    help='module to register the schemas of, like Smores.add_module_schemas (repeatable)')
+	template = parser.add_mutually_exclusive_group(required=True)
+	template.add_argument('--template', help='template string')
+	template.add_argument('--template-file', metavar='PATH', help='file holding the template string')
+	parser.add_argument('--input', default='-', metavar='PATH', help='JSON Lines file of records, - for stdin (default)')
+	parser.add_argument('--root', help='root name of each record, ex. user, when records are not a mapping of roots')
+	parser.add_argument('--output-dir', metavar='DIR', help='write one file per record here instead of JSON Lines to stdout')
+	parser.add_argument('--name-key', metavar='KEY', help='record key naming its output file, defaults to the line number, '
+	                    'repeated names get the line number appended')
+	parser.add_argument('--extension', default='.txt', help='extension of the output files (default .txt)')
+	parser.add_argument('--fallback', default='', help='value of tags that can not be resolved')
+	parser.add_argument('--lazy', action='store_true', help='only serialize the fields the template uses')
+	parser.add_argument('--workers', type=int, default=1, help='processes rendering records in parallel (default 1)')
+	parser.add_argument('--chunk-size', type=int, default=16, help='records sent to a worker at a time (default 16)')
+	return parser
+
+
+def main(argv=None):
+	"""
+	Entry point of the `smores` command
+
+	# Arguments:
+		argv (list): command-line arguments, defaults to sys.argv[1:]
+
+	# Returns:
+		int: exit status, 1 if any record failed to render
+	"""
+	args = _parser().parse_args(argv)
+
+	if args.template_file:
+		with io.open(args.template_file, encoding='utf-8') as f:
+			template = f.read()
+	else:
+		template = args.template.decode(sys.getfilesystemencoding() or 'utf-8') \
+			if isinstance(args.template, bytes) else args.template
+
+	options = dict(schemas=args.schemas, template=template, root=args.root, name_key=args.name_key,
+	               fallback=args.fallback, lazy=args.lazy)
+	_init_worker(options)
+
+	stream = sys.stdin if args.input == '-' else io.open(args.input, encoding='utf-8')
+	pool = Pool(args.workers, _init_worker, (options,)) if args.workers > 1 else None
+	if args.output_dir and not os.path.isdir(args.output_dir):
+		os.makedirs(args.output_dir)
+
+	started = time.time()
+	rendered = failed = 0
+	taken = set()
+	try:
+		lines = _numbered_lines(stream)
+		results = pool.imap(_render_line, lines, args.chunk_size) if pool else itertools.imap(_render_line, lines)
+		for number, name, output, error in results:
+			if error is not None:
+				failed += 1
+				sys.stderr.write(u'line %s: %s\n' % (number, error))
+			else:
+				rendered += 1
+
+			if args.output_dir:
+				if error is None:
+					path = os.path.join(args.output_dir, _file_name(name, number, args.extension, taken))
+					with io.open(path, 'w', encoding='utf-8') as f:
+						f.write(output)
+			else:
+				result = dict(line=number, output=output) if error is None else dict(line=number, error=error)
+				if name is not None:
+					result['name'] = name
+				sys.stdout.write(json.dumps(result) + '\n')
+				sys.stdout.flush()
+	finally:
+		if pool:
+			pool.close()
+			pool.join()
+		if stream is not sys.stdin:
+			stream.close()
+
+	seconds = time.time() - started
+	sys.stderr.write('rendered %s records (%s failed) in %.2fs, %.1f records/s\n' % (
+		rendered, failed, seconds, (rendered + failed) / seconds if seconds else 0))
+	return 1 if failed else 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
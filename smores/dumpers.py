@@ -0,0 +1,324 @@
+"""
+Generates specialized dump functions for schemas.  Smores only dumps data to render it, so a dumper skips
+marshmallow's generic machinery (the per-field serialize dispatch, accessor indirection and error
+collection): it pulls keys/attributes and formats simple fields inline, and calls the field's own
+_serialize for everything else.  Nested fields dump through the dumper of their nested schema.
+
+The source of a dumper only depends on the projection of the schema (its field names, keys and kinds), so
+the compiled code is shared by every schema instance with the same projection and bound to an instance's
+fields when it is first used.
+
+Dumps fall back to `schema.dump(obj).data` whenever the output could differ from it: schemas with
+processors, a prefix, inferred or extra fields, a custom get_attribute or an ordered dict class, any
+ValidationError (marshmallow collects it and leaves the key out) and renders with RenderLimits.
+"""
+from marshmallow import fields
+from marshmallow.compat import basestring
+from marshmallow.exceptions import ValidationError
+from marshmallow.schema import BaseSchema
+from marshmallow.utils import missing, ensure_text_type, get_value, _get_value_for_key
+from .limits import current_budget
+from .memo import current_memo
+
+_FACTORIES_SIZE = 1024
+_factories = {}
+
+# attribute of a schema instance holding its bound dumper
+_DUMPER_ATTR = '_smores_dumper'
+
+# field kinds, see _field_kind
+_STRING, _RAW, _NESTED, _FORMAT, _NO_ATTRIBUTE, _FIELD = 'string', 'raw', 'nested', 'format', 'no_attribute', 'field'
+
+
+def _attr(obj, key):
+	# the getattr half of marshmallow.utils._get_value_for_key
+	try:
+		value = getattr(obj, key)
+	except AttributeError:
+		return missing
+	return value() if callable(value) else value
+
+
+def _item_or_attr(obj, key):
+	return _get_value_for_key(key, obj, missing)
+
+
+def _compilable(schema):
+	"""Whether the output of a dumper for schema is the same as schema.dump(obj).data"""
+	cls = schema.__class__
+	return (not schema._has_processors and not schema.prefix and not schema.extra and
+	        schema.dict_class is dict and
+	        cls.get_attribute.__func__ is BaseSchema.get_attribute.__func__ and
+	        not schema.opts.fields and not schema.opts.additional and
+	        all(name in schema.declared_fields for name in (schema.only or ())))
+
+
+def _field_kind(field):
+	field_type = type(field)
+	if not field._CHECK_ATTRIBUTE:
+		return _NO_ATTRIBUTE
+	if field_type.get_value.__func__ is not fields.Field.get_value.__func__:
+		return _FIELD
+	if field_type is fields.String:
+		return _STRING
+	if field_type is fields.Raw:
+		return _RAW
+	if isinstance(field, fields.Nested) and not isinstance(field.only, basestring):
+		return _NESTED
+	return _FORMAT
+
+
+def _signature(schema):
+	"""The projection of a bound schema, it alone determines the source of the dumper"""
+	signature = []
+	for name, field in schema.fields.items():
+		if field.load_only:
+			continue
+		default = 'none' if field.default is missing else 'call' if callable(field.default) else 'value'
+		check_key = name if field.attribute is None else field.attribute
+		signature.append((name, field.dump_to or name, check_key, _field_kind(field), default))
+	return tuple(signature)
+
+
+def _field_source(index, field_signature, dict_access):
+	name, key, check_key, kind, default = field_signature
+	field = 'f%d' % index
+	lines = []
+
+	if kind == _NO_ATTRIBUTE:
+		lines.append('out[%r] = %s._serialize(None, %r, obj)' % (key, field, name))
+		return lines
+
+	if kind == _FIELD:
+		lines.append('v = %s.serialize(%r, obj, accessor=_get_attribute)' % (field, name))
+		lines.append('if v is not _missing:')
+		lines.append('\tout[%r] = v' % key)
+		return lines
+
+	if not isinstance(check_key, basestring) or '.' in check_key:
+		lines.append('v = _get_value(%r, obj, _missing)' % (check_key,))
+	elif dict_access:
+		lines.append('v = obj[%r] if %r in obj else _attr(obj, %r)' % (check_key, check_key, check_key))
+	else:
+		lines.append('v = _g(obj, %r)' % (check_key,))
+
+	lines.append('if v is _missing:')
+	if default == 'none':
+		lines.append('\tpass')
+	elif default == 'call':
+		lines.append('\tout[%r] = _d[%d]()' % (key, index))
+	else:
+		lines.append('\tout[%r] = _d[%d]' % (key, index))
+	lines.append('else:')
+
+	if kind == _STRING:
+		lines.append('\tout[%r] = None if v is None else _text(v)' % key)
+	elif kind == _RAW:
+		lines.append('\tout[%r] = v' % key)
+	elif kind == _NESTED:
+		lines.append('\tout[%r] = None if v is None else _nested(%s.schema, v)' % (key, field))
+	else:
+		lines.append('\tr = %s._serialize(v, %r, obj)' % (field, name))
+		lines.append('\tif r is not _missing:')
+		lines.append('\t\tout[%r] = r' % key)
+	return lines
+
+
+def _source(signature):
+	field_names = ''.join('f%d, ' % i for i in range(len(signature)))
+	lines = [
+		'def factory(_f, _d, _get_attribute):',
+		'\t%s = _f' % field_names if signature else '\tpass',
+		'\tdef one(obj):',
+		'\t\tout = {}',
+		'\t\tif type(obj) is dict:',
+	]
+	for index, field_signature in enumerate(signature):
+		lines.extend('\t\t\t' + line for line in _field_source(index, field_signature, True))
+	lines.append('\t\t\tpass')
+	lines.append('\t\telse:')
+	lines.append("\t\t\t_g = _item_or_attr if hasattr(type(obj), '__getitem__') else _attr")
+	for index, field_signature in enumerate(signature):
+		lines.extend('\t\t\t' + line for line in _field_source(index, field_signature, False))
+	lines.append('\t\treturn out')
+	lines.append('\treturn one')
+	return '\n'.join(lines) + '\n'
+
+
+def _factory(signature):
+	factory = _factories.get(signature)
+	if factory is None:
+		namespace = dict(_missing=missing, _text=ensure_text_type, _attr=_attr, _item_or_attr=_item_or_attr,
+		                 _get_value=get_value, _nested=_nested)
+		exec(compile(_source(signature), '<smores dumper>', 'exec'), namespace)
+		factory = namespace['factory']
+		if len(_factories) >= _FACTORIES_SIZE:
+			_factories.clear()
+		_factories[signature] = factory
+	return factory
+
+
+def _bind(schema):
+	"""Returns the (safe, raw) dumpers of a schema instance, binding them on first use"""
+	dumpers = schema.__dict__.get(_DUMPER_ATTR)
+	if dumpers is not None:
+		return dumpers
+
+	if not _compilable(schema):
+		def raw(obj):
+			data, errors = schema.dump(obj)
+			if errors:
+				raise ValidationError(errors, data=data)
+			return data
+	else:
+		signature = _signature(schema)
+		bound_fields = [schema.fields[name] for name, _, _, _, _ in signature]
+		defaults = [field.default for field in bound_fields]
+		one = _factory(signature)(bound_fields, defaults, schema.get_attribute)
+		many = schema.many
+
+		def raw(obj):
+			if many:
+				return [one(each) for each in obj]
+			return one(obj)
+
+	def dump(obj):
+		if current_budget() is not None or (schema.many and obj is None):
+			return schema.dump(obj).data
+		try:
+			return raw(obj)
+		except ValidationError:
+			return schema.dump(obj).data
+
+	dumpers = (dump, raw)
+	setattr(schema, _DUMPER_ATTR, dumpers)
+	return dumpers
+
+
+def _raw(schema):
+	return _bind(schema)[1]
+
+
+def _nested(schema, obj):
+	raw = _raw(schema)
+	memo = current_memo()
+	if memo is None:
+		return raw(obj)
+	return memo.dump(schema, obj, lambda: raw(obj), nested=True)
+
+
+def compile_dumper(schema):
+	"""
+	Returns the generated dump function of a bound schema instance
+
+	# Arguments:
+		schema (Schema): schema instance (with its only, exclude, many and context)
+
+	# Returns:
+		function: takes an obj and returns the same data as schema.dump(obj).data
+	"""
+	return _bind(schema)[0]
+
+
+# fields whose dumped value is the value itself when the data is already plain json-like types
+_PLAIN_FIELDS = (fields.String, fields.Integer, fields.Float, fields.Boolean, fields.Raw, fields.Email, fields.Url,
+                 fields.Dict, fields.List)
+
+
+def _is_plain(obj, many):
+	if many:
+		return isinstance(obj, list) and all(type(each) is dict for each in obj)
+	return type(obj) is dict
+
+
+def dump_plain(schema, obj):
+	"""
+	Dumps dicts that already hold serialized values (ex. json) without marshmallow's per-field work.  Values
+	of simple fields (strings, numbers, booleans, lists and dicts) are used as is, only TemplateString, Nested
+	and type converting fields (ex. Decimal, DateTime) are serialized.  Schemas a generated dumper can't
+	stand in for (ex. with pre_dump/post_dump processors, a prefix or extra) are dumped by marshmallow.
+
+	# Arguments:
+		schema (Schema): schema instance
+		obj (dict|list): a dict, or a list of dicts if the schema is many
+
+	# Returns:
+		dict|list: the dumped data
+	"""
+	if not _compilable(schema):
+		return schema.dump(obj).data
+	if schema.many:
+		return [_dump_plain_one(schema, each) for each in obj]
+	return _dump_plain_one(schema, obj)
+
+
+def _dump_plain_one(schema, obj):
+	out = {}
+	get_attribute = schema.get_attribute
+	for name, field in schema.fields.items():
+		if field.load_only:
+			continue
+		key = field.dump_to or name
+
+		if not field._CHECK_ATTRIBUTE or type(field).get_value.__func__ is not fields.Field.get_value.__func__:
+			value = field.serialize(name, obj, accessor=get_attribute)
+		else:
+			attribute = name if field.attribute is None else field.attribute
+			value = obj[attribute] if attribute in obj else get_value(attribute, obj, missing)
+			if value is missing:
+				value = field.default() if callable(field.default) else field.default
+			elif isinstance(field, fields.Nested) and not isinstance(field.only, basestring):
+				value = None if value is None else _dump_nested(field.schema, value)
+			elif type(field) not in _PLAIN_FIELDS:
+				value = field._serialize(value, name, obj)
+
+		if value is not missing:
+			out[key] = value
+	return out
+
+
+def _dump_nested(schema, obj):
+	memo = current_memo()
+	if memo is None:
+		return _dump_budgeted(schema, obj)
+	return memo.dump(schema, obj, lambda: _dump_budgeted(schema, obj), nested=True)
+
+
+def _dump_budgeted(schema, obj):
+	budget = current_budget()
+	if budget is None:
+		return _dump(schema, obj)
+	with budget.nested():
+		return _dump(schema, obj)
+
+
+def dump(schema, obj):
+	"""
+	Dumps obj for rendering.  Plain dicts are dumped by `dump_plain` when the render context's 'plain' is
+	True, or it is None and the schema's Meta has plain_dicts = True.  Otherwise a generated dumper is used
+	when the context enables 'compiled_dumps'.  Within a render, dumps go through its DumpMemo.
+
+	# Arguments:
+		schema (Schema): schema instance
+		obj (object): the unserialized obj
+
+	# Returns:
+		dict|list: the dumped data
+	"""
+	memo = current_memo()
+	if memo is None:
+		return _dump(schema, obj)
+	return memo.dump(schema, obj, lambda: _dump(schema, obj))
+
+
+def _dump(schema, obj):
+	context = schema.context
+	plain = context.get('plain')
+	if plain is None:
+		plain = getattr(schema.opts, 'plain_dicts', False)
+	if plain and _is_plain(obj, schema.many):
+		return dump_plain(schema, obj)
+
+	if context.get('compiled_dumps'):
+		return compile_dumper(schema)(obj)
+	return schema.dump(obj).data
@@ -0,0 +1,152 @@
+import threading
+import time
+from contextlib import contextmanager
+from jinja2 import contextfilter
+
+
+class RenderLimitExceeded(Exception):
+	"""
+	Raised when a render goes over one of its RenderLimits
+
+	# Attributes:
+		limit (str): name of the exceeded limit (ex. 'max_time')
+		value (int|float): the configured value of the limit
+	"""
+
+	def __init__(self, limit, value):
+		super(RenderLimitExceeded, self).__init__('render exceeded %s of %s' % (limit, value))
+		self.limit = limit
+		self.value = value
+
+
+class RenderLimits(object):
+	"""
+	Per-render limits that abort the render with a RenderLimitExceeded.  Every limit is optional.
+
+	Time and output size are checked between output chunks, between loop iterations and at each Nested dump,
+	so a single expression can run past them.  The sandbox does check `*` and `**` up front, so that
+	ex. `{{ 'x' * 50000000 }}` fails before the string is built.
+
+	# Arguments:
+		max_time (float): seconds of wall time, including dumping the data
+		max_output_bytes (int): size of the rendered output, utf-8 encoded
+		max_loop_iterations (int): iterations of all jinja for loops combined, including those of TemplateStrings
+		max_depth (int): depth of Nested dumps and TemplateString renders within each other
+
+	# Example:
+		smores = Smores(limits=RenderLimits(max_time=0.5, max_output_bytes=1024 * 1024))
+	"""
+
+	def __init__(self, max_time=None, max_output_bytes=None, max_loop_iterations=None, max_depth=None):
+		self.max_time = max_time
+		self.max_output_bytes = max_output_bytes
+		self.max_loop_iterations = max_loop_iterations
+		self.max_depth = max_depth
+
+
+class RenderBudget(object):
+	"""
+	Tracks the usage of one render against its RenderLimits
+
+	# Arguments:
+		limits (RenderLimits): the limits of the render
+	"""
+
+	def __init__(self, limits):
+		self.limits = limits
+		self.deadline = time.time() + limits.max_time if limits.max_time is not None else None
+		self.output_bytes = 0
+		self.loop_iterations = 0
+		self.depth = 0
+
+	def check_time(self):
+		if self.deadline is not None and time.time() > self.deadline:
+			raise RenderLimitExceeded('max_time', self.limits.max_time)
+
+	def loop(self, iterable):
+		"""Yields the items of a jinja for loop, counting each iteration"""
+		max_loop_iterations = self.limits.max_loop_iterations
+		for item in iterable:
+			self.loop_iterations += 1
+			if max_loop_iterations is not None and self.loop_iterations > max_loop_iterations:
+				raise RenderLimitExceeded('max_loop_iterations', max_loop_iterations)
+			self.check_time()
+			yield item
+
+	def check_depth(self, depth=0):
+		"""Raises if depth levels below the current depth would go over max_depth"""
+		if self.limits.max_depth is not None and self.depth + depth > self.limits.max_depth:
+			raise RenderLimitExceeded('max_depth', self.limits.max_depth)
+
+	def check_binop(self, operator, left, right):
+		"""Raises if a sequence repetition or a power would build a value larger than max_output_bytes"""
+		max_output_bytes = self.limits.max_output_bytes
+		if max_output_bytes is None:
+			return
+		if operator == '*':
+			if isinstance(left, (int, long)) and hasattr(right, '__len__'):
+				left, right = right, left
+			if hasattr(left, '__len__') and isinstance(right, (int, long)) and len(left) * right > max_output_bytes:
+				raise RenderLimitExceeded('max_output_bytes', max_output_bytes)
+		elif operator == '**':
+			if isinstance(left, (int, long)) and isinstance(right, (int, long)) and right > 0 and \
+					abs(left) > 1 and abs(left).bit_length() * right > 8 * max_output_bytes:
+				raise RenderLimitExceeded('max_output_bytes', max_output_bytes)
+
+	@contextmanager
+	def nested(self):
+		"""Context manager around a Nested dump or TemplateString render"""
+		self.depth += 1
+		try:
+			self.check_depth()
+			self.check_time()
+			yield
+		finally:
+			self.depth -= 1
+
+	def render(self, template, context):
+		"""Renders template chunk by chunk, enforcing the output and time limits as it goes"""
+		max_output_bytes = self.limits.max_output_bytes
+		chunks = []
+		for chunk in template.generate(**context):
+			if max_output_bytes is not None:
+				self.output_bytes += len(chunk.encode('utf-8'))
+				if self.output_bytes > max_output_bytes:
+					raise RenderLimitExceeded('max_output_bytes', max_output_bytes)
+			self.check_time()
+			chunks.append(chunk)
+		return u''.join(chunks)
+
+
+_local = threading.local()
+
+
+def current_budget():
+	"""
+	# Returns:
+		RenderBudget|None: the budget of the render in progress on this thread
+	"""
+	return getattr(_local, 'budget', None)
+
+
+@contextmanager
+def budget_scope(budget):
+	"""Makes budget the current budget of this thread for the duration of a render"""
+	previous = current_budget()
+	_local.budget = budget
+	try:
+		yield budget
+	finally:
+		_local.budget = previous
+
+
+@contextfilter
+def limit_loop(context, iterable):
+	"""
+	Jinja filter wrapped around the iterable of every for loop, counts iterations against the current budget.
+	It's a context filter so that jinja never evaluates it at compile time.
+	"""
+	budget = current_budget()
+	if budget is None:
+		return iterable
+	return budget.loop(iterable)
@@ -0,0 +1,94 @@
+import threading
+from contextlib import contextmanager
+
+
+class DumpMemo(object):
+	"""
+	Remembers the dumps of one render, keyed by the identity of the dumped object and the schema class and
+	projection (only, exclude, many) it's dumped with, so an object reachable through several paths (ex. a
+	shared Company, or the re-dump of an object for its TemplateString fields) is dumped once.
+
+	It also guards nested dumps: an object reached again while its own dump is in progress (cyclic data) and
+	Nested dumps deeper than max_depth are dumped as None instead of recursing.
+
+	# Arguments:
+		memoize (bool): reuse dumps, when False only the cycle and depth guards apply
+		max_depth (int): levels of Nested dumps below a root, None for no limit
+	"""
+
+	def __init__(self, memoize=True, max_depth=None):
+		self.memoize = memoize
+		self.max_depth = max_depth
+		self.depth = 0
+		self.hits = 0
+		self._dumps = {}
+		self._active = set()
+
+	def dump(self, schema, obj, dump, nested=False):
+		"""
+		Returns the memoized dump of obj through schema, calling dump() on a miss
+
+		# Arguments:
+			schema (Schema): bound schema instance obj is dumped with
+			obj (object): the unserialized obj
+			dump (function): returns the dump of obj
+			nested (bool): whether this is the dump of a Nested field, one level below its parent
+
+		# Returns:
+			dict|list|None: the dump, None for a cycle or a dump below max_depth
+		"""
+		if nested and self.max_depth is not None and self.depth >= self.max_depth:
+			return None
+
+		key = (id(obj), schema.__class__, _projection(schema))
+		if key in self._active:
+			return None
+		if self.memoize:
+			entry = self._dumps.get(key)
+			if entry is not None:
+				self.hits += 1
+				return entry[1]
+
+		self._active.add(key)
+		if nested:
+			self.depth += 1
+		try:
+			data = dump()
+		finally:
+			self._active.discard(key)
+			if nested:
+				self.depth -= 1
+
+		if self.memoize:
+			# holding obj keeps its id from being reused by another object during the render
+			self._dumps[key] = (obj, data)
+		return data
+
+
+def _projection(schema):
+	only = schema.only
+	if only is not None and not isinstance(only, frozenset):
+		only = frozenset([only] if isinstance(only, basestring) else only)
+	return only, frozenset(schema.exclude or ()), bool(schema.many)
+
+
+_local = threading.local()
+
+
+def current_memo():
+	"""
+	# Returns:
+		DumpMemo|None: the memo of the render in progress on this thread
+	"""
+	return getattr(_local, 'memo', None)
+
+
+@contextmanager
+def memo_scope(memo):
+	"""Makes memo the current memo of this thread for the duration of a render"""
+	previous = current_memo()
+	_local.memo = memo
+	try:
+		yield memo
+	finally:
+		_local.memo = previous
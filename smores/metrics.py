@@ -0,0 +1,160 @@
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+
+class Metrics(object):
+	"""
+	A process-wide registry of counters and histograms, updated by Smores while it renders, autocompletes
+	and lists tags.  Series are identified by a metric name and a dict of labels.  Updates only hold a lock
+	for the few operations of the increment itself.
+
+	# Arguments:
+		buckets (tuple): upper bounds in seconds of the histogram buckets
+
+	# Example:
+		metrics = Metrics()
+		smores = Smores(metrics=metrics)
+		...
+		# ex. in an http handler
+		return to_prometheus(metrics.snapshot())
+	"""
+
+	def __init__(self, buckets=DEFAULT_BUCKETS):
+		self.buckets = tuple(sorted(buckets))
+		self._counters = {}
+		self._histograms = {}
+		self._lock = threading.Lock()
+
+	def inc(self, name, labels=None, value=1):
+		"""
+		Increments a counter
+
+		# Arguments:
+			name (str): metric name (ex. 'smores_renders_total')
+			labels (dict): labels of the series
+			value (int|float): amount to add
+		"""
+		key = (name, _label_key(labels))
+		with self._lock:
+			self._counters[key] = self._counters.get(key, 0) + value
+
+	def observe(self, name, value, labels=None):
+		"""
+		Records a value (ex. a duration in seconds) in a histogram
+
+		# Arguments:
+			name (str): metric name (ex. 'smores_render_seconds')
+			value (float): observed value
+			labels (dict): labels of the series
+		"""
+		key = (name, _label_key(labels))
+		# index of the first bucket the value fits in, len(buckets) for +Inf
+		index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+		with self._lock:
+			histogram = self._histograms.get(key)
+			if histogram is None:
+				histogram = self._histograms[key] = [0, 0.0, [0] * (len(self.buckets) + 1)]
+			histogram[0] += 1
+			histogram[1] += value
+			histogram[2][index] += 1
+
+	@contextmanager
+	def timer(self, name, labels=None):
+		"""Context manager observing the seconds spent within it in a histogram"""
+		started = time.time()
+		try:
+			yield
+		finally:
+			self.observe(name, time.time() - started, labels)
+
+	def snapshot(self):
+		"""
+		# Returns:
+			dict: {'counters': {name: {labels: value}},
+			       'histograms': {name: {labels: {'count': int, 'sum': float, 'buckets': [(bound, cumulative count)]}}}}
+			labels are tuples of sorted (label, value) pairs
+		"""
+		with self._lock:
+			counters = list(self._counters.items())
+			histograms = [(key, (count, total, list(buckets))) for key, (count, total, buckets) in self._histograms.items()]
+
+		snapshot = dict(counters={}, histograms={})
+		for (name, labels), value in counters:
+			snapshot['counters'].setdefault(name, {})[labels] = value
+
+		bounds = self.buckets + (float('inf'),)
+		for (name, labels), (count, total, buckets) in histograms:
+			cumulative = []
+			running = 0
+			for bound, bucket in zip(bounds, buckets):
+				running += bucket
+				cumulative.append((bound, running))
+			snapshot['histograms'].setdefault(name, {})[labels] = dict(count=count, sum=total, buckets=cumulative)
+		return snapshot
+
+	def reset(self):
+		"""Drops every series"""
+		with self._lock:
+			self._counters.clear()
+			self._histograms.clear()
+
+
+def _label_key(labels):
+	return tuple(sorted(labels.items())) if labels else ()
+
+
+@contextmanager
+def timed(metrics, name, labels=None):
+	"""Like Metrics.timer, but does nothing when metrics is None"""
+	if metrics is None:
+		yield
+	else:
+		with metrics.timer(name, labels):
+			yield
+
+
+def _format_labels(labels, extra=()):
+	labels = tuple(labels) + tuple(extra)
+	if not labels:
+		return ''
+	escape = lambda v: unicode(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+	return '{' + ','.join('%s="%s"' % (k, escape(v)) for k, v in labels) + '}'
+
+
+def _format_value(value):
+	if value == float('inf'):
+		return '+Inf'
+	return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def to_prometheus(snapshot):
+	"""
+	Formats a snapshot in the Prometheus text exposition format
+
+	# Arguments:
+		snapshot (dict|Metrics): result of Metrics.snapshot, or a Metrics to snapshot
+
+	# Returns:
+		str: text to serve with content type 'text/plain; version=0.0.4'
+	"""
+	if isinstance(snapshot, Metrics):
+		snapshot = snapshot.snapshot()
+
+	lines = []
+	for name, series in sorted(snapshot['counters'].items()):
+		lines.append('# TYPE %s counter' % name)
+		for labels, value in sorted(series.items()):
+			lines.append('%s%s %s' % (name, _format_labels(labels), _format_value(value)))
+
+	for name, series in sorted(snapshot['histograms'].items()):
+		lines.append('# TYPE %s histogram' % name)
+		for labels, histogram in sorted(series.items()):
+			for bound, count in histogram['buckets']:
+				lines.append('%s_bucket%s %s' % (name, _format_labels(labels, [('le', _format_value(bound))]), count))
+			lines.append('%s_sum%s %s' % (name, _format_labels(labels), _format_value(histogram['sum'])))
+			lines.append('%s_count%s %s' % (name, _format_labels(labels), histogram['count']))
+
+	return '\n'.join(lines) + '\n'
@@ -0,0 +1,167 @@
+import gc
+import threading
+from contextlib import contextmanager
+from timeit import default_timer
+from jinja2 import contextfilter
+
+
+class RenderProfile(object):
+	"""
+	Attributes the cost of renders to each tag of the template, each TemplateString field rendered (nested
+	ones included, ex. the Dog._default_template of every dog behind `{user.dogs}`) and each root dumped up
+	front.  Render with lazy=True to have the dumps of the fields counted in the tags that use them.
+
+	Allocations are the net number of objects the garbage collector tracks (dicts, lists, instances...)
+	created while a tag or field was rendered; the collector is disabled during profiled renders so the
+	count isn't reset, and allocations of other threads running at the same time are counted too.  A
+	profile accumulates over the renders it's passed to, one render at a time.
+
+	# Example:
+		profile = RenderProfile()
+		smores.render(data, template_string, lazy=True, profile=profile)
+		if profile.seconds > 0.1:
+			log.warning('slow template\\n%s', profile.format(limit=10))
+	"""
+
+	def __init__(self):
+		self.seconds = 0.0
+		self._stats = {}
+		self._stack = []
+		self._active = {}
+
+	def start(self, kind, name):
+		"""Starts timing a tag ('tag'), TemplateString field ('field') or root dump ('dump') named name"""
+		key = (kind, name)
+		self._active[key] = self._active.get(key, 0) + 1
+		self._stack.append([key, default_timer(), gc.get_count()[0], 0.0])
+
+	def stop(self):
+		"""Stops timing the latest started tag, field or dump"""
+		key, started, allocations, children = self._stack.pop()
+		seconds = default_timer() - started
+		allocations = gc.get_count()[0] - allocations
+		self._active[key] -= 1
+
+		stats = self._stats.get(key)
+		if stats is None:
+			stats = self._stats[key] = [0, 0.0, 0.0, 0]
+		stats[0] += 1
+		stats[2] += seconds - children
+		# a field rendered within itself (ex. a chain of dogs) is already counted by its outermost render
+		if not self._active[key]:
+			stats[1] += seconds
+			stats[3] += allocations
+		if self._stack:
+			self._stack[-1][3] += seconds
+
+	@contextmanager
+	def frame(self, kind, name):
+		"""Context manager timing what runs within it as a tag, field or dump, see `start`"""
+		self.start(kind, name)
+		try:
+			yield
+		finally:
+			self.stop()
+
+	def report(self):
+		"""
+		# Returns:
+			list: a dict per tag, field and dump, costliest first: {'kind': 'tag'|'field'|'dump', 'name': str,
+				'calls': int, 'seconds': float, 'self_seconds': float, 'allocations': int}.  seconds includes the
+				fields and dumps within, self_seconds doesn't.
+		"""
+		rows = [dict(kind=kind, name=name, calls=calls, seconds=seconds, self_seconds=self_seconds,
+		             allocations=allocations)
+		        for (kind, name), (calls, seconds, self_seconds, allocations) in self._stats.items()]
+		return sorted(rows, key=lambda row: (-row['seconds'], row['kind'], row['name']))
+
+	def format(self, limit=None):
+		"""
+		# Arguments:
+			limit (int): number of rows, the costliest, None for all
+
+		# Returns:
+			str: the report as a text table, ex. for a log message
+		"""
+		lines = ['%-6s %-40s %7s %10s %10s %8s' % ('kind', 'name', 'calls', 'total ms', 'self ms', 'allocs')]
+		for row in self.report()[:limit]:
+			lines.append('%-6s %-40s %7d %10.3f %10.3f %8d' % (
+				row['kind'], row['name'], row['calls'], row['seconds'] * 1000, row['self_seconds'] * 1000,
+				row['allocations']))
+		return '\n'.join(lines)
+
+	def reset(self):
+		"""Drops the stats of previous renders"""
+		self.seconds = 0.0
+		self._stats.clear()
+
+
+_local = threading.local()
+
+
+def current_profile():
+	"""
+	# Returns:
+		RenderProfile|None: the profile of the render in progress on this thread
+	"""
+	return getattr(_local, 'profile', None)
+
+
+@contextmanager
+def profile_scope(profile):
+	"""Makes profile the current profile of this thread for the duration of a render, timing the whole render"""
+	previous = current_profile()
+	_local.profile = profile
+	if profile is None:
+		try:
+			yield profile
+		finally:
+			_local.profile = previous
+		return
+
+	gc_enabled = gc.isenabled()
+	gc.disable()
+	started = default_timer()
+	try:
+		yield profile
+	finally:
+		profile.seconds += default_timer() - started
+		# frames left open by an exception
+		del profile._stack[:]
+		profile._active.clear()
+		_local.profile = previous
+		if gc_enabled:
+			gc.enable()
+
+
+@contextmanager
+def profiled(kind, name):
+	"""Like RenderProfile.frame on the current profile, but does nothing outside of profiled renders"""
+	profile = current_profile()
+	if profile is None:
+		yield
+	else:
+		with profile.frame(kind, name):
+			yield
+
+
+@contextfilter
+def profile_tag_start(context, name):
+	"""Jinja filter output before each tag of a profiled template, starts timing the tag"""
+	profile = current_profile()
+	if profile is not None:
+		profile.start('tag', name)
+	return u''
+
+
+@contextfilter
+def profile_tag_stop(context, value):
+	"""
+	Jinja filter wrapped around each tag of a profiled template, stops timing the tag once its value is
+	finalized (ex. the _default_template of a dumped dog rendered), so that's part of the tag's cost
+	"""
+	value = context.environment.finalize(value)
+	profile = current_profile()
+	if profile is not None:
+		profile.stop()
+	return value
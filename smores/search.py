@@ -0,0 +1,179 @@
+import bisect
+import heapq
+import re
+import threading
+
+# matches of a name against the query, in ranking order
+_EXACT, _PREFIX, _SUBSTRING, _FUZZY = range(4)
+
+# share of the query's grams a name needs for a fuzzy match
+_FUZZY_OVERLAP = 0.5
+
+_INDEX_RE = re.compile(r':\d+')
+
+
+def _grams(text):
+	"""Trigrams of text padded with ^ and $, so short texts and their edges get grams too"""
+	padded = '^' + text + '$'
+	return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+class TagIndex(object):
+	"""
+	Searches tag paths by the name of the field they end with (ex. 'lat' finds 'user.address.geo.lat').
+	The distinct names are indexed by trigram, which stays small however many paths share the names, and
+	each name keeps its paths sorted by depth, also grouped by the attr before the name for queries with
+	dots.  Paths are added and removed a root schema at a time, so a change to the registered schemas
+	only re-indexes the roots that changed.  Syncs and searches hold a lock, as the index is shared by the
+	threads of the Smores instance.
+
+	# Arguments:
+		smores (Smores): instance whose tags are indexed
+	"""
+
+	def __init__(self, smores):
+		self.smores = smores
+		self.version = None
+		self._roots = {}
+		self._paths = {}
+		self._parents = {}
+		self._grams = {}
+		self._name_grams = {}
+		self._lock = threading.Lock()
+
+	def sync(self):
+		"""Indexes the tags of root schemas registered since the last sync and drops those of removed ones"""
+		with self._lock:
+			self._sync()
+
+	def _sync(self):
+		smores = self.smores
+		# read the version first, schemas changing during the sync leave it outdated for the next one
+		version = smores._schemas_version
+		if self.version == version:
+			return
+		schemas = set(smores.schemas)
+		for schema in [s for s in self._roots if s not in schemas]:
+			for path in self._roots.pop(schema):
+				self._remove(path)
+		for schema in schemas:
+			if schema not in self._roots:
+				paths = self._roots[schema] = smores.get_tags(only=[schema.__name__])
+				for path in paths:
+					self._add(path)
+		self.version = version
+
+	@staticmethod
+	def _attrs(path):
+		"""The attrs of a path without list indexes, ex. ['user', 'dogs', 'name'] for user.dogs:1.name"""
+		return _INDEX_RE.sub('', path).split('.')
+
+	def _add(self, path):
+		attrs = self._attrs(path)
+		name, parent = attrs[-1], attrs[-2] if len(attrs) > 1 else ''
+		paths = self._paths.get(name)
+		if paths is None:
+			paths = self._paths[name] = []
+			self._parents[name] = {}
+			grams = self._name_grams[name] = _grams(name)
+			for gram in grams:
+				self._grams.setdefault(gram, set()).add(name)
+		entry = (len(attrs), path)
+		bisect.insort(paths, entry)
+		bisect.insort(self._parents[name].setdefault(parent, []), entry)
+
+	def _remove(self, path):
+		attrs = self._attrs(path)
+		name, parent = attrs[-1], attrs[-2] if len(attrs) > 1 else ''
+		entry = (len(attrs), path)
+		paths = self._paths[name]
+		paths.remove(entry)
+		siblings = self._parents[name][parent]
+		siblings.remove(entry)
+		if not siblings:
+			del self._parents[name][parent]
+		if not paths:
+			del self._paths[name]
+			del self._parents[name]
+			for gram in self._name_grams.pop(name):
+				names = self._grams[gram]
+				names.discard(name)
+				if not names:
+					del self._grams[gram]
+
+	def _match(self, name, query, query_grams):
+		"""(match kind, closeness) of name to the query, None if it doesn't match"""
+		if name == query:
+			return _EXACT, 0
+		if name.startswith(query):
+			return _PREFIX, len(name)
+		if query in name:
+			return _SUBSTRING, len(name)
+		overlap = len(query_grams & self._name_grams[name]) / float(len(query_grams))
+		if overlap >= _FUZZY_OVERLAP:
+			return _FUZZY, -overlap
+		return None
+
+	def _name_paths(self, name, query_attrs):
+		"""The paths ending with name, in depth order, whose attrs before name contain the query's"""
+		if len(query_attrs) == 1:
+			return self._paths[name]
+
+		parent_query, before = query_attrs[-2], query_attrs[:-2]
+		groups = [paths for parent, paths in self._parents[name].items() if parent_query in parent]
+		if not before:
+			return heapq.merge(*groups)
+
+		def matches(path):
+			attrs = self._attrs(path)[:-2]
+			return len(attrs) >= len(before) and \
+				all(q in a for q, a in zip(reversed(before), reversed(attrs)))
+		return (entry for entry in heapq.merge(*groups) if matches(entry[1]))
+
+	def search(self, query, limit=10, roots=None):
+		"""
+		Returns the tags best matching query.  Each attr before the name in a query with dots (ex. 'geo.lat')
+		has to be part of the attr at the same position from the end of the path.
+
+		# Arguments:
+			query (str): part of a field name or of a tag path, case insensitive
+			limit (int): maximum number of tags returned
+			roots (set): only return tags of these root names
+
+		# Returns:
+			list: tags, exact name matches first, then prefixes, substrings and fuzzy matches, shallow paths first
+		"""
+		query_attrs = self._attrs(query.strip().lower())
+		query = query_attrs[-1]
+		if not query:
+			return []
+
+		with self._lock:
+			self._sync()
+			return self._search(query, query_attrs, limit, roots)
+
+	def _search(self, query, query_attrs, limit, roots):
+		query_grams = _grams(query)
+		if len(query) < 3:
+			# too short for trigrams to narrow the names down
+			candidates = self._paths
+		else:
+			candidates = set()
+			for gram in query_grams:
+				candidates.update(self._grams.get(gram, ()))
+
+		ranked = []
+		for name in candidates:
+			match = self._match(name, query, query_grams)
+			if match is not None:
+				ranked.append((match, name))
+
+		results = []
+		for _, name in sorted(ranked):
+			for _, path in self._name_paths(name, query_attrs):
+				if roots is not None and path.partition('.')[0] not in roots:
+					continue
+				results.append(path)
+				if len(results) >= limit:
+					return results
+		return results
@@ -1,18 +1,156 @@
 from marshmallow import fields
-from marshmallow.schema import SchemaMeta, BaseSchema
+from marshmallow.schema import SchemaMeta, BaseSchema, SchemaOpts as BaseSchemaOpts
 from marshmallow.base import SchemaABC
 from marshmallow.compat import with_metaclass
+from marshmallow.utils import missing
 from .utils import get_module_schemas
+from .cache import LRUCache, fingerprint
+from .metrics import timed
+from .dumpers import dump, compile_dumper
 from parser import to_jinja_template, ATTR, delimitedList, de_bracketize
-from jinja2 import Environment
+from jinja2 import nodes, meta, Undefined
+from jinja2.sandbox import SandboxedEnvironment
+from .limits import RenderBudget, RenderLimitExceeded, budget_scope, current_budget, limit_loop
+from .memo import DumpMemo, memo_scope, current_memo
+from .profile import current_profile, profile_scope, profiled, profile_tag_start, profile_tag_stop
+from .search import TagIndex
+from .snapshot import fold_keys, from_bytes
 from collections import namedtuple
 from inspect import isfunction
 import class_registry
 from contextlib import contextmanager
+import gc
 import re
+import weakref
 
 AutocompleteResponse = namedtuple('AutocompleteResponse', ('tagStatus', 'options', 'validFragment'))
 
+# a tag of a template that doesn't resolve against the registered schemas, see Smores.validate
+UnknownTag = namedtuple('UnknownTag', ('tag', 'start', 'end', 'validFragment'))
+
+# state of an autocomplete walk after some attrs of a fragment, node is the SchemaInfo reached (if any)
+# see Smores._autocomplete_step
+_AutocompleteState = namedtuple('_AutocompleteState',
+                                ('node', 'output', 'valid_fragment', 'attr', 'valid', 'done', 'response'))
+
+# an attr as matched by parser.ATTR, a field name optionally followed by a list index
+_SEGMENT_RE = re.compile(r'([a-zA-Z0-9_]+)(?::([0-9]+))?')
+
+# a tag as matched by parser.BASE_TAG
+_TAG_RE = re.compile(r'\{ *([a-zA-Z0-9_]+(?::[0-9]+)?(?:\.[a-zA-Z0-9_]+(?::[0-9]+)?)*)\}')
+
+# the jinja statements, comments and expressions and the tags of an end-user template, see IncrementalRender
+_SEGMENT_TOKEN_RE = re.compile(r'(\{%.*?%\}|\{#.*?#\}|\{\{.*?\}\}|' + _TAG_RE.pattern + ')', re.DOTALL)
+_STATEMENT_RE = re.compile(r'\{%-?\s*(\w+)')
+_BLOCK_STATEMENTS = frozenset(['if', 'for', 'with', 'filter', 'call', 'raw', 'autoescape'])
+_WHITESPACE_CONTROL_RE = re.compile(r'\{[%{#]-|-[%}#]\}')
+
+# a tag as translated by parser.to_jinja_template, see _SimpleTemplate
+_JINJA_TAG_RE = re.compile(r"\{\{([a-z0-9_]+)((?:\.[a-z0-9_]+|\[-?[0-9]+\])*) \| default\('([^'\\]*)'\)\}\}")
+_JINJA_STEP_RE = re.compile(r'\.([a-z0-9_]+)|\[(-?[0-9]+)\]')
+_JINJA_SYNTAX_RE = re.compile(r'\{[{%#]')
+
+# the field name at the start of (the rest of) a tag path, see get_tags
+_TAG_ATTR_RE = re.compile(r'[a-zA-Z0-9_]*')
+
+
+class NestedInfo(namedtuple('NestedInfo', ('name', 'nested', 'many', 'only', 'exclude', 'is_self', 'is_smores_nested'))):
+	"""
+	Facts about a Nested field of a schema class, see SchemaInfo
+
+	# Attributes:
+		name (str): field name
+		nested (SchemaMeta|str): the schema class or registered name the field nests
+		many (bool): whether the field is a list
+		only (tuple|None): only option of the field
+		exclude (tuple): exclude option of the field
+		is_self (bool): whether the field nests its own schema ('self')
+		is_smores_nested (bool): whether the field is a smores Nested rather than a marshmallow one
+	"""
+
+
+class SchemaInfo(namedtuple('SchemaInfo', ('schema_ref', 'name', 'is_smores', 'field_names', 'fields', 'dump_keys',
+                                           'nested', 'template_fields'))):
+	"""
+	Immutable facts about a schema class, computed once by `get_schema_info` and shared by autocomplete,
+	get_tags, rendering and SchemaProxy so that none of them need to instantiate schemas or re-scan fields.
+
+	# Attributes:
+		schema (SchemaMeta): the schema class, weakly referenced so infos don't keep dynamic schemas alive
+		name (str): lowercased class name
+		is_smores (bool): whether the class is a smores Schema
+		field_names (tuple): lowercased declared field names
+		fields (dict): lowercased field name -> declared field name
+		dump_keys (dict): lowercased key in dumped data -> declared field name
+		nested (dict): declared field name -> NestedInfo for Nested fields
+		template_fields (frozenset): declared names of TemplateString/TemplateFile fields
+	"""
+
+	@property
+	def schema(self):
+		return self.schema_ref()
+
+	def nested_info(self, field_name):
+		"""
+		# Returns:
+			SchemaInfo: info of the schema nested by field_name
+		"""
+		return get_schema_info(_nested_schema_class(self.nested[field_name], self.schema))
+
+
+# schema class -> SchemaInfo, dropped when a schema its Nested fields name is (re-)registered
+_schema_infos = weakref.WeakKeyDictionary()
+
+
+def _invalidate_schema_infos(classname):
+	"""Drops the infos of schemas with a Nested field referring to classname by name, which may now resolve differently"""
+	for schema, info in list(_schema_infos.items()):
+		for nested in info.nested.values():
+			if isinstance(nested.nested, basestring) and \
+					(nested.nested == classname or nested.nested.endswith('.' + classname)):
+				_schema_infos.pop(schema, None)
+				break
+
+
+def get_schema_info(schema):
+	"""
+	Returns the cached SchemaInfo of a schema class
+
+	# Arguments:
+		schema (SchemaMeta|Schema): schema class or instance
+
+	# Returns:
+		SchemaInfo: facts about the schema's declared fields
+	"""
+	if not isinstance(schema, type):
+		schema = schema.__class__
+
+	try:
+		return _schema_infos[schema]
+	except KeyError:
+		pass
+
+	declared_fields = schema._declared_fields
+	nested = {}
+	for name, field in declared_fields.items():
+		if isinstance(field, fields.Nested):
+			only = (field.only,) if isinstance(field.only, basestring) else field.only
+			nested[name] = NestedInfo(name, field.nested, field.many, only, field.exclude,
+			                          field.nested == _RECURSIVE_NESTED, isinstance(field, Nested))
+
+	info = SchemaInfo(
+		schema_ref=weakref.ref(schema),
+		name=schema.__name__.lower(),
+		is_smores=issubclass(schema, Schema),
+		field_names=tuple(name.lower() for name in declared_fields),
+		fields=dict((name.lower(), name) for name in declared_fields),
+		dump_keys=dict(((field.dump_to or name).lower(), name) for name, field in declared_fields.items()),
+		nested=nested,
+		template_fields=frozenset(name for name, field in declared_fields.items() if isinstance(field, TemplateString)),
+	)
+	_schema_infos[schema] = info
+	return info
+
 
 class TemplateString(fields.Field):
 	"""
@@ -22,16 +160,19 @@ class TemplateString(fields.Field):
 		template_string (string): a jinja template
 		env (Environment): jinja environment
 		use_parser (bool): flag for whether to use the smores parser
+		cache_key (function): returns a key (ex. id and version) identifying obj in the fragment cache,
+			the identity of obj is used if omitted
 	"""
 	_CHECK_ATTRIBUTE = False
 
-	def __init__(self, template_string, use_parser=False, *args, **kwargs):
+	def __init__(self, template_string, use_parser=False, cache_key=None, *args, **kwargs):
 		super(TemplateString, self).__init__(*args, **kwargs)
 
 		# the template string to be rendered
 		if use_parser:
 			template_string = to_jinja_template(template_string)
 		self.template_string = template_string
+		self.cache_key = cache_key
 
 		# TemplateStrings do not get 'loaded' by marshmallow
 		self.dump_only = True
@@ -42,21 +183,95 @@ class TemplateString(fields.Field):
 		:param obj: the unserialized obj
 		:return: rendered template text
 		"""
+		return self._fetch(obj, lambda: self._render(obj))
+
+	def _render(self, obj):
 		# get schema class
 		schema = self.root.__class__
 
 		# get names of all TemplateString/TemplateFile fields for the schema
-		template_fields = [k for k, v in self.root.declared_fields.items() if isinstance(v, TemplateString)]
+		template_fields = get_schema_info(schema).template_fields
 
 		# serialize remaining fields of schema for template context
-		context = schema(exclude=template_fields, context=self.context).dump(obj).data  # TODO - cache this
+		context = dump(schema(exclude=template_fields, context=self.context), obj)
 
 		# return rendered template
 		env = self.context['env']
 
-		template = env.from_string(self.template_string)
+		template = env.from_field(self.template_string)
 		return template.render(**context)
 
+	def _render_lazy(self, proxy):
+		"""
+		Renders the template against a SchemaProxy so that only the fields the template
+		actually references get serialized.
+		:param proxy: SchemaProxy of the obj, hiding template fields
+		:return: rendered template text
+		"""
+		def render():
+			env = self.context['env']
+			template = env.from_field(self.template_string)
+			context = template.new_context(_ProxyContext(proxy, env.globals), shared=True)
+			return u''.join(template.root_render_func(context))
+
+		return self._fetch(proxy._obj, render)
+
+	def _fetch(self, obj, render):
+		"""Renders through the fragment cache when the render context has one"""
+		return self._fetch_fragment(self.root.__class__, self.name, obj, render, self.context, self.cache_key)
+
+	@classmethod
+	def _fetch_fragment(cls, schema_class, field_name, obj, render, context, cache_key=None):
+		"""
+		Renders the fragment of a TemplateString field within the render's budget, metrics and profile, through
+		the fragment cache when the render context has one
+
+		# Arguments:
+			schema_class (SchemaMeta): schema the field belongs to
+			field_name (str): name of the field
+			obj (object): the object the fragment is rendered for
+			render (function): renders the fragment
+			context (dict): the render context of the schema
+			cache_key (function): see TemplateString
+		"""
+		budget = current_budget()
+		if budget is not None:
+			render = cls._budgeted(budget, render)
+
+		metrics = context.get('metrics')
+		if metrics is not None:
+			render = cls._timed(metrics, '%s.%s' % (schema_class.__name__, field_name), render)
+
+		profile = current_profile()
+		if profile is not None:
+			render = cls._profiled(profile, '%s.%s' % (schema_class.__name__, field_name), render)
+
+		fragment_cache = context.get('fragment_cache')
+		if fragment_cache is None:
+			return render()
+		return fragment_cache.fetch(schema_class, field_name, obj, render, cache_key)
+
+	@staticmethod
+	def _budgeted(budget, render):
+		def wrapped():
+			with budget.nested():
+				return render()
+		return wrapped
+
+	@staticmethod
+	def _timed(metrics, field, render):
+		def wrapped():
+			with metrics.timer('smores_template_field_seconds', dict(field=field)):
+				return render()
+		return wrapped
+
+	@staticmethod
+	def _profiled(profile, field, render):
+		def wrapped():
+			with profile.frame('field', field):
+				return render()
+		return wrapped
+
 
 class TemplateFile(TemplateString):
 	"""
@@ -68,22 +283,498 @@ class TemplateFile(TemplateString):
 		use_parser (bool): flag for whether to use the smores parser
 	"""
 
-	def __init__(self, template_path, use_parser=False, *args, **kwargs):
+	def __init__(self, template_path, use_parser=False, cache_key=None, *args, **kwargs):
 		# grab the template file
 		with open(template_path, 'rb') as template_file:
 			template_string = template_file.read()
 		# pass it on to TemplateString
-		super(TemplateFile, self).__init__(template_string, use_parser=use_parser, *args, **kwargs)
+		super(TemplateFile, self).__init__(template_string, use_parser=use_parser, cache_key=cache_key, *args, **kwargs)
+
+
+class SchemaProxy(object):
+	"""
+	A read-only, case-insensitive mapping over an unserialized object that serializes each field
+	through its marshmallow field only when it is first accessed.  Nested fields resolve to further
+	proxies (or lists of proxies for many=True) and every result is memoized.
+
+	# Arguments:
+		schema (Schema): bound schema instance whose fields are exposed
+		obj (object): the unserialized obj (model instance or dict)
+		exclude (set): field names to hide from the mapping
+		depth (int): number of Nested fields between the root proxy and this one
+	"""
+
+	def __init__(self, schema, obj, exclude=None, depth=0):
+		self._schema = schema
+		self._info = get_schema_info(schema)
+		self._obj = obj
+		self._exclude = exclude or ()
+		self._depth = depth
+		self._cache = {}
+
+	def _serialize(self, name):
+		schema = self._schema
+		field = schema.fields[name]
+
+		if isinstance(field, TemplateString):
+			view = SchemaProxy(schema, self._obj, exclude=self._info.template_fields, depth=self._depth)
+			view._cache = self._cache
+			return field._render_lazy(view)
+
+		if isinstance(field, fields.Nested):
+			value = field.get_value(name, self._obj, accessor=schema.get_attribute)
+			# a string only makes marshmallow collapse the nested dump to that one value
+			if value is missing or value is None or field.schema._has_processors or isinstance(field.only, basestring):
+				return field.serialize(name, self._obj, accessor=schema.get_attribute)
+			# nested proxies are built without going through Nested._serialize, so count their depth here
+			depth = self._depth + 1
+			budget = current_budget()
+			if budget is not None:
+				budget.check_depth(depth)
+			if field.many:
+				return [SchemaProxy(field.schema, each, depth=depth) for each in value]
+			return SchemaProxy(field.schema, value, depth=depth)
+
+		return field.serialize(name, self._obj, accessor=schema.get_attribute)
+
+	def __getitem__(self, key):
+		name = self._info.dump_keys[key.lower()]
+		if name in self._exclude or name not in self._schema.fields:
+			raise KeyError(key)
+		try:
+			value = self._cache[name]
+		except KeyError:
+			value = self._cache[name] = self._serialize(name)
+		if value is missing:
+			raise KeyError(key)
+		return value
+
+	def get(self, key, default=None):
+		try:
+			return self[key]
+		except KeyError:
+			return default
+
+	def __contains__(self, key):
+		try:
+			self[key]
+		except (KeyError, AttributeError):
+			return False
+		return True
+
+	def keys(self):
+		return [k for k in self._info.dump_keys if k in self]
+
+	def items(self):
+		return [(k, self[k]) for k in self.keys()]
+
+	def __iter__(self):
+		return iter(self.keys())
+
+	def __len__(self):
+		return len(self.keys())
+
+	def __repr__(self):
+		return '<SchemaProxy %s: %r>' % (self._schema.__class__.__name__, self._obj)
+
+
+def _tag_name(root, steps, default=None):
+	"""The tag of a _SimpleTemplate chunk as end-users write it, ex. user.dogs:1.name"""
+	return root + ''.join(
+		(':%d' % (key + 1) if key >= 0 else '[%d]' % key) if is_index else '.' + key for is_index, key in steps)
+
+
+def _tag_path(node):
+	"""The tag of a jinja expression as end-users write it (ex. user.dogs:1.name), None if it isn't a tag"""
+	if isinstance(node, nodes.Filter) and node.name == 'default':
+		node = node.node
+	steps = []
+	while not isinstance(node, nodes.Name):
+		if isinstance(node, nodes.Getattr):
+			steps.append((False, node.attr))
+		elif isinstance(node, nodes.Getitem) and isinstance(node.arg, nodes.Const) and \
+				isinstance(node.arg.value, (int, long)):
+			steps.append((True, node.arg.value))
+		else:
+			return None
+		node = node.node
+	return _tag_name(node.name, reversed(steps))
+
+
+class _SimpleTemplate(object):
+	"""
+	A template made only of text and tags, rendered without jinja.  It resolves each tag the way the jinja
+	template would (the environment's getattr/getitem, the tag's default and the finalize function) and
+	supports the parts of the jinja Template interface Smores uses.
+
+	# Arguments:
+		env (SmoresEnvironment): the environment the template would otherwise be compiled by
+		chunks (list): literal text, or a (root, steps, default) tuple per tag where steps are (is_index, key)
+	"""
+
+	def __init__(self, env, chunks):
+		self.env = env
+		self.chunks = chunks
+
+	@classmethod
+	def from_jinja_source(cls, env, jinja_template):
+		"""
+		# Returns:
+			_SimpleTemplate|None: the template if jinja_template has no other jinja syntax than the tags
+		"""
+		# a tag stands in as '{}' so that syntax spanning it (ex. the '{' before a tag in '{{user}}') is found
+		if _JINJA_SYNTAX_RE.search(_JINJA_TAG_RE.sub('{}', jinja_template)):
+			return None
+
+		chunks = []
+		position = 0
+		for match in _JINJA_TAG_RE.finditer(jinja_template):
+			chunks.append(jinja_template[position:match.start()])
+			steps = tuple((bool(index), int(index) if index else name)
+			              for name, index in _JINJA_STEP_RE.findall(match.group(2)))
+			chunks.append((match.group(1), steps, match.group(3)))
+			position = match.end()
+		chunks.append(jinja_template[position:])
+
+		# jinja decodes the source as text and drops a single trailing newline
+		chunks = [unicode(chunk) if isinstance(chunk, basestring) else chunk for chunk in chunks]
+		if chunks[-1].endswith(u'\n'):
+			chunks[-1] = chunks[-1][:-1]
+		return cls(env, [chunk for chunk in chunks if chunk != u''])
+
+	def _resolve(self, context, root, steps, default):
+		env = self.env
+		value = context.get(root, env.globals.get(root, missing))
+		if value is missing:
+			value = env.undefined(name=root)
+		# like jinja, a step into an undefined value may raise, only the tag's value falls back to the default
+		for is_index, key in steps:
+			value = env.getitem(value, key) if is_index else env.getattr(value, key)
+		return default if isinstance(value, Undefined) else value
+
+	def generate(self, **context):
+		finalize = self.env.finalize
+		profile = current_profile()
+		for chunk in self.chunks:
+			if not isinstance(chunk, tuple):
+				yield chunk
+			elif profile is None:
+				yield unicode(finalize(self._resolve(context, *chunk)))
+			else:
+				with profile.frame('tag', _tag_name(*chunk)):
+					value = unicode(finalize(self._resolve(context, *chunk)))
+				yield value
+
+	def render(self, **context):
+		return u''.join(self.generate(**context))
+
+
+# kinds of the entries of a _ColumnNode
+_COLUMN, _NODE, _TEMPLATE = range(3)
 
 
-class SmoresEnvironment(Environment):
+class ColumnRow(object):
+	"""
+	A read-only, case-insensitive mapping over one row of column arrays, see Smores.render_columns.  Dotted
+	column names (ex. 'address.city') are exposed as nested rows, and TemplateString fields of the schema at
+	the row's path are rendered against the row.
+
+	# Arguments:
+		node (_ColumnNode): the resolved columns at this row's path
+		index (int): row index
+		templates (bool): whether TemplateString fields are exposed
+	"""
+	__slots__ = ('_node', '_index', '_templates', '_children')
+
+	def __init__(self, node, index, templates=True):
+		self._node = node
+		self._index = index
+		self._templates = templates
+		self._children = None
+
+	def __getitem__(self, key):
+		entries = self._node.entries
+		entry = entries.get(key)
+		if entry is None:
+			entry = entries.get(key.lower())
+			if entry is None:
+				raise KeyError(key)
+
+		kind, target = entry
+		if kind == _COLUMN:
+			return target[self._index]
+		if kind == _TEMPLATE:
+			if not self._templates:
+				raise KeyError(key)
+			return self._node.render_field(target, self)
+
+		# nested rows are made once per row
+		children = self._children
+		if children is None:
+			children = self._children = {}
+		row = children.get(target)
+		if row is None:
+			row = children[target] = ColumnRow(target, self._index)
+		return row
+
+	def get(self, key, default=None):
+		try:
+			return self[key]
+		except KeyError:
+			return default
+
+	def __contains__(self, key):
+		try:
+			self[key]
+		except KeyError:
+			return False
+		return True
+
+	def __repr__(self):
+		return '<ColumnRow %s%d>' % (self._node.prefix, self._index)
+
+
+class _ColumnNode(object):
+	"""
+	The columns below one path of a render_columns call (ex. 'address.'), resolved once: entries maps each
+	lowercased key to (_COLUMN, column), (_NODE, the nested _ColumnNode) or (_TEMPLATE, TemplateString field
+	name).  An exact column takes precedence over a TemplateString field, which takes precedence over a
+	nested path.
+
+	# Arguments:
+		info (SchemaInfo|None): info of the schema at this path
+		prefix (str): lowercased path of this node followed by '.', '' for the root
+		context (dict): render context of the TemplateString fields (env, fragment cache, metrics)
+	"""
+	__slots__ = ('info', 'prefix', 'context', 'entries')
+
+	def __init__(self, info, prefix, context):
+		self.info = info
+		self.prefix = prefix
+		self.context = context
+		self.entries = {}
+
+	def child(self, key):
+		"""The nested node at key, made on first use.  Below a key holding a column, it's left out of entries."""
+		entry = self.entries.get(key)
+		if entry is not None and entry[0] == _NODE:
+			return entry[1]
+		info = self.info
+		field_name = info.fields.get(key) if info is not None else None
+		nested_info = info.nested_info(field_name) if field_name is not None and field_name in info.nested else None
+		node = _ColumnNode(nested_info, self.prefix + key + '.', self.context)
+		if entry is None:
+			self.entries[key] = (_NODE, node)
+		return node
+
+	def add_templates(self):
+		"""Adds the TemplateString fields of the node's schema, and of its nested nodes'"""
+		for key, (kind, target) in self.entries.items():
+			if kind == _NODE:
+				target.add_templates()
+		if self.info is not None:
+			for field_name in self.info.template_fields:
+				key = field_name.lower()
+				if self.entries.get(key, (None,))[0] != _COLUMN:
+					self.entries[key] = (_TEMPLATE, field_name)
+
+	def render_field(self, field_name, row):
+		"""Renders a TemplateString field of the node's schema against the row, hiding the other templates"""
+		schema = self.info.schema
+		field = schema._declared_fields[field_name]
+		env = self.context['env']
+
+		def render():
+			template = env.from_field(field.template_string)
+			view = ColumnRow(self, row._index, templates=False)
+			context = template.new_context(_ProxyContext(view, env.globals), shared=True)
+			return u''.join(template.root_render_func(context))
+
+		return TemplateString._fetch_fragment(schema, field_name, row, render, self.context, field.cache_key)
+
+
+class _ColumnTable(object):
+	"""
+	The columns of a render_columns call, every column path resolved once into a tree of _ColumnNodes
+
+	# Arguments:
+		columns (dict): mapping of column path to a sequence of values
+		info (SchemaInfo|None): info of the root's schema
+		context (dict): render context of the TemplateString fields
+	"""
+
+	def __init__(self, columns, info, context):
+		self.root = _ColumnNode(info, '', context)
+		lengths = set()
+		for name, column in columns.items():
+			lengths.add(len(column))
+			attrs = name.lower().split('.')
+			node = self.root
+			for attr in attrs[:-1]:
+				node = node.child(attr)
+			# an exact column takes precedence over the columns below it
+			node.entries[attrs[-1]] = (_COLUMN, column)
+		self.root.add_templates()
+
+		if len(lengths) > 1:
+			raise ValueError('columns must all have the same length, got lengths %s' % sorted(lengths))
+		self.length = lengths.pop() if lengths else 0
+
+	def column(self, steps):
+		"""
+		# Arguments:
+			steps (tuple): (is_index, key) steps of a tag below the root, see _SimpleTemplate
+
+		# Returns:
+			sequence|None: the column the tag reads, None if it reads anything else
+		"""
+		node = self.root
+		for position, (is_index, key) in enumerate(steps):
+			entry = node.entries.get(key) if not is_index else None
+			if entry is None:
+				return None
+			kind, target = entry
+			if position == len(steps) - 1:
+				return target if kind == _COLUMN else None
+			if kind != _NODE:
+				return None
+			node = target
+		return None
+
+
+class _ColumnTemplate(object):
+	"""
+	A _SimpleTemplate rendered over a _ColumnTable, with each tag reading a column bound to the column before
+	the rows are rendered, other tags are resolved against the row as usual
+
+	# Arguments:
+		template (_SimpleTemplate): the template
+		table (_ColumnTable): the columns
+		root (str): name of the rows in the template
+	"""
+
+	def __init__(self, template, table, root):
+		self.template = template
+		self.root = root
+		self.chunks = []
+		for chunk in template.chunks:
+			column = table.column(chunk[1]) if isinstance(chunk, tuple) and chunk[0] == root else None
+			self.chunks.append((_COLUMN, column) if column is not None else chunk)
+
+	def generate(self, **context):
+		template = self.template
+		finalize = template.env.finalize
+		index = context[self.root]._index
+		for chunk in self.chunks:
+			if not isinstance(chunk, tuple):
+				yield chunk
+			elif chunk[0] == _COLUMN:
+				yield unicode(finalize(chunk[1][index]))
+			else:
+				yield unicode(finalize(template._resolve(context, *chunk)))
+
+	def render(self, **context):
+		return u''.join(self.generate(**context))
+
+
+class _ProxyContext(object):
+	"""Lets a jinja context resolve names from a SchemaProxy, falling back to the environment globals"""
+
+	def __init__(self, proxy, globals):
+		self.proxy = proxy
+		self.globals = globals
+
+	def __contains__(self, key):
+		return key in self.proxy or key in self.globals
+
+	def __getitem__(self, key):
+		try:
+			return self.proxy[key]
+		except KeyError:
+			return self.globals[key]
+
+
+class SmoresEnvironment(SandboxedEnvironment):
+	"""
+	Sandboxed jinja environment resolving attributes case-insensitively from dumped data.  The iterable
+	of every for loop is passed through a filter that counts iterations against the current RenderBudget,
+	and `*`/`**` are checked against it before they are evaluated.
+	"""
+	_LOOP_FILTER = 'smores_limit_loop'
+	_PROFILE_START_FILTER = 'smores_profile_tag_start'
+	_PROFILE_STOP_FILTER = 'smores_profile_tag_stop'
+	intercepted_binops = frozenset(['*', '**'])
+
+	def __init__(self, *args, **kwargs):
+		super(SmoresEnvironment, self).__init__(*args, **kwargs)
+		self.filters[self._LOOP_FILTER] = limit_loop
+		self.filters[self._PROFILE_START_FILTER] = profile_tag_start
+		self.filters[self._PROFILE_STOP_FILTER] = profile_tag_stop
+		# template_string of TemplateString fields -> compiled template, see from_field
+		self.field_templates = LRUCache(max_entries=1024)
+
+	def from_field(self, template_string):
+		"""
+		Returns the compiled template of a TemplateString field's template_string, compiling each source once
+		per environment rather than at every render of the field
+		"""
+		template = self.field_templates.get(template_string)
+		if template is None:
+			template = self.from_string(template_string)
+			self.field_templates.set(template_string, template)
+		return template
+
+	def compile(self, source, name=None, filename=None, raw=False, defer_init=False):
+		if isinstance(source, basestring):
+			source = self._limit_loops(self.parse(source, name, filename))
+		return super(SmoresEnvironment, self).compile(source, name, filename, raw=raw, defer_init=defer_init)
+
+	def _limit_loops(self, tree):
+		for loop in tree.find_all(nodes.For):
+			loop.iter = nodes.Filter(loop.iter, self._LOOP_FILTER, [], [], None, None, lineno=loop.iter.lineno)
+			loop.iter.set_environment(self)
+		return tree
+
+	def from_string_profiled(self, source):
+		"""
+		Compiles source with each tag it outputs timed by the current RenderProfile: the tag is preceded by a
+		filter starting its timer and wrapped in one finalizing its value and stopping the timer
+		"""
+		tree = self._limit_loops(self.parse(source))
+		for output in tree.find_all(nodes.Output):
+			children = []
+			for child in output.nodes:
+				name = _tag_path(child)
+				if name is None:
+					children.append(child)
+					continue
+				start = nodes.Filter(nodes.Const(name), self._PROFILE_START_FILTER, [], [], None, None, lineno=child.lineno)
+				stop = nodes.Filter(child, self._PROFILE_STOP_FILTER, [], [], None, None, lineno=child.lineno)
+				children.extend((start, stop))
+			output.nodes = children
+		tree.set_environment(self)
+		return self.from_string(tree)
+
+	def call_binop(self, context, operator, left, right):
+		budget = current_budget()
+		if budget is not None:
+			budget.check_binop(operator, left, right)
+		return super(SmoresEnvironment, self).call_binop(context, operator, left, right)
+
 	def getattr(self, obj, attribute):
 		"""Get an item or attribute of an object but prefer the attribute.
 		Unlike :meth:`getitem` the attribute *must* be a bytestring.
 		"""
 		try:
-			data = {k.lower(): v for k, v in obj.items()}
-			return data[attribute.lower()]
+			if isinstance(obj, (SchemaProxy, ColumnRow)):
+				return obj[attribute]
+			# dumped keys are usually already in the attribute's case, only scan the keys when they aren't
+			if attribute in obj:
+				return obj[attribute]
+			attribute = attribute.lower()
+			return next(v for k, v in obj.items() if k.lower() == attribute)
+		except RenderLimitExceeded:
+			raise
 		except:
 			return self.undefined(obj=obj, name=attribute)
 
@@ -93,17 +784,47 @@ class SmoresSchemaMeta(SchemaMeta):
 		super(SchemaMeta, self).__init__(name, bases, attrs)
 		if name:
 			class_registry.register(name, self)
+			_invalidate_schema_infos(name)
 		self._resolve_processors()
 
 
+class SchemaOpts(BaseSchemaOpts):
+	"""
+	Adds smores options to a schema's Meta
+
+	# Options:
+		plain_dicts (bool): dump dict data with smores.dumpers.dump_plain, its values are used as is
+			for simple fields.  `render`'s plain argument overrides it.
+	"""
+
+	def __init__(self, meta):
+		super(SchemaOpts, self).__init__(meta)
+		self.plain_dicts = getattr(meta, 'plain_dicts', False)
+
+
 class Schema(with_metaclass(SmoresSchemaMeta, BaseSchema)):
 	__doc__ = BaseSchema.__doc__
+	OPTIONS_CLASS = SchemaOpts
 
 
 _RECURSIVE_NESTED = 'self'
 
 
 class Nested(fields.Nested):
+	def _serialize(self, nested_obj, attr, obj):
+		memo = current_memo()
+		# a string only plucks one value out of the dump, which the memo's projection can't tell apart
+		if memo is None or nested_obj is None or isinstance(self.only, basestring):
+			return self._serialize_nested(nested_obj, attr, obj)
+		return memo.dump(self.schema, nested_obj, lambda: self._serialize_nested(nested_obj, attr, obj), nested=True)
+
+	def _serialize_nested(self, nested_obj, attr, obj):
+		budget = current_budget()
+		if budget is None:
+			return super(Nested, self)._serialize(nested_obj, attr, obj)
+		with budget.nested():
+			return super(Nested, self)._serialize(nested_obj, attr, obj)
+
 	@property
 	def schema(self):
 		"""The nested Schema object.
@@ -145,6 +866,18 @@ class Nested(fields.Nested):
 		return self.__schema
 
 
+def _nested_schema_class(field, parent_class):
+	"""
+	Resolves the schema class of a Nested field without instantiating it.  Reading field.schema
+	on a class level field would cache a schema instance lacking the render context.
+	"""
+	if isinstance(field.nested, basestring):
+		if field.nested == _RECURSIVE_NESTED:
+			return parent_class
+		return class_registry.get_class(field.nested)
+	return field.nested
+
+
 class Smores(object):
 	"""
 	Provides a method of defining a schema for string templates.  Presents a tag syntax
@@ -152,14 +885,41 @@ class Smores(object):
 
 	# Arguments:
 		default_template_name (str): The name you'd like to use for default schema templates
+		render_cache (LRUCache): opt-in cache of rendered output, see `render`'s cache_key argument
+		fragment_cache (FragmentCache): opt-in cache of rendered TemplateString fragments
+		limits (RenderLimits): default limits of every render
+		metrics (Metrics): opt-in registry of counters and histograms about renders, autocomplete and get_tags
+		compiled_dumps (bool): dump data through dumpers generated per schema projection instead of
+			marshmallow's generic dump, see smores.dumpers
+		memoize_dumps (bool): dump each object once per render and schema projection, see smores.memo.DumpMemo.
+			Cyclic data is dumped as None either way.
+		max_dump_depth (int): levels of Nested dumps below each root, deeper ones are dumped as None
 	"""
 
-	def __init__(self, default_template_name='_default_template'):
+	def __init__(self, default_template_name='_default_template', render_cache=None, fragment_cache=None,
+	             limits=None, metrics=None, compiled_dumps=False, memoize_dumps=True, max_dump_depth=None):
 		self._DEFAULT_TEMPLATE = default_template_name
 
 		# This jinja environment sets up a function to process variables into either serialized form or template
+		self.env = SmoresEnvironment(finalize=self._process_jinja_variables())
 		self.user_templates = {}
+		self.render_cache = render_cache
+		self.fragment_cache = fragment_cache
+		self.limits = limits
+		self.metrics = metrics
+		self.compiled_dumps = compiled_dumps
+		self.memoize_dumps = memoize_dumps
+		self.max_dump_depth = max_dump_depth
+		self._parsed = LRUCache(max_entries=512)
+		self._templates = LRUCache(max_entries=512)
 		self._registered_schemas = set([])
+		self._schemas_version = 0
+		self._schema_index = (None, {})
+		self._tag_graphs = {}
+		self._tag_lists = {}
+		self._tag_trees = {}
+		self._tag_index = TagIndex(self)
+		self._frozen = False
 
 	def _process_jinja_variables(self):
 		"""
@@ -177,12 +937,16 @@ class Smores(object):
 				# if var is a list return the _default_template for each item
 				try:
 					return "".join([v[_DEFAULT_TEMPLATE] for v in var])
+				except RenderLimitExceeded:
+					raise
 				except:
 					return ""
-			if isinstance(var, (dict,)):
+			if isinstance(var, (dict, SchemaProxy, ColumnRow)):
 				# if var is a dict, then we must be returning a single schema, so try to get the _default_template
 				try:
 					return var[_DEFAULT_TEMPLATE]
+				except RenderLimitExceeded:
+					raise
 				except:
 					return ""
 			# fallback to just returning the var as is (a plain field value)
@@ -244,8 +1008,10 @@ class Smores(object):
 		else:
 			schemas = schemas
 
+		self._check_not_frozen()
 		for schema in schemas:
 			self._registered_schemas.add(schema)
+		self._schemas_version += 1
 
 	def remove_schemas(self, schemas):
 		"""
@@ -259,8 +1025,78 @@ class Smores(object):
 		else:
 			schemas = schemas
 
+		self._check_not_frozen()
 		for schema in schemas:
 			self._registered_schemas.remove(schema)
+		self._schemas_version += 1
+
+	def _check_not_frozen(self):
+		if self._frozen:
+			raise RuntimeError('schemas can not be added or removed after Smores.freeze()')
+
+	def _schema_by_name(self, name):
+		"""
+		# Returns:
+			SchemaMeta|None: the registered schema whose class name is name, ignoring case
+		"""
+		# read the version first, an index built while the schemas change must not pass for the newer version
+		current = self._schemas_version
+		version, index = self._schema_index
+		if version != current:
+			index = dict((s.__name__.lower(), s) for s in self.schemas)
+			self._schema_index = (current, index)
+		return index.get(name.lower())
+
+	@property
+	def frozen(self):
+		"""Whether `freeze` was called, the registered schemas can't change anymore"""
+		return self._frozen
+
+	def freeze(self, templates=None):
+		"""
+		Eagerly builds the schema infos, schema lookups, tag list, tree and search index and compiled
+		templates of the registered schemas (and the schemas they nest), and makes the registered schemas
+		read-only.  Call it before forking workers (ex. in the master of a prefork server) so that the warm
+		caches are shared copy-on-write and the first render of each worker doesn't pay for them.  On pythons
+		with gc.freeze, the warm objects are also moved out of the garbage collector's reach so collections
+		in the workers don't touch (and copy) their pages.
+
+		# Arguments:
+			templates (list): end-user templates to compile ahead, along with the values of user_templates
+
+		# Example:
+			smores.add_module_schemas(schemas)
+			smores.freeze(templates=saved_templates)
+			# fork workers
+		"""
+		infos = {}
+		pending = [get_schema_info(s) for s in self.schemas]
+		while pending:
+			info = pending.pop()
+			if info.schema in infos:
+				continue
+			infos[info.schema] = info
+			pending.extend(info.nested_info(name) for name, nested in info.nested.items() if nested.is_smores_nested)
+
+		for schema, info in infos.items():
+			for name in info.template_fields:
+				self.env.from_field(schema._declared_fields[name].template_string)
+			if self.compiled_dumps:
+				compile_dumper(schema(context=dict(env=self.env, compiled_dumps=True)))
+
+		for schema in self.schemas:
+			self._schema_by_name(schema.__name__)
+		self.get_tags()
+		self.get_tag_tree()
+		self._tag_index.sync()
+		self._tag_resolver()
+		for template_string in list(templates or ()) + list(self.user_templates.values()):
+			self._get_template(template_string)
+
+		self._frozen = True
+		gc.collect()
+		if hasattr(gc, 'freeze'):
+			gc.freeze()
 
 	def schema(self, schema):
 		"""
@@ -293,6 +1129,119 @@ class Smores(object):
 
 
 
+	def validate(self, template_string, only=None, exclude=None):
+		"""
+		Finds the tags of an end-user template that don't resolve against the registered schemas
+
+		# Arguments:
+			template_string (str): text generated by end-users
+			only (list): only use these root schema names
+			exclude (list): exclude these root schema names
+
+		# Returns:
+			list: UnknownTag(tag, start, end, validFragment) for each unknown tag, empty if the template is valid
+
+		# Example:
+			>>> smores.validate("Hi {user.name}, see {user.adress.city}")
+			[UnknownTag(tag='user.adress.city', start=20, end=38, validFragment='user')]
+		"""
+		resolve = self._tag_resolver(only, exclude)
+		unknown = []
+		for match in _TAG_RE.finditer(template_string):
+			tag = match.group(1)
+			valid_fragment = resolve(tag)
+			if valid_fragment is not None:
+				unknown.append(UnknownTag(tag, match.start(), match.end(), valid_fragment))
+		return unknown
+
+	def validate_many(self, templates, only=None, exclude=None):
+		"""
+		Validates many templates, resolving each distinct tag only once
+
+		# Arguments:
+			templates (list|dict): end-user templates, or a mapping of name to template
+			only (list): only use these root schema names
+			exclude (list): exclude these root schema names
+
+		# Returns:
+			list|dict: the result of `validate` for each template, keyed like templates
+		"""
+		if isinstance(templates, dict):
+			return dict((name, self.validate(t, only, exclude)) for name, t in templates.items())
+		return [self.validate(t, only, exclude) for t in templates]
+
+	def _tag_resolver(self, only=None, exclude=None):
+		"""
+		Returns a function resolving a tag path against the schema graph of the root schemas.  The graph
+		and every resolved path are shared by all validations until the registered schemas change.
+		"""
+		key = (tuple(only or ()), tuple(exclude or ()))
+		version = self._schemas_version
+		graph = self._tag_graphs.get(key)
+		if graph is None or graph[0] != version:
+			schemas = self._filter_schemas(self.schemas, only=only, exclude=exclude)
+			roots = dict((s.__name__.lower(), get_schema_info(s)) for s in schemas)
+			graph = self._tag_graphs[key] = (version, roots, {})
+		_, roots, resolved = graph
+
+		def resolve(tag):
+			path = tag.lower()
+			try:
+				return resolved[path]
+			except KeyError:
+				pass
+			if len(resolved) > 10000:
+				resolved.clear()
+			result = resolved[path] = self._resolve_tag(path, roots)
+			return result
+
+		return resolve
+
+	@staticmethod
+	def _resolve_tag(path, roots):
+		"""
+		Resolves a lowercased tag path (ex. user.dogs:1.name) one attr at a time
+
+		# Returns:
+			str|None: None if the path is valid, otherwise its longest valid prefix
+		"""
+		attrs = path.split('.')
+		name, _, index = attrs[0].partition(':')
+		node = roots.get(name)
+		if node is None or index:
+			return ""
+
+		valid_fragment = name
+		via = None
+		for idx, attr in enumerate(attrs[1:]):
+			is_last_attr = idx == len(attrs) - 2
+			name, _, index = attr.partition(':')
+
+			# only schemas have attributes
+			field_name = node.fields.get(name) if node is not None else None
+			if field_name is None:
+				return valid_fragment
+
+			# the Nested field the schema was reached through may hide some of its fields
+			if via is not None and ((via.only and field_name not in via.only) or field_name in via.exclude):
+				return valid_fragment
+
+			# like get_tags and autocomplete, only smores Nested fields are walked into, others are plain fields
+			nested = node.nested.get(field_name)
+			if nested is not None and not nested.is_smores_nested:
+				nested = None
+
+			# only lists can be indexed (from 1), and a list must be indexed before accessing its items
+			many = nested is not None and nested.many
+			if (index and (not many or int(index) == 0)) or (many and not index and not is_last_attr):
+				return valid_fragment
+
+			node = node.nested_info(field_name) if nested is not None else None
+			via = nested
+			valid_fragment += "." + attr
+
+		return None
+
 	def get_tags(self, only=None, exclude=None):
 		"""
 		Retrieve the complete list of tags
@@ -305,12 +1254,12 @@ class Smores(object):
 			list: possible tags
 		"""
 		output = []
-		def build_tags(name, schema, ignore_fields=None):
+		def build_tags(name, info, ignore_fields=None):
 			ret = []
-			for field_name, field in schema._declared_fields.items():
-
+			for field_name in info.schema._declared_fields:
+				field = info.nested.get(field_name)
 
-				if isinstance(field, Nested):
+				if field is not None and field.is_smores_nested:
 					if field_name in (ignore_fields or []):
 						continue
 
@@ -319,31 +1268,129 @@ class Smores(object):
 					if field.many:
 						full_path += ":1"
 
-					check_re = re.compile(full_path + r"\.([a-zA-Z0-9_]*)($|\.)")
-					recursive_fields = [field_name] if field.nested == _RECURSIVE_NESTED else None
-					field_schema = field.schema if field.nested != _RECURSIVE_NESTED else schema
-					res = [(re.search(check_re, p).group(1), p) for p in
-					       build_tags(full_path, field_schema, ignore_fields=recursive_fields)]
+					recursive_fields = [field_name] if field.is_self else None
+					field_info = info.nested_info(field_name)
+					# key each nested tag by its first attr below full_path
+					res = [(_TAG_ATTR_RE.match(p, len(full_path) + 1).group(0), p) for p in
+					       build_tags(full_path, field_info, ignore_fields=recursive_fields)]
 
 					res = [v for k, v in res
-					       if not field.only or k in field.only
-					       and not field.exclude or k not in field.exclude]
+					       if (not field.only or k in field.only) and k not in (field.exclude or ())]
 					ret.extend(res)
 
 				elif self._DEFAULT_TEMPLATE != field_name:
 					ret.append(".".join([name, field_name]))
 			return ret
 
-		schemas = self._filter_schemas(self.schemas, only=only, exclude=exclude)
-		for s in schemas:
-			if self._DEFAULT_TEMPLATE in s._declared_fields:
-				output.append(s.__name__)
-			output.extend(build_tags(s.__name__, s))
+		with timed(self.metrics, 'smores_get_tags_seconds'):
+			# the list only changes with the registered schemas
+			key = (tuple(only or ()), tuple(exclude or ()))
+			version = self._schemas_version
+			cached = self._tag_lists.get(key)
+			if cached is not None and cached[0] == version:
+				return list(cached[1])
 
-		output = sorted([p.lower() for p in output])
+			schemas = self._filter_schemas(self.schemas, only=only, exclude=exclude)
+			for s in schemas:
+				info = get_schema_info(s)
+				if self._DEFAULT_TEMPLATE in s._declared_fields:
+					output.append(s.__name__)
+				output.extend(build_tags(s.__name__, info))
+
+			output = sorted([p.lower() for p in output])
+			self._tag_lists[key] = (version, tuple(output))
 
 		return output
 
+	def get_tag_tree(self, only=None, exclude=None):
+		"""
+		Describes the tags of `get_tags` as a tree, each schema reachable from the root schemas appearing once
+		with its Nested fields referring to schemas by id, so shared and recursive schemas aren't repeated.
+		Its size grows with the number of schemas rather than the number of tag paths.  The tree and its etag
+		only change with the registered schemas, so it can be served with an ETag header and cached by clients.
+		See smores.utils.expand_tag_tree for turning it back into the list of get_tags.
+
+		# Arguments
+			only (list): only use these root schema names
+			exclude (list): exclude these root schema names
+
+		# Returns:
+			dict: shared between calls, don't modify it
+				{'etag': fingerprint of the tree,
+				 'roots': [id of each root schema, its tag name],
+				 'schemas': {id: {'name': class name,
+				                  'default': whether it has a default template,
+				                  'tags': [names of its fields other than Nested ones],
+				                  'nested': {field name: {'schema': id, 'many': bool, 'self': bool,
+				                                          'only': [field names]|None, 'exclude': [field names]}}}}}
+		"""
+		key = (tuple(only or ()), tuple(exclude or ()))
+		version = self._schemas_version
+		cached = self._tag_trees.get(key)
+		if cached is not None and cached[0] == version:
+			return cached[1]
+
+		roots = sorted(self._filter_schemas(self.schemas, only=only, exclude=exclude), key=lambda s: s.__name__.lower())
+		ids = {}
+		schemas = {}
+
+		def schema_id(schema):
+			if schema not in ids:
+				name = schema.__name__.lower()
+				# distinct classes sharing a name get numbered ids
+				ids[schema] = name if name not in schemas else '%s~%s' % (name, len(ids))
+				schemas[ids[schema]] = None
+				pending.append(schema)
+			return ids[schema]
+
+		pending = []
+		root_ids = [schema_id(s) for s in roots]
+		while pending:
+			schema = pending.pop()
+			info = get_schema_info(schema)
+			tags, nested = [], {}
+			for field_name in schema._declared_fields:
+				field = info.nested.get(field_name)
+				if field is not None and field.is_smores_nested:
+					nested[field_name.lower()] = dict(
+						schema=schema_id(_nested_schema_class(field, schema)), many=bool(field.many), self=field.is_self,
+						only=sorted(f.lower() for f in field.only) if field.only else None,
+						exclude=sorted(f.lower() for f in field.exclude or ()))
+				elif field_name != self._DEFAULT_TEMPLATE:
+					tags.append(field_name.lower())
+			schemas[ids[schema]] = dict(name=schema.__name__, default=self._DEFAULT_TEMPLATE in schema._declared_fields,
+			                            tags=sorted(tags), nested=nested)
+
+		tree = dict(roots=root_ids, schemas=schemas)
+		tree['etag'] = fingerprint(tree)
+		self._tag_trees[key] = (version, tree)
+		return tree
+
+
+	def search_tags(self, query, limit=10, only=None, exclude=None):
+		"""
+		Finds tags by (part of) the name of the field they end with, for users who know a field but not its
+		path (ex. 'lat' finds 'user.address.geo.lat').  Misspelled names still match when they share most of
+		their trigrams with the field name.  Searches an index of the tags that's updated incrementally
+		when schemas are added or removed.
+
+		# Arguments:
+			query (str): part of a field name, or of a tag path if it has dots (ex. 'geo.lat')
+			limit (int): maximum number of tags returned
+			only (list): only use these root schema names
+			exclude (list): exclude these root schema names
+
+		# Returns:
+			list: tags, exact name matches first, then prefixes, substrings and fuzzy matches, shallow tags first
+
+		# Example:
+			>>> smores.search_tags('greeting', limit=2)
+			['dog.with_greeting', 'dog.dog.with_greeting']
+		"""
+		roots = None
+		if only or exclude:
+			roots = set(s.__name__.lower() for s in self._filter_schemas(self.schemas, only=only, exclude=exclude))
+		return self._tag_index.search(query, limit, roots)
 
 	def autocomplete(self, fragment, only=None, exclude=None):
 		"""
@@ -371,111 +1418,231 @@ class Smores(object):
 		    >>> smores.autocomplete("user.address.coordinates")
 		    AutocompleteResponse(tagStatus='VALID', options=['_default_template', 'lat', 'lng'])
 		"""
-		valid_fragment = ""
+		with timed(self.metrics, 'smores_autocomplete_seconds'):
+			return self._autocomplete(fragment, only, exclude)
+
+	def _autocomplete(self, fragment, only=None, exclude=None):
 		fragment = fragment.strip()
-		valid = True
 
 		# include/exclude root schemas from results
-		allowed_root_schemas = self.schemas[:]
-		if only:
-			only = [s.lower() for s in only]
-			allowed_root_schemas = [s for s in allowed_root_schemas if s.__name__.lower() in only]
-
-		if exclude:
-			exclude = [s.lower() for s in exclude]
-			allowed_root_schemas = [s for s in allowed_root_schemas if s.__name__.lower() not in exclude]
+		allowed_root_schemas = self._filter_schemas(self.schemas, only=only, exclude=exclude)
 
 		# return allowed schemas if fragment is blank
 		if not fragment:
-			return AutocompleteResponse("INVALID", sorted([s.__name__.lower() for s in allowed_root_schemas]),
-			                            valid_fragment)
+			return AutocompleteResponse("INVALID", sorted([s.__name__.lower() for s in allowed_root_schemas]), "")
 
-		# parse fragment into tokens
-		attrs = delimitedList(ATTR.setParseAction(lambda x: x[0]), delim='.')
+		# parse fragment into tokens (on a copy, setParseAction changes the shared element in place)
+		attrs = delimitedList(ATTR.copy().setParseAction(lambda x: x[0]), delim='.')
 		attrs = attrs.parseString(fragment)
 
-		# attempt to get the root schema
-		root_schema = next((s for s in allowed_root_schemas if s.__name__.lower() == attrs[0].lower()), None)
-		if root_schema:
-			valid_fragment += attrs[0].lower()
-			current_node = root_schema()
+		# walk the schemas one attr at a time, starting from the root schema
+		state = None
+		for idx, attr in enumerate(attrs):
+			state = self._autocomplete_step(state, attr, idx == len(attrs) - 1, allowed_root_schemas)
 
-		# otherwise get any schema starting with fragment
-		elif len(attrs) == 1:
-			result = [s.__name__.lower() for s in allowed_root_schemas
-			          if s.__name__.lower().startswith(attrs[0].lower())]
-			return AutocompleteResponse("INVALID", sorted(result), valid_fragment)
+		return self._autocomplete_finish(state)
 
-		# otherwise, it's an invalid fragment
-		else:
-			return AutocompleteResponse("INVALID", [], valid_fragment)
+	def autocomplete_session(self, only=None, exclude=None):
+		"""
+		Creates a stateful AutocompleteSession for an editor that sends a tag fragment per keystroke
 
-		get_fields = lambda n: map(lambda s: s.lower(), n.declared_fields.keys())
-		current_node_field_names = get_fields(current_node)
-		output = current_node_field_names
-		attr = attrs[0]
+		# Arguments:
+			only (list): a list of schemas that should be included
+			exclude (list): a list of schemas that should be excluded
 
-		for idx, attr in enumerate(attrs[1:]):
-			is_last_attr = idx == len(attrs[1:]) - 1
-			try:
-				current_node_field_names = get_fields(current_node)
-			except:
-				current_node_field_names = []
-
-			# if valid attribute
-			if attr.lower() in current_node_field_names:
-				fields = {k.lower(): v for k, v in current_node.declared_fields.items()}
-				node = fields[attr.lower()]
-
-				# if nested field, get the associated schema
-				if isinstance(node, Nested):
-					current_node = node.schema
-
-					# if it's a many field and the last attr, return an option to index the array
-					if is_last_attr and node.many == True:
-						output = [':1']
-						break
-
-					# otherwise update the field names
-					current_node_field_names = get_fields(current_node)
-					output = current_node_field_names
-				else:
-					current_node = None
+		# Returns:
+			AutocompleteSession: answers the same as `autocomplete` while reusing work from previous fragments
+		"""
+		return AutocompleteSession(self, only=only, exclude=exclude)
 
-				valid_fragment += "." + attr.lower()
-				continue
+	@staticmethod
+	def _autocomplete_step(state, attr, is_last_attr, allowed_root_schemas):
+		"""
+		Advances an autocomplete walk by one attr.  The walk state is never mutated so that
+		it can be shared by AutocompleteSession.
 
-			# if attr is an array index, just continue
-			elif attr.startswith('['):
-				valid_fragment += de_bracketize(attr)
-				continue
+		# Arguments:
+			state (_AutocompleteState|None): the walk so far, None to resolve the root schema
+			attr (str): a parsed attr of the fragment, either a field name or an index like '[0]'
+			is_last_attr (bool): whether attr is the last attr of the fragment
+			allowed_root_schemas (list): schemas that may be used as root
 
-			# if the attr is only partially filled, return possible results
+		# Returns:
+			_AutocompleteState: the walk after attr
+		"""
+		if state is None:
+			# attempt to get the root schema
+			root_schema = next((s for s in allowed_root_schemas if s.__name__.lower() == attr.lower()), None)
+			if root_schema:
+				current_node = get_schema_info(root_schema)
+				return _AutocompleteState(current_node, current_node.field_names, attr.lower(), attr, True, False, None)
+
+			# otherwise get any schema starting with fragment
+			elif is_last_attr:
+				result = [s.__name__.lower() for s in allowed_root_schemas
+				          if s.__name__.lower().startswith(attr.lower())]
+				response = AutocompleteResponse("INVALID", sorted(result), "")
+
+			# otherwise, it's an invalid fragment
 			else:
-				valid = False
-				current_node_field_names = [f for f in current_node_field_names if f.startswith(attr.lower())]
+				response = AutocompleteResponse("INVALID", [], "")
+			return _AutocompleteState(None, [], "", attr, False, True, response)
 
-				output = current_node_field_names
-				break
+		if state.done:
+			return state
+
+		node = state.node
+		current_node_field_names = node.field_names if node is not None else ()
+
+		# if valid attribute
+		if node is not None and attr.lower() in node.fields:
+			field_name = node.fields[attr.lower()]
+			nested = node.nested.get(field_name)
+			output = state.output
+
+			# if nested field, get the associated schema
+			if nested is not None and nested.is_smores_nested:
+				current_node = node.nested_info(field_name)
+
+				# if it's a many field and the last attr, return an option to index the array
+				if is_last_attr and nested.many == True:
+					return state._replace(node=current_node, output=[':1'], attr=attr, done=True)
+
+				# otherwise update the field names
+				output = current_node.field_names
+			else:
+				current_node = None
+
+			return state._replace(node=current_node, output=output, attr=attr,
+			                      valid_fragment=state.valid_fragment + "." + attr.lower())
+
+		# if attr is an array index, just continue
+		elif attr.startswith('['):
+			return state._replace(attr=attr, valid_fragment=state.valid_fragment + de_bracketize(attr))
+
+		# if the attr is only partially filled, return possible results
+		else:
+			output = [f for f in current_node_field_names if f.startswith(attr.lower())]
+			return state._replace(output=output, attr=attr, valid=False, done=True)
+
+	@staticmethod
+	def _autocomplete_finish(state):
+		"""
+		Builds the AutocompleteResponse for the end of an autocomplete walk
 
+		# Arguments:
+			state (_AutocompleteState): the walk over every attr of the fragment
+
+		# Returns:
+			AutocompleteResponse: status, options and valid fragment
+		"""
+		if state.response is not None:
+			return state.response
+
+		current_node, output, attr = state.node, state.output, state.attr
 		status = 'VALID'
 
-		if isinstance(current_node, (Schema,)):
-			if attr.lower() == current_node.__class__.__name__.lower():
+		if current_node is not None and current_node.is_smores:
+			if attr.lower() == current_node.name:
 				if '_default_template' not in output:
 					status = "INVALID"
 
-			elif attr not in get_fields(current_node):
+			elif attr not in current_node.field_names:
 				status = 'INVALID'
 
 		else:
 			output = []
 
-		status = status if valid else "INVALID"
+		status = status if state.valid else "INVALID"
+
+		return AutocompleteResponse(status, sorted(output), state.valid_fragment)
+
+	def _get_template(self, template_string, fallback_value='', pre_process=None, profiled=False):
+		"""
+		Parses and compiles an end-user template.  The parsed template is cached unless fallback_value is a
+		function, and the compiled template is cached by its jinja source.  Templates made only of text and
+		tags compile to a _SimpleTemplate rendered without jinja.  pre_process runs on every call,
+		so a fresh function per render still hits the cache (loop_table_rows caches its own results).
+
+		# Arguments
+			template_string (str): text generated by end-users
+			fallback_value (str|function|None): see `render`
+			pre_process (function): see `render`
+			profiled (bool): return a copy of the template timing its tags for the current RenderProfile
+
+		# Returns:
+			Template: compiled jinja template
+		"""
+		# functions aren't part of the key, a fresh lambda per render would never hit
+		key = (template_string, fallback_value) if not isfunction(fallback_value) else None
+		jinja_template = self._parsed.get(key) if key is not None else None
+		if jinja_template is None:
+			# parse end-user template (converts {user.addresses:3.name} to {{user.addresses[2].name}})
+			# gives a 'slightly' less intimidating language syntax for the user to understand.
+			jinja_template = to_jinja_template(template_string, default=fallback_value)
+			if key is not None:
+				self._parsed.set(key, jinja_template)
+
+		# allows processing of template after parsing but before rendering
+		if pre_process:
+			jinja_template = pre_process(jinja_template)
+
+		template = self._templates.get(jinja_template)
+		if self.metrics is not None:
+			self.metrics.inc('smores_template_cache_total', dict(result='miss' if template is None else 'hit'))
+		if template is None:
+			# templates made only of text and tags skip jinja entirely
+			template = _SimpleTemplate.from_jinja_source(self.env, jinja_template) or self.env.from_string(jinja_template)
+			self._templates.set(jinja_template, template)
+
+		# simple templates time their tags themselves
+		if profiled and not isinstance(template, _SimpleTemplate):
+			key = (jinja_template, 'profiled')
+			template = self._templates.get(key)
+			if template is None:
+				template = self.env.from_string_profiled(jinja_template)
+				self._templates.set(key, template)
+		return template
+
+	def _render_cache_key(self, data, template, cache_key):
+		"""
+		Builds the render cache key and invalidation tags for a render
+
+		# Returns:
+			tuple: (key, tags), key is None if the data can't be fingerprinted
+		"""
+		if isinstance(cache_key, dict):
+			tags = [(k.lower(), v) for k, v in cache_key.items()]
+			return (template, self._schemas_version, tuple(sorted(tags))), tags
+
+		tags = []
+		for k, v in data.items():
+			key = v.get('id') if isinstance(v, dict) else getattr(v, 'id', None)
+			if key is not None:
+				tags.append((k.lower(), key))
 
-		return AutocompleteResponse(status, sorted(output), valid_fragment)
+		version = cache_key if cache_key is not None else fingerprint(data)
+		if version is None:
+			return None, tags
+		return (template, self._schemas_version, version), tags
 
-	def render(self, data, template_string, sub_templates=None, fallback_value='', pre_process=None):
+	def invalidate(self, root, key):
+		"""
+		Drops cached renders that used a root object
+
+		# Arguments
+			root (str): name of the root in the render data (ex. 'user')
+			key (hashable): the key of the root object, it's 'id' unless a cache_key dict was given to render
+
+		# Returns:
+			int: number of cached renders dropped
+		"""
+		if self.render_cache is None:
+			return 0
+		return self.render_cache.invalidate((root.lower(), key))
+
+	def render(self, data, template_string, sub_templates=None, fallback_value='', pre_process=None, lazy=False,
+	           cache_key=None, limits=None, template_name=None, plain=None, profile=None):
 		"""
 		Recursively populates the 'template_string' with data gathered from dumping 'data' through the Marshmallow 'schema'.
 		Variables are evaluated and will return the '_default_template' if one exists.  Prettifies end result.
@@ -486,10 +1653,37 @@ class Smores(object):
 			sub_templates (dict): mapping of subtemplate tag to expanded sub template string
 			fallback_value (str|function|None): either string or function returning a string to serve as default value for tag attrs that cannot be resolved
 			pre_process (function): function that modifies the parsed version of the template
+			lazy (bool): wrap each root in a SchemaProxy so only the fields the template accesses are serialized
+			cache_key (hashable|dict): version of data for the render cache, or a mapping of root name to root object
+				key.  When omitted, plain data is fingerprinted and anything else (ex. ORM models) isn't cached.
+			limits (RenderLimits): limits of this render, defaults to the instance's limits.  Raises
+				RenderLimitExceeded when one is exceeded.
+			template_name (str): name of the template in metrics, defaults to a digest of template_string
+			plain (bool|None): whether dict data holds already serialized values whose simple fields can skip
+				marshmallow (see smores.dumpers.dump_plain), None leaves it to each schema's Meta.plain_dicts
+			profile (RenderProfile): attributes the cost of this render to its tags and TemplateString fields, the
+				render cache is skipped
 
 		# Returns:
 			string: rendered template
 		"""
+		if self.metrics is None:
+			return self._render(data, template_string, sub_templates, fallback_value, pre_process, lazy, cache_key, limits,
+			                    plain, profile)
+
+		labels = dict(template=template_name or (fingerprint(template_string) or '')[:12])
+		try:
+			with self.metrics.timer('smores_render_seconds', labels):
+				result = self._render(data, template_string, sub_templates, fallback_value, pre_process, lazy,
+				                      cache_key, limits, plain, profile)
+		except Exception as e:
+			self.metrics.inc('smores_render_errors_total', dict(labels, error=e.__class__.__name__))
+			raise
+		self.metrics.inc('smores_renders_total', labels)
+		return result
+
+	def _render(self, data, template_string, sub_templates, fallback_value, pre_process, lazy, cache_key, limits,
+	            plain, profile=None):
 		assert not sub_templates or isinstance(sub_templates, (dict,)), \
 			'sub_templates must be a dict of <tag>: <subtemplate>'
 		assert not pre_process or isfunction(pre_process), \
@@ -502,24 +1696,473 @@ class Smores(object):
 			for tag_name, tag_template_str in sub_templates.items():
 				template_string = template_string.replace("{%s}" % tag_name, tag_template_str)
 
-		# parse end-user template (converts {user.addresses:3.name} to {{user.addresses[2].name}})
-		# gives a 'slightly' less intimidating language syntax for the user to understand.
-		jinja_template = to_jinja_template(template_string, default=fallback_value)
+		# get the parsed and compiled template object
+		env = self.env
+		template = self._get_template(template_string, fallback_value, pre_process, profiled=profile is not None)
 
-		# allows processing of template after parsing but before rendering
-		if pre_process:
-			jinja_template = pre_process(jinja_template)
+		render_cache_key = None
+		if self.render_cache is not None and profile is None:
+			render_cache_key, tags = self._render_cache_key(data, template, cache_key)
+			if render_cache_key is not None:
+				result = self.render_cache.get(render_cache_key)
+				if result is not None:
+					return result
+
+		limits = limits or self.limits
+		budget = RenderBudget(limits) if limits else None
+
+		with budget_scope(budget), memo_scope(self._memo()), profile_scope(profile):
+			context_dict = self._context(data, lazy, plain)
+			result = budget.render(template, context_dict) if budget else template.render(**context_dict)
 
-		# create the template object
-		env = SmoresEnvironment(finalize=self._process_jinja_variables())
-		template = env.from_string(jinja_template)
+		if render_cache_key is not None:
+			self.render_cache.set(render_cache_key, result, tags)
+		return result
 
-		get_schema = lambda k: next((s for s in self.schemas if s.__name__.lower() == k.lower()), None)
+
+	def _memo(self):
+		return DumpMemo(memoize=self.memoize_dumps, max_depth=self.max_dump_depth)
+
+	def _context(self, data, lazy=False, plain=None):
+		"""
+		Builds the render context of data: each root whose schema is registered, dumped (or wrapped in a
+		SchemaProxy when lazy), keyed by its lowercased name.  Runs within the render's budget and memo scopes.
+		"""
 		context_dict = {}
 		for k, v in data.items():
-			schema = get_schema(k)
+			schema = self._schema_by_name(k)
 			if schema:
-				s = schema(context=dict(env=env))
-				context_dict[k.lower()] = s.dump(v).data
+				s = schema(context=dict(env=self.env, fragment_cache=self.fragment_cache, metrics=self.metrics,
+				                        compiled_dumps=self.compiled_dumps, plain=plain))
+				# processors work on the whole dump, like Nested fields with processors these can't be lazy
+				if lazy and not s._has_processors:
+					context_dict[k.lower()] = SchemaProxy(s, v)
+				else:
+					with timed(self.metrics, 'smores_dump_seconds', dict(schema=schema.__name__)), profiled('dump', k.lower()):
+						context_dict[k.lower()] = dump(s, v)
+		return context_dict
+
+	def snapshot(self, data, plain=None):
+		"""
+		Dumps data once into a context that templates can later be rendered against with `render_snapshot`,
+		without the ORM or marshmallow (ex. an email, an SMS and a PDF rendered at different times).  Every
+		field is dumped, TemplateString fields included, and every key is lowercased.  smores.snapshot.to_bytes
+		serializes it compactly for storage.
+
+		# Arguments
+			data (dict): see `render`
+			plain (bool|None): see `render`
+
+		# Returns:
+			dict: the render context, root name -> dumped data
+
+		# Example:
+			stored = to_bytes(smores.snapshot(dict(user=user)))
+			...
+			smores.render_snapshot(stored, sms_template)
+		"""
+		with memo_scope(self._memo()):
+			return fold_keys(self._context(data, plain=plain))
+
+	def render_snapshot(self, snapshot, template_string, fallback_value='', pre_process=None, limits=None):
+		"""
+		Renders template_string against a context made by `snapshot`
+
+		# Arguments
+			snapshot (dict|bytes): result of `snapshot`, or of smores.snapshot.to_bytes on it
+			template_string (str): text generated by end-users
+			fallback_value (str|function|None): see `render`
+			pre_process (function): see `render`
+			limits (RenderLimits): see `render`
+
+		# Returns:
+			string: rendered template
+		"""
+		if isinstance(snapshot, bytes):
+			snapshot = from_bytes(snapshot)
+		template = self._get_template(template_string, fallback_value, pre_process)
+
+		limits = limits or self.limits
+		if not limits:
+			return template.render(**snapshot)
+		budget = RenderBudget(limits)
+		with budget_scope(budget):
+			return budget.render(template, snapshot)
+
+	def render_bundle(self, data, templates, fallback_value='', pre_process=None, limits=None):
+		"""
+		Renders several templates against the same data (ex. the subject, html body, text body and sms of a
+		notification).  The roots are shared SchemaProxies, like `render(..., lazy=True)`, so each field is
+		serialized once, the first time any of the templates uses it, and the data is only dumped as far as
+		the union of the fields the templates use.
+
+		# Arguments
+			data (dict): see `render`
+			templates (dict): name -> template string generated by end-users
+			fallback_value (str|function|None): see `render`
+			pre_process (function): see `render`
+			limits (RenderLimits): limits of each template's render, defaults to the instance's limits
+
+		# Returns:
+			dict: name -> rendered template
+
+		# Example:
+			outputs = smores.render_bundle(dict(user=user), dict(subject=subject, html=html, sms=sms))
+		"""
+		compiled = dict((name, self._get_template(template_string, fallback_value, pre_process))
+		                for name, template_string in templates.items())
+		limits = limits or self.limits
+
+		outputs = {}
+		with memo_scope(self._memo()):
+			context = self._context(data, lazy=True)
+			for name, template in compiled.items():
+				if not limits:
+					outputs[name] = template.render(**context)
+					continue
+				budget = RenderBudget(limits)
+				with budget_scope(budget):
+					outputs[name] = budget.render(template, context)
+		return outputs
+
+	def render_incremental(self, data, template_string, fallback_value=''):
+		"""
+		Renders template_string like `render(..., lazy=True)`, returning an IncrementalRender whose `update`
+		re-renders only the parts of the output depending on the data that changed
+
+		# Arguments
+			data (dict): the render data, changed in place between updates
+			template_string (str): text generated by end-users
+			fallback_value (str|function|None): see `render`
+
+		# Returns:
+			IncrementalRender: holds the output, see IncrementalRender.update
+
+		# Example:
+			preview = smores.render_incremental(dict(user=user), template)
+			user.name = 'Someone Else'
+			html = preview.update(['user.name'])
+		"""
+		return IncrementalRender(self, data, template_string, fallback_value)
+
+	def render_columns(self, columns, template_string, root='user', fallback_value='', pre_process=None, limits=None):
+		"""
+		Renders template_string once per row of column arrays (ex. lists or NumPy arrays from a warehouse
+		export) without building a dict per row.  Columns are named by their path below root, dotted for
+		nested values (ex. 'address.city'), and hold already serialized values.  TemplateString fields of
+		root's schema (and of the schemas nested below it) are rendered against the row, so ex. {user}
+		renders the User _default_template.  Lists (many=True fields) can't be expressed as columns.
+
+		# Arguments
+			columns (dict): mapping of column path to a sequence of values, all of the same length
+			template_string (str): text generated by end-users
+			root (str): name the rows are rendered as (ex. 'user' for {user.name})
+			fallback_value (str|function|None): see `render`
+			pre_process (function): see `render`
+			limits (RenderLimits): limits of each row's render, defaults to the instance's limits
+
+		# Returns:
+			generator: the rendered template of each row, in order
+
+		# Example:
+			columns = {'name': names, 'address.city': cities}
+			for output in smores.render_columns(columns, "{user.name} lives in {user.address.city}"):
+				send(output)
+		"""
+		template = self._get_template(template_string, fallback_value, pre_process)
+		root = root.lower()
+		schema = self._schema_by_name(root)
+		info = get_schema_info(schema) if schema is not None else None
+		table = _ColumnTable(columns, info, dict(env=self.env, fragment_cache=self.fragment_cache, metrics=self.metrics))
+		if isinstance(template, _SimpleTemplate):
+			template = _ColumnTemplate(template, table, root)
+		limits = limits or self.limits
+
+		for index in xrange(table.length):
+			context = {root: ColumnRow(table.root, index)}
+			if not limits:
+				yield template.render(**context)
+				continue
+			budget = RenderBudget(limits)
+			with budget_scope(budget):
+				output = budget.render(template, context)
+			yield output
+
+
+class AutocompleteSession(object):
+	"""
+	Answers autocomplete requests for a fragment that changes a keystroke at a time.  The walk
+	state for every '.' delimited prefix of the fragment is remembered, so each keystroke only
+	resolves the last attr of the fragment no matter how deep the tag is.  Responses are identical
+	to Smores.autocomplete.
+
+	# Arguments:
+		smores (Smores): instance whose schemas are used
+		only (list): a list of schemas that should be included
+		exclude (list): a list of schemas that should be excluded
+
+	# Example:
+		>>> session = smores.autocomplete_session()
+		>>> session.autocomplete('user.addr')
+		AutocompleteResponse(tagStatus='INVALID', options=['address'], validFragment='user')
+		>>> session.autocomplete('user.addre')
+		AutocompleteResponse(tagStatus='INVALID', options=['address'], validFragment='user')
+	"""
+	_MAX_PREFIXES = 1024
+
+	def __init__(self, smores, only=None, exclude=None):
+		self.smores = smores
+		self.only = only
+		self.exclude = exclude
+		self._schemas_version = None
+		self._allowed_root_schemas = None
+		self._prefixes = {}
+
+	def autocomplete(self, fragment):
+		"""
+		Evaluates a tag fragment, see Smores.autocomplete
+
+		# Arguments:
+			fragment (string): a tag fragment ex: user.addresses
+
+		# Returns:
+			AutocompleteResponse: NamedTuple with both the status of the current tag fragment as well as possible options
+		"""
+		fragment = fragment.strip()
+
+		if self._schemas_version != self.smores._schemas_version or len(self._prefixes) > self._MAX_PREFIXES:
+			self._schemas_version = self.smores._schemas_version
+			self._allowed_root_schemas = self.smores._filter_schemas(self.smores.schemas, self.only, self.exclude)
+			self._prefixes = {}
+
+		if not fragment:
+			return self.smores.autocomplete(fragment, only=self.only, exclude=self.exclude)
+
+		prefix, dot, segment = fragment.rpartition('.')
+		if not dot:
+			walk = self._extend(None, fragment, fragment)
+		else:
+			walk = self._extend(self._prefix(prefix, fragment), segment, fragment)
+
+		complete, before_last, last, _ = walk
+		state = self.smores._autocomplete_step(before_last, last, True, self._allowed_root_schemas)
+		return self.smores._autocomplete_finish(state)
+
+	def _prefix(self, prefix, fragment):
+		"""Returns the cached walk over prefix, walking only its last segment if it's not cached"""
+		walk = self._prefixes.get(prefix)
+		if walk is None:
+			parent, dot, segment = prefix.rpartition('.')
+			walk = self._extend(self._prefix(parent, fragment) if dot else None, segment, fragment)
+			self._prefixes[prefix] = walk
+		return walk
+
+	def _extend(self, walk, segment, fragment):
+		"""
+		Extends a walk with the attrs of segment
+
+		# Returns:
+			tuple: (complete, state before the last attr, last attr, state after the last attr)
+		"""
+		# parsing stops at the first segment that isn't entirely an attr
+		if walk is not None and not walk[0]:
+			return walk
+
+		match = _SEGMENT_RE.match(segment)
+		if not match and walk is None:
+			# the fragment doesn't start with an attr, Smores.autocomplete raises the parser's error
+			self.smores.autocomplete(fragment, only=self.only, exclude=self.exclude)
+		if not match:
+			return (False,) + walk[1:]
+
+		attrs = [match.group(1).lower()]
+		if match.group(2) is not None:
+			attrs.append('[%d]' % (int(match.group(2)) - 1))
+
+		state = walk[3] if walk is not None else None
+		step = self.smores._autocomplete_step
+		if len(attrs) > 1:
+			state = step(state, attrs[0], False, self._allowed_root_schemas)
+		after = step(state, attrs[-1], False, self._allowed_root_schemas)
+		return (match.end() == len(segment), state, attrs[-1], after)
+
+
+class IncrementalRender(object):
+	"""
+	A render that can be updated after some of its data changed, see Smores.render_incremental.  The
+	template is split into literal text, tags and jinja blocks, each rendered separately against lazy
+	SchemaProxy roots and recorded with the tag paths it depends on.  `update` drops what the proxies
+	serialized along the changed paths and re-renders only the segments depending on them.
+
+	Templates setting variables or defining macros at the top level can't be split and are a single
+	segment, re-rendered on any change.
+
+	# Arguments:
+		smores (Smores): instance whose schemas are used
+		data (dict): the render data, changed in place between updates
+		template_string (str): text generated by end-users
+		fallback_value (str|function|None): see `Smores.render`
+
+	# Attributes:
+		output (str): the current output
+	"""
+
+	def __init__(self, smores, data, template_string, fallback_value=''):
+		self.smores = smores
+		self.data = data
+		self._fallback_value = fallback_value
+		self._segments = self._split(template_string)
+		self._roots = {}
+		self._outputs = [None] * len(self._segments)
+		self.update(None)
+
+	def _split(self, template_string):
+		"""
+		# Returns:
+			list: (text, dependencies) of each segment, dependencies is None for literal text
+		"""
+		segments = []
+		block = []
+		depth = 0
+		position = 0
+
+		# whitespace control strips the text around a token, across segments
+		if _WHITESPACE_CONTROL_RE.search(template_string):
+			return [(template_string, ('',))]
+
+		for match in _SEGMENT_TOKEN_RE.finditer(template_string):
+			token = match.group(0)
+			text = template_string[position:match.start()]
+			position = match.end()
+
+			if depth:
+				block.extend((text, token))
+			elif text:
+				segments.append((text, None))
+
+			if token.startswith('{%'):
+				statement = _STATEMENT_RE.match(token)
+				keyword = statement.group(1) if statement else ''
+				if keyword in _BLOCK_STATEMENTS:
+					if not depth:
+						block = [token]
+					depth += 1
+				elif keyword.startswith('end') and depth:
+					depth -= 1
+					if not depth:
+						segments.append((''.join(block), self._roots_of(''.join(block))))
+				elif not depth:
+					# top level statements (ex. set, macro) affect the rest of the template
+					return [(template_string, ('',))]
+			elif depth:
+				continue
+			elif token.startswith('{{'):
+				segments.append((token, self._roots_of(token)))
+			elif token.startswith('{#'):
+				continue
+			else:
+				segments.append((token, (self._dependency(match.group(2).lower()),)))
+
+		if depth:
+			return [(template_string, ('',))]
+		if position < len(template_string):
+			text = template_string[position:]
+			# jinja drops a single trailing newline of a template
+			segments.append((text[:-1] if text.endswith('\n') else text, None))
+		return segments
+
+	def _dependency(self, path):
+		"""
+		The path a tag depends on: its own, or for a TemplateString field (ex. user.long_template) the path of
+		its schema (user), as the template may render any of the schema's fields
+		"""
+		attrs = path.split('.')
+		schema = self.smores._schema_by_name(attrs[0].partition(':')[0])
+		info = get_schema_info(schema) if schema is not None else None
+		for idx, attr in enumerate(attrs[1:], 1):
+			field_name = info.fields.get(attr.partition(':')[0]) if info is not None else None
+			if field_name is None:
+				break
+			if field_name in info.template_fields:
+				return '.'.join(attrs[:idx])
+			info = info.nested_info(field_name) if field_name in info.nested else None
+		return path
+
+	def _roots_of(self, template_string):
+		jinja_template = to_jinja_template(template_string, default=self._fallback_value)
+		return tuple(meta.find_undeclared_variables(self.smores.env.parse(jinja_template)))
+
+	@staticmethod
+	def _attrs(path):
+		return [attr.partition(':')[0] for attr in path.split('.')] if path else []
+
+	@classmethod
+	def _affects(cls, changed, dependency):
+		# a change affects its ancestors (ex. their default templates) and descendants, list indexes are ignored
+		changed, dependency = cls._attrs(changed), cls._attrs(dependency)
+		length = min(len(changed), len(dependency))
+		return changed[:length] == dependency[:length]
+
+	def _invalidate(self, path):
+		attrs = self._attrs(path.lower())
+		if not attrs:
+			self._roots = {}
+			return
+		proxy = self._roots.get(attrs[0])
+		# roots dumped eagerly (ex. with processors) are dumped again
+		if not isinstance(proxy, SchemaProxy) or len(attrs) == 1:
+			self._roots.pop(attrs[0], None)
+			return
+
+		for idx, attr in enumerate(attrs[1:]):
+			cache = proxy._cache
+			# the proxy's template fields may render the changed value
+			for name in proxy._info.template_fields:
+				cache.pop(name, None)
+			name = proxy._info.dump_keys.get(attr)
+			value = cache.get(name)
+			if isinstance(value, SchemaProxy) and idx < len(attrs) - 2:
+				proxy = value
+				continue
+			cache.pop(name, None)
+			return
+
+	def _context(self):
+		missing = dict((k, v) for k, v in self.data.items() if k.lower() not in self._roots)
+		if missing:
+			self._roots.update(self.smores._context(missing, lazy=True))
+		return self._roots
+
+	def update(self, changed_paths):
+		"""
+		Re-renders the segments depending on changed_paths
+
+		# Arguments:
+			changed_paths (list|None): tag paths whose data changed (ex. ['user.name', 'user.dogs:2']),
+				None re-renders everything
+
+		# Returns:
+			str: the new output
+		"""
+		if changed_paths is None:
+			self._roots = {}
+			affected = range(len(self._segments))
+		else:
+			changed_paths = [path.strip().lower() for path in changed_paths]
+			for path in changed_paths:
+				self._invalidate(path)
+			affected = [idx for idx, (_, dependencies) in enumerate(self._segments)
+			            if dependencies is not None and
+			            any(self._affects(c, d) for c in changed_paths for d in dependencies)]
+
+		context = self._context()
+		for idx in affected:
+			text, dependencies = self._segments[idx]
+			if dependencies is None:
+				self._outputs[idx] = text
+			else:
+				template = self.smores._get_template(text, self._fallback_value)
+				self._outputs[idx] = template.render(**context)
 
-		return template.render(**context_dict)
+		self.output = u''.join(self._outputs)
+		return self.output
@@ -0,0 +1,72 @@
+"""
+Serializes the contexts made by Smores.snapshot.  Contexts are marshaled, which is compact and fast to load
+but only readable by the same python version, and unsafe for untrusted bytes: only load snapshots you
+stored yourself.
+"""
+import marshal
+from decimal import Decimal
+
+_MAGIC = b'smores-snapshot:1:'
+
+# dumped Decimals are stored as {_DECIMAL: text}, marshal has no type for them
+_DECIMAL = u'\x00decimal'
+
+
+def fold_keys(value):
+	"""Copies dumped data with every dict key lowercased, as tags resolve them"""
+	if isinstance(value, dict):
+		return dict((k.lower() if isinstance(k, basestring) else k, fold_keys(v)) for k, v in value.items())
+	if isinstance(value, (list, tuple)):
+		return [fold_keys(v) for v in value]
+	return value
+
+
+def _encode(value):
+	if isinstance(value, dict):
+		return dict((k, _encode(v)) for k, v in value.items())
+	if isinstance(value, (list, tuple)):
+		return [_encode(v) for v in value]
+	if isinstance(value, Decimal):
+		return {_DECIMAL: unicode(value)}
+	if value is None or isinstance(value, (basestring, bool, int, long, float)):
+		return value
+	# values of custom fields only ever get rendered as text
+	return unicode(value)
+
+
+def _decode(value):
+	if isinstance(value, dict):
+		if len(value) == 1 and _DECIMAL in value:
+			return Decimal(value[_DECIMAL])
+		return dict((k, _decode(v)) for k, v in value.items())
+	if isinstance(value, list):
+		return [_decode(v) for v in value]
+	return value
+
+
+def to_bytes(snapshot):
+	"""
+	Serializes a snapshot
+
+	# Arguments:
+		snapshot (dict): result of Smores.snapshot
+
+	# Returns:
+		bytes: the serialized snapshot
+	"""
+	return _MAGIC + marshal.dumps(_encode(snapshot), 2)
+
+
+def from_bytes(data):
+	"""
+	Loads a snapshot serialized by `to_bytes`
+
+	# Arguments:
+		data (bytes): the serialized snapshot
+
+	# Returns:
+		dict: the snapshot
+	"""
+	if not data.startswith(_MAGIC):
+		raise ValueError('not a smores snapshot')
+	return _decode(marshal.loads(data[len(_MAGIC):]))
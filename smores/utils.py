@@ -2,6 +2,16 @@ import re
 import inspect
 import smores
 
+# matches the opening/closing tags that matter when looking for looping rows
+_TABLE_TOKEN_RE = re.compile(r'<(/?)(table|tr|td|th)\b[^>]*>', re.IGNORECASE)
+
+# strips any markup nested within a table cell before matching against tags
+_MARKUP_RE = re.compile(r'<[^>]*>')
+
+_LOOP_TABLE_ROWS_CACHE_SIZE = 256
+_loop_table_rows_cache = {}
+
+
 def get_module_schemas(module_):
 	"""
 	Returns list of all classes found in the module_
@@ -16,16 +26,120 @@ def get_module_schemas(module_):
 	schema_tuples = inspect.getmembers(module_, is_schema)
 	return [s[1] for s in schema_tuples]
 
+
+def _find_table_rows(template_string):
+	"""
+	Scans template_string once and collects the rows of every table.
+
+	# Arguments:
+		template_string (str): template to scan
+	# Returns:
+		list: one list per table of (row_start, row_end, [cell_text, ...]) tuples
+	"""
+	tables = []
+	stack = []
+
+	# a cell's text is collected in parts, skipping any table nested within the cell
+	def pause_cell(table, pos):
+		if table['cell'] is not None:
+			table['text'].append(template_string[table['cell']:pos])
+			table['cell'] = None
+
+	def close_cell(table, pos):
+		pause_cell(table, pos)
+		if table['text'] is not None:
+			table['row'][2].append(_MARKUP_RE.sub('', ''.join(table['text'])))
+			table['text'] = None
+
+	def close_row(table, start, end):
+		close_cell(table, start)
+		if table['row'] is not None:
+			table['row'][1] = end
+			table['rows'].append(tuple(table['row']))
+			table['row'] = None
+
+	for match in _TABLE_TOKEN_RE.finditer(template_string):
+		closing, name = match.group(1), match.group(2).lower()
+
+		if name == 'table':
+			if not closing:
+				if stack:
+					pause_cell(stack[-1], match.start())
+				stack.append(dict(rows=[], row=None, cell=None, text=None))
+			elif stack:
+				table = stack.pop()
+				close_row(table, match.start(), match.start())
+				tables.append(table['rows'])
+				if stack and stack[-1]['text'] is not None:
+					stack[-1]['cell'] = match.end()
+			continue
+
+		if not stack:
+			continue
+		table = stack[-1]
+
+		if name == 'tr':
+			close_row(table, match.start(), match.start() if not closing else match.end())
+			if not closing:
+				table['row'] = [match.start(), None, []]
+		elif table['row'] is not None:
+			close_cell(table, match.start())
+			if not closing:
+				table['cell'] = match.end()
+				table['text'] = []
+
+	# unclosed tables still get their rows considered
+	for table in stack:
+		close_row(table, len(template_string), len(template_string))
+		tables.append(table['rows'])
+
+	return tables
+
+
+def _loop_table_rows(iterable_tags, template_string):
+	tables = _find_table_rows(template_string)
+	insertions = []
+
+	for order, (tag, for_statement_params) in enumerate(iterable_tags):
+		iterator, iterable = for_statement_params
+		for_statement = "{{% for {0} in {1} %}}".format(iterator, iterable)
+		tag_re = re.compile("{" + tag)
+
+		for rows in tables:
+			# wrap each run of consecutive rows containing the tag in a for loop
+			run = []
+			for row in rows + [None]:
+				if row is not None and any(tag_re.search(cell) for cell in row[2]):
+					run.append(row)
+					continue
+				if run:
+					insertions.append((run[0][0], 1, order, for_statement))
+					insertions.append((run[-1][1], 0, -order, "{% endfor %}"))
+					run = []
+
+	if not insertions:
+		return template_string
+
+	output = []
+	position = 0
+	for index, _, __, statement in sorted(insertions):
+		output.append(template_string[position:index])
+		output.append(statement)
+		position = index
+	output.append(template_string[position:])
+	return "".join(output)
+
+
 def loop_table_rows(iterable_tags, template_string):
 	"""
 	A template preprocessing function that enables a special way of
-	iterating over values in a list of objects.  It searches for table cells
+	iterating over values in a list of objects.  It searches every table for cells
 	with particular tags and wraps the table row (and subsequent rows if they also contain the tags) with
-	a jinja for loop using the iterator, iterable tuple from 'iterable_tags'
-	Example:
+	a jinja for loop using the iterator, iterable tuple from 'iterable_tags'.  Results are cached
+	per (iterable_tags, template_string).
 
 	# Arguments:
-		iterable_tags (dict): mapping of
+		iterable_tags (dict): mapping of tag pattern to (iterator, iterable) tuple
 		template_string (str): jinja template string
 	# Returns:
 		string: transformed template string
@@ -46,7 +160,7 @@ def loop_table_rows(iterable_tags, template_string):
 		</table>
 	'''
 
-	>>> smores.utils.loop_table_rows(input)
+	>>> smores.utils.loop_table_rows(iterable_tags, input)
 	<table>
 		{% for mydogs in user.dogs %}
 			<tr>
@@ -59,25 +173,52 @@ def loop_table_rows(iterable_tags, template_string):
 	</table>
 	```
 	"""
-	from bs4 import BeautifulSoup
-	soup = BeautifulSoup(template_string, 'html.parser')
-	table = soup.find('table')
+	iterable_tags = tuple(sorted((tag, tuple(params)) for tag, params in iterable_tags.items()))
+	key = (iterable_tags, template_string)
 
-	for tag, for_statement_params in iterable_tags.items():
-		iterator, iterable = for_statement_params
-		for_statement = "{{% for {0} in {1} %}}".format(iterator, iterable)
-		td = table.find('td', string=re.compile("{" + tag))
-		rows = []
-		if td:
-			tr = td.parent
-			tr.insert_before(for_statement)
-			while True:
-				try:
-					found = tr.find_next_sibling().find('td', string=re.compile("{" + tag)).parent
-					if found:
-						rows.append(found)
-						tr = found
-				except Exception as e:
-					break
-			tr.insert_after("{% endfor %}")
-	return str(soup)
+	try:
+		return _loop_table_rows_cache[key]
+	except KeyError:
+		pass
+
+	result = _loop_table_rows(iterable_tags, template_string)
+
+	if len(_loop_table_rows_cache) >= _LOOP_TABLE_ROWS_CACHE_SIZE:
+		_loop_table_rows_cache.clear()
+	_loop_table_rows_cache[key] = result
+	return result
+
+
+def expand_tag_tree(tree):
+	"""
+	Expands a tree returned by Smores.get_tag_tree into the list of tags Smores.get_tags returns, ex. for a
+	client that downloads the tree but needs full tag paths
+
+	# Arguments:
+		tree (dict): result of get_tag_tree (or of json.loads on it)
+
+	# Returns:
+		list: sorted tag paths
+	"""
+	schemas = tree['schemas']
+
+	def expand(path, schema, ignore=None):
+		tags = [path + '.' + tag for tag in schema['tags']]
+		for name, nested in schema['nested'].items():
+			if ignore and name in ignore:
+				continue
+			nested_path = path + '.' + name + (':1' if nested['many'] else '')
+			# a recursive Nested field doesn't expand itself again one level down
+			for tag in expand(nested_path, schemas[nested['schema']], [name] if nested['self'] else None):
+				key = re.match(r'[^.:]*', tag[len(nested_path) + 1:]).group(0)
+				if (nested['only'] is None or key in nested['only']) and key not in nested['exclude']:
+					tags.append(tag)
+		return tags
+
+	tags = []
+	for root in tree['roots']:
+		schema = schemas[root]
+		if schema['default']:
+			tags.append(root)
+		tags.extend(expand(root, schema))
+	return sorted(tags)
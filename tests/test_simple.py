@@ -1,10 +1,19 @@
-from smores import Smores, AutocompleteResponse, __version__, Schema, Nested
+from smores import Smores, AutocompleteResponse, __version__, Schema, Nested, LRUCache, FragmentCache, TemplateString, UnknownTag, RenderLimits, RenderLimitExceeded, Metrics, to_prometheus, RenderProfile
 from smores.parser import to_jinja_template
-from smores.utils import loop_table_rows, get_module_schemas
+from smores.smores import get_schema_info, SchemaProxy, _SimpleTemplate
+from smores.utils import loop_table_rows, get_module_schemas, expand_tag_tree
+from smores.dumpers import compile_dumper, dump_plain
+from smores.snapshot import to_bytes, from_bytes
+from smores import cli
 from sample_data import users
 from create_db import User, db_session, select
 import pytest
-from marshmallow import fields
+import copy
+from collections import OrderedDict
+import json
+import time
+from marshmallow import fields, post_dump
+from jinja2 import TemplateSyntaxError
 import schemas_module
 
 
@@ -56,6 +65,60 @@ def test_render_default_template_with_models(smores_instance, input, output):
 		result = smores_instance.render(dict(user=users[0]), input)
 		assert result == output
 
+@pytest.mark.parametrize("input, output", default_template_cases)
+def test_render_default_template_lazy(smores_instance, input, output):
+	result = smores_instance.render(dict(user=users[0]), input, lazy=True)
+	assert result == output
+
+@pytest.mark.parametrize("input, output", default_template_cases)
+def test_render_default_template_lazy_with_models(smores_instance, input, output):
+	with db_session:
+		result = smores_instance.render(dict(user=User[1]), input, lazy=True)
+		assert result == smores_instance.render(dict(user=User[1]), input)
+
+nested_only_cases = [
+	("{onlyuser.company}", "Romaguera-Crona"),
+	("{onlyuser.companies.name}", "Romaguera-Crona"),
+	("{onlyuser.companies.bs}", ""),
+]
+
+@pytest.mark.parametrize("lazy", [False, True])
+@pytest.mark.parametrize("input, output", nested_only_cases)
+def test_render_nested_only(input, output, lazy):
+	class OnlyUser(Schema):
+		company = Nested(schemas_module.Company, only='name')
+		companies = Nested(schemas_module.Company, only=('name',), load_from='company', attribute='company')
+
+	smores = Smores()
+	with smores.with_schemas(OnlyUser):
+		assert smores.render(dict(onlyuser=users[0]), input, lazy=lazy) == output
+
+def test_lazy_render_only_serializes_accessed_fields(smores_instance):
+	class TrackedUser(dict):
+		accessed = set()
+		def __getitem__(self, key):
+			self.accessed.add(key)
+			return super(TrackedUser, self).__getitem__(key)
+
+	user = TrackedUser(users[0])
+	template = "{user.name}--{user.address.city}--{user.dogs:2.name}"
+	result = smores_instance.render(dict(user=user), template, lazy=True)
+	assert result == "Leanne Graham--Gwenborough--Snoopy"
+	assert user.accessed == {'name', 'address', 'dogs'}
+
+def test_lazy_render_root_with_processors():
+	class ShoutingUser(Schema):
+		name = fields.String()
+
+		@post_dump
+		def shout(self, data):
+			data['name'] = data['name'].upper()
+			return data
+
+	smores = Smores()
+	with smores.with_schemas(ShoutingUser):
+		assert smores.render(dict(shoutinguser=users[0]), "{shoutinguser.name}", lazy=True) == 'LEANNE GRAHAM'
+
 def test_access_list_with_no_default_template():
 	# creates schema with no _default_template and attempts to access it directly from a nested
 	# field with many = True
@@ -223,6 +286,62 @@ def test_repeating_table_rows_func(smores_instance):
 	expected_output = "<table>{% for mydogs in user.dogs %}<tr><td>{mydogs.name}</td></tr><tr><td>{mydogs.name}</td></tr>{% endfor %}</table>"
 	assert result == expected_output
 
+def test_repeating_table_rows_every_table():
+	iterable_tags = {
+		"mydogs.*": ("mydogs", "user.dogs")
+	}
+
+	template = ("<table><tr><td>{user.name}</td></tr><tr><td>{mydogs.name}</td></tr></table>"
+	            "<p>{user.email}</p>"
+	            "<table>\n\t<tr><td><b>{mydogs.name}</b></td></tr>\n\t<tr><td>{mydogs.name}</td></tr>\n</table>")
+
+	result = loop_table_rows(iterable_tags, template)
+	expected_output = ("<table><tr><td>{user.name}</td></tr>{% for mydogs in user.dogs %}<tr><td>{mydogs.name}</td></tr>{% endfor %}</table>"
+	                   "<p>{user.email}</p>"
+	                   "<table>\n\t{% for mydogs in user.dogs %}<tr><td><b>{mydogs.name}</b></td></tr>\n\t<tr><td>{mydogs.name}</td></tr>{% endfor %}\n</table>")
+	assert result == expected_output
+	assert loop_table_rows(iterable_tags, template) is result
+
+def test_repeating_table_rows_nested_table():
+	iterable_tags = {
+		"mydogs.*": ("mydogs", "user.dogs")
+	}
+
+	template = "<table><tr><td>{user.name}<table><tr><td>{mydogs.name}</td></tr></table></td></tr></table>"
+
+	result = loop_table_rows(iterable_tags, template)
+	expected_output = "<table><tr><td>{user.name}<table>{% for mydogs in user.dogs %}<tr><td>{mydogs.name}</td></tr>{% endfor %}</table></td></tr></table>"
+	assert result == expected_output
+
+def test_repeating_table_rows_list_values():
+	template = "<table><tr><td>{mydogs.name}</td></tr></table>"
+	assert loop_table_rows({"mydogs.*": ["mydogs", "user.dogs"]}, template) == \
+		loop_table_rows({"mydogs.*": ("mydogs", "user.dogs")}, template)
+
+def test_repeating_table_rows_render(smores_instance):
+	iterable_tags = {
+		"mydogs.*": ("mydogs", "user.dogs")
+	}
+
+	template = "<table><tr><td>{mydogs.name}</td></tr></table>"
+	pre_process = lambda t: loop_table_rows(iterable_tags, t)
+	result = smores_instance.render(dict(user=users[0]), template, pre_process=pre_process)
+	assert result == "<table><tr><td>Rufus</td></tr><tr><td>Snoopy</td></tr><tr><td>Scratch</td></tr><tr><td>Spot</td></tr></table>"
+
+def test_compiled_templates_cached_with_fresh_pre_process():
+	smores = Smores()
+	smores.add_module_schemas(schemas_module)
+	iterable_tags = {
+		"mydogs.*": ("mydogs", "user.dogs")
+	}
+
+	template = "<table><tr><td>{mydogs.name}</td></tr></table>"
+	for _ in range(3):
+		smores.render(dict(user=users[0]), template, pre_process=lambda t: loop_table_rows(iterable_tags, t))
+		smores.render(dict(user=users[0]), "{user.notatag}", fallback_value=lambda tag: tag)
+	assert len(smores._templates) == 2
+	assert smores._templates.stats['hits'] == 4
+
 # ------------------------------------------------------------------------------
 def test_render_preprocess_func(smores_instance):
 	def prepend_word(temp):
@@ -293,3 +412,1032 @@ def test_get_tags_method(smores_instance):
 		'user.website'
 	]
 	assert test_result == expected_result
+
+
+# ------------------------------------------------------------------------------
+def test_lru_cache_eviction_and_size_accounting():
+	cache = LRUCache(max_entries=2, max_bytes=10)
+	cache.set('a', u'aaaa')
+	cache.set('b', u'bbbb')
+	assert cache.get('a') == u'aaaa'
+	cache.set('c', u'cccc')
+	assert 'b' not in cache
+	assert cache.stats['bytes'] == 8
+	cache.set('d', u'dddddd')
+	assert 'a' not in cache and 'c' in cache and 'd' in cache
+	assert cache.stats['bytes'] == 10
+	cache.set('e', u'e' * 11)
+	assert 'e' not in cache
+
+def test_lru_cache_ttl_and_tags():
+	cache = LRUCache(ttl=0.05)
+	cache.set('a', 1, tags=['x'])
+	cache.set('b', 2, tags=['x', 'y'])
+	cache.set('c', 3, tags=['y'])
+	assert cache.invalidate('x') == 2
+	assert 'a' not in cache and 'b' not in cache and cache.get('c') == 3
+	time.sleep(0.06)
+	assert cache.get('c') is None
+
+@pytest.fixture
+def cached_smores_instance():
+	smores = Smores(render_cache=LRUCache())
+	smores.add_module_schemas(schemas_module)
+	return smores
+
+def test_render_cache_fingerprint(cached_smores_instance):
+	user = copy.deepcopy(users[0])
+	assert cached_smores_instance.render(dict(user=user), "{user.name}") == 'Leanne Graham'
+	assert cached_smores_instance.render(dict(user=user), "{user.name}") == 'Leanne Graham'
+	assert cached_smores_instance.render_cache.stats['hits'] == 1
+
+	user['name'] = 'Someone Else'
+	assert cached_smores_instance.render(dict(user=user), "{user.name}") == 'Someone Else'
+	assert cached_smores_instance.render_cache.stats['entries'] == 2
+
+def test_render_cache_key_and_invalidate(cached_smores_instance):
+	user = copy.deepcopy(users[0])
+	template = "{user.name}"
+	assert cached_smores_instance.render(dict(user=user), template, cache_key=dict(user=1)) == 'Leanne Graham'
+
+	user['name'] = 'Someone Else'
+	assert cached_smores_instance.render(dict(user=user), template, cache_key=dict(user=1)) == 'Leanne Graham'
+
+	assert cached_smores_instance.invalidate('user', 1) == 1
+	assert cached_smores_instance.render(dict(user=user), template, cache_key=dict(user=1)) == 'Someone Else'
+
+def test_render_cache_skips_models_without_key(cached_smores_instance):
+	with db_session:
+		assert cached_smores_instance.render(dict(user=User[1]), "{user.name}") == 'Leanne Graham'
+		assert cached_smores_instance.render_cache.stats['entries'] == 0
+		assert cached_smores_instance.render(dict(user=User[1]), "{user.name}", cache_key=1) == 'Leanne Graham'
+		assert cached_smores_instance.render_cache.stats['entries'] == 1
+		assert cached_smores_instance.invalidate('user', 1) == 1
+
+# ------------------------------------------------------------------------------
+@pytest.mark.parametrize("lazy", [False, True])
+def test_fragment_cache_shared_objects(lazy):
+	smores = Smores(fragment_cache=FragmentCache())
+	smores.add_module_schemas(schemas_module)
+
+	company = users[0]['company']
+	first, second = copy.deepcopy(users[0]), copy.deepcopy(users[1])
+	first['company'] = second['company'] = company
+
+	expected = "Romaguera-Crona---Multi-layered client-server neural-net---harness real-time e-markets"
+	with smores.fragment_cache.batch():
+		assert smores.render(dict(user=first), "{user.company}", lazy=lazy) == expected
+		assert smores.render(dict(user=second), "{user.company}", lazy=lazy) == expected
+		counters = smores.fragment_cache.counters['Company._default_template']
+		assert counters['misses'] == 1 and counters['hits'] >= 1
+	assert len(smores.fragment_cache) == 0
+
+def test_fragment_cache_identity_only_within_batch():
+	smores = Smores(fragment_cache=FragmentCache())
+	smores.add_module_schemas(schemas_module)
+
+	user = copy.deepcopy(users[0])
+	assert smores.render(dict(user=user), "{user}") == "Leanne Graham---Sincere@april.biz"
+	assert len(smores.fragment_cache) == 0
+
+	user['name'] = 'Someone Else'
+	assert smores.render(dict(user=user), "{user}") == "Someone Else---Sincere@april.biz"
+
+def test_fragment_cache_key():
+	class CachedCompany(Schema):
+		name = fields.String()
+		_default_template = TemplateString("{{name}}", cache_key=lambda obj: obj['name'])
+
+	class CachedUser(Schema):
+		company = Nested(CachedCompany)
+
+	smores = Smores(fragment_cache=FragmentCache())
+	with smores.with_schemas([CachedCompany, CachedUser]):
+		for user in users[:3]:
+			assert smores.render(dict(cacheduser=user), "{cacheduser.company}") == user['company']['name']
+		assert smores.render(dict(cacheduser=copy.deepcopy(users[0])), "{cacheduser.company}") == users[0]['company']['name']
+	assert smores.fragment_cache.counters['CachedCompany._default_template'] == dict(hits=1, misses=3)
+
+# ------------------------------------------------------------------------------
+session_fragments = [c[0] for c in autocomplete_cases] + [
+	"User.Dogs:2.Dog.Name", "user.dogs:1.dog.dog.with_greeting", "user.dogs:1:2.name", "user..name",
+	"user.dogs:.name", "user.address.geo.lat", "user.company.catchphrase", "dog.dog.dog", "address.geo.x.y",
+]
+
+@pytest.mark.parametrize("only, exclude", [(None, None), (['address'], None), (None, ['address'])])
+def test_autocomplete_session_matches_autocomplete(smores_instance, only, exclude):
+	session = smores_instance.autocomplete_session(only=only, exclude=exclude)
+	for fragment in session_fragments:
+		# type the fragment a keystroke at a time, then delete it again
+		keystrokes = [fragment[:i] for i in range(len(fragment) + 1)]
+		for partial in keystrokes + keystrokes[::-1]:
+			expected = smores_instance.autocomplete(partial, only=only, exclude=exclude)
+			assert session.autocomplete(partial) == expected, partial
+
+def test_autocomplete_session_schema_changes(smores_instance):
+	class Event(Schema):
+		tech = fields.String()
+
+	session = smores_instance.autocomplete_session()
+	assert session.autocomplete('event.t') == AutocompleteResponse('INVALID', [], "")
+	with smores_instance.with_schemas(Event):
+		assert session.autocomplete('event.t') == AutocompleteResponse('INVALID', ['tech'], "event")
+
+# ------------------------------------------------------------------------------
+def test_schema_info():
+	info = get_schema_info(schemas_module.User)
+	assert info is get_schema_info(schemas_module.User())
+	assert info.name == 'user'
+	assert info.template_fields == {'_default_template', 'basic', 'long_template'}
+	assert info.nested['dogs'].many and not info.nested['dogs'].is_self
+	assert info.nested_info('dogs') is get_schema_info(schemas_module.Dog)
+	assert get_schema_info(schemas_module.Dog).nested['dog'].is_self
+	assert get_schema_info(schemas_module.Company).fields['catchphrase'] == 'catchPhrase'
+
+def test_schema_info_invalidated_on_registration():
+	class InfoPet(Schema):
+		name = fields.String()
+
+	class InfoOwner(Schema):
+		pet = Nested('InfoPet')
+
+	info = get_schema_info(InfoOwner)
+	user_info = get_schema_info(schemas_module.User)
+
+	class Unrelated(Schema):
+		name = fields.String()
+
+	assert get_schema_info(InfoOwner) is info
+	assert get_schema_info(schemas_module.User) is user_info
+
+	class InfoPet(Schema):
+		nickname = fields.String()
+
+	assert get_schema_info(InfoOwner) is not info
+	assert get_schema_info(InfoOwner) == info
+	assert get_schema_info(schemas_module.User) is user_info
+	assert info.nested_info('pet').field_names == ('nickname',)
+
+def test_autocomplete_does_not_instantiate_schemas(smores_instance, monkeypatch):
+	def fail(*args, **kwargs):
+		raise AssertionError('schema instantiated')
+
+	smores_instance.autocomplete('user.dogs:1.dog.name')
+	monkeypatch.setattr(Schema, '__init__', fail)
+	assert smores_instance.autocomplete('user.dogs:1.dog.name') == AutocompleteResponse('VALID', [], "user.dogs:1.dog.name")
+	assert smores_instance.get_tags(only=['dog']) == ['dog', 'dog.dog.name', 'dog.dog.with_greeting', 'dog.name', 'dog.with_greeting']
+
+# ------------------------------------------------------------------------------
+def test_class_registry_replaces_and_resolves():
+	from smores import class_registry
+	first = type('RegistryDog', (Schema,), dict(name=fields.String()))
+	second = type('RegistryDog', (Schema,), dict(name=fields.String()))
+	assert class_registry.get_class('RegistryDog') is second
+	assert class_registry.get_class('%s.RegistryDog' % second.__module__) is second
+
+def test_class_registry_keeps_schemas_referred_to_by_name():
+	import gc
+
+	def make_schemas():
+		class InnerX(Schema):
+			name = fields.String()
+
+		class OuterX(Schema):
+			inner = Nested('InnerX')
+			later = Nested('LaterX')
+
+		# defined after the schema referring to it
+		class LaterX(Schema):
+			name = fields.String()
+
+		return OuterX
+
+	outer = make_schemas()
+	gc.collect()
+	smores = Smores()
+	data = dict(outerx=dict(inner=dict(name='Rex'), later=dict(name='Max')))
+	with smores.with_schemas(outer):
+		assert smores.render(data, "{outerx.inner.name} {outerx.later.name}") == 'Rex Max'
+
+def test_class_registry_releases_throwaway_schemas():
+	import gc
+	import weakref
+	from smores import class_registry
+	from smores.smores import SmoresSchemaMeta
+
+	def count_schemas():
+		gc.collect()
+		return len([o for o in gc.get_objects() if isinstance(o, SmoresSchemaMeta)])
+
+	def render_with_throwaway_schemas(i):
+		class ThrowawayDog(Schema):
+			name = fields.String()
+
+		class ThrowawayUser(Schema):
+			dogs = Nested('ThrowawayDog', many=True)
+			_default_template = TemplateString("{{dogs|length}}")
+
+		smores = Smores()
+		with smores.with_schemas([ThrowawayDog, ThrowawayUser]):
+			assert smores.autocomplete('throwawayuser.dogs:1.n').options == ['name']
+			if i % 50 == 0:
+				assert smores.render(dict(throwawayuser=users[0]), "{throwawayuser}") == '4'
+		return weakref.ref(ThrowawayUser)
+
+	render_with_throwaway_schemas(0)
+	baseline = count_schemas()
+	refs = [render_with_throwaway_schemas(i) for i in range(2000)]
+
+	assert count_schemas() <= baseline
+	assert not any(ref() for ref in refs)
+	assert 'ThrowawayDog' not in class_registry._registry or not len(class_registry._registry['ThrowawayDog'])
+	assert len(class_registry._fullpaths) < 1000
+
+# ------------------------------------------------------------------------------
+validate_cases = [
+	("{user} {User.Name} {user.dogs} {user.dogs:2.dog.name} {user.address} {address.geo.lat} { user.company}", []),
+	# user.address is a marshmallow Nested, not walked into by get_tags and autocomplete either
+	("{user.address.geo.lat}", [UnknownTag('user.address.geo.lat', 0, 22, 'user.address')]),
+	("Hi {user.name}, see {user.adress.city}", [UnknownTag('user.adress.city', 20, 38, 'user')]),
+	("{user.dogs.name}", [UnknownTag('user.dogs.name', 0, 16, 'user')]),
+	("{user.name:1}", [UnknownTag('user.name:1', 0, 13, 'user')]),
+	("{user.name.first}", [UnknownTag('user.name.first', 0, 17, 'user.name')]),
+	("{user.dogs:1.garbage}", [UnknownTag('user.dogs:1.garbage', 0, 21, 'user.dogs:1')]),
+	("{nobody.name} {user:1}", [UnknownTag('nobody.name', 0, 13, ''), UnknownTag('user:1', 14, 22, '')]),
+	("{user.dogs:0.name}", [UnknownTag('user.dogs:0.name', 0, 18, 'user')]),
+	("{{ user.name }} {% if user %}{user.id}{% endif %} {user.name }", []),
+]
+
+@pytest.mark.parametrize("template, output", validate_cases)
+def test_validate(smores_instance, template, output):
+	assert smores_instance.validate(template) == output
+
+def test_validate_agrees_with_get_tags_and_autocomplete(smores_instance):
+	tags = smores_instance.get_tags()
+	for tag in ['user.address', 'user.address.city', 'user.address.geo', 'address.geo.lat', 'user.company.name']:
+		valid = smores_instance.validate('{%s}' % tag) == []
+		assert valid == (tag in tags)
+		assert valid == (smores_instance.autocomplete(tag).tagStatus == 'VALID')
+
+def test_validate_nested_only_and_exclude():
+	class ValidCompany(Schema):
+		name = fields.String()
+		bs = fields.String()
+
+	class ValidUser(Schema):
+		comps = Nested(ValidCompany, only=('name',))
+		others = Nested(ValidCompany, exclude=('bs',))
+
+	smores = Smores()
+	with smores.with_schemas(ValidUser):
+		assert smores.validate("{validuser.comps.name}{validuser.others.name}") == []
+		assert smores.validate("{validuser.comps.bs}{validuser.others.bs}") == [
+			UnknownTag('validuser.comps.bs', 0, 20, 'validuser.comps'),
+			UnknownTag('validuser.others.bs', 20, 41, 'validuser.others'),
+		]
+
+def test_validate_only_and_many(smores_instance):
+	assert smores_instance.validate("{user.name}{address.city}", only=['address']) == [UnknownTag('user.name', 0, 11, '')]
+	templates = dict((str(i), template) for i, (template, _) in enumerate(validate_cases))
+	assert smores_instance.validate_many(templates) == dict((str(i), output) for i, (_, output) in enumerate(validate_cases))
+	assert smores_instance.validate_many([t for t, _ in validate_cases]) == [o for _, o in validate_cases]
+
+# ------------------------------------------------------------------------------
+def test_render_limit_loop_iterations(smores_instance):
+	template = "{% for d in user.dogs %}{d.name}{% endfor %}"
+	limits = RenderLimits(max_loop_iterations=4)
+	assert smores_instance.render(dict(user=users[0]), template, limits=limits) == "RufusSnoopyScratchSpot"
+	with pytest.raises(RenderLimitExceeded) as error:
+		smores_instance.render(dict(user=users[0]), template, limits=RenderLimits(max_loop_iterations=3))
+	assert error.value.limit == 'max_loop_iterations'
+
+def test_render_limit_loop_iterations_in_template_strings():
+	class Counter(Schema):
+		_default_template = TemplateString("{% for i in range(50) %}{{ i }}{% endfor %}")
+
+	smores = Smores(limits=RenderLimits(max_loop_iterations=10))
+	with smores.with_schemas(Counter):
+		with pytest.raises(RenderLimitExceeded):
+			smores.render(dict(counter={}), "{counter}")
+
+def test_render_limit_output_bytes(smores_instance):
+	template = "{user.name}" * 10
+	assert smores_instance.render(dict(user=users[0]), template, limits=RenderLimits(max_output_bytes=130))
+	with pytest.raises(RenderLimitExceeded) as error:
+		smores_instance.render(dict(user=users[0]), template, limits=RenderLimits(max_output_bytes=129))
+	assert error.value.limit == 'max_output_bytes'
+
+def test_render_limit_time():
+	class Slow(Schema):
+		_default_template = TemplateString("{% for i in range(10000) %}{% for j in range(10000) %}{% endfor %}{% endfor %}")
+
+	smores = Smores()
+	with smores.with_schemas(Slow):
+		started = time.time()
+		with pytest.raises(RenderLimitExceeded) as error:
+			smores.render(dict(slow={}), "{slow}", limits=RenderLimits(max_time=0.05))
+		assert error.value.limit == 'max_time'
+		assert time.time() - started < 1
+
+def test_render_limit_depth(smores_instance):
+	dog = dict(name='Rufus')
+	for i in range(3):
+		dog = dict(name='Rufus %s' % i, dog=dog)
+
+	assert smores_instance.render(dict(dog=dog), "{dog.name}", limits=RenderLimits(max_depth=25)) == 'Rufus 2'
+	with pytest.raises(RenderLimitExceeded) as error:
+		smores_instance.render(dict(dog=dog), "{dog.name}", limits=RenderLimits(max_depth=2))
+	assert error.value.limit == 'max_depth'
+
+def test_render_limit_depth_lazy(smores_instance):
+	dog = dict(name='Rufus')
+	for i in range(10):
+		dog = dict(name='R%s' % i, dog=dog)
+
+	template = "{dog.dog.dog.dog.name}"
+	assert smores_instance.render(dict(dog=dog), template, lazy=True, limits=RenderLimits(max_depth=3)) == 'R6'
+	with pytest.raises(RenderLimitExceeded) as error:
+		smores_instance.render(dict(dog=dog), "{dog.dog.dog.dog.dog.name}", lazy=True, limits=RenderLimits(max_depth=3))
+	assert error.value.limit == 'max_depth'
+
+def test_render_limit_checks_repetition_up_front(smores_instance):
+	started = time.time()
+	with pytest.raises(RenderLimitExceeded) as error:
+		smores_instance.render({}, "{{ 'x' * 50000000 }}", limits=RenderLimits(max_output_bytes=100, max_time=0.01))
+	assert error.value.limit == 'max_output_bytes'
+	assert time.time() - started < 0.5
+	assert smores_instance.render({}, "{{ 'x' * 3 }}{{ 2 ** 3 }}", limits=RenderLimits(max_output_bytes=100)) == 'xxx8'
+
+# ------------------------------------------------------------------------------
+def test_metrics():
+	metrics = Metrics()
+	smores = Smores(metrics=metrics)
+	smores.add_module_schemas(schemas_module)
+
+	smores.render(dict(user=users[0]), "{user}", template_name='greeting')
+	smores.render(dict(user=users[1]), "{user}", template_name='greeting')
+	with pytest.raises(RenderLimitExceeded):
+		smores.render(dict(user=users[0]), "{user}", template_name='greeting', limits=RenderLimits(max_output_bytes=1))
+	smores.autocomplete('user.dogs')
+	smores.get_tags()
+
+	snapshot = metrics.snapshot()
+	counters, histograms = snapshot['counters'], snapshot['histograms']
+	assert counters['smores_renders_total'] == {(('template', 'greeting'),): 2}
+	assert counters['smores_render_errors_total'] == {(('error', 'RenderLimitExceeded'), ('template', 'greeting')): 1}
+	assert counters['smores_template_cache_total'] == {(('result', 'miss'),): 1, (('result', 'hit'),): 2}
+	assert histograms['smores_render_seconds'][(('template', 'greeting'),)]['count'] == 3
+	assert histograms['smores_dump_seconds'][(('schema', 'User'),)]['count'] == 3
+	assert histograms['smores_template_field_seconds'][(('field', 'User._default_template'),)]['count'] == 3
+	assert histograms['smores_autocomplete_seconds'][()]['count'] == 1
+	assert histograms['smores_get_tags_seconds'][()]['count'] == 1
+
+	text = to_prometheus(metrics)
+	assert '# TYPE smores_renders_total counter\nsmores_renders_total{template="greeting"} 2\n' in text
+	assert 'smores_render_seconds_bucket{template="greeting",le="+Inf"} 3\n' in text
+	assert 'smores_render_seconds_count{template="greeting"} 3\n' in text
+
+	metrics.reset()
+	assert metrics.snapshot() == dict(counters={}, histograms={})
+
+def test_metrics_histogram_buckets():
+	metrics = Metrics(buckets=(1, 2))
+	for value in (0.5, 1.5, 1.5, 3):
+		metrics.observe('latency', value, dict(path='a"b'))
+	histogram = metrics.snapshot()['histograms']['latency'][(('path', 'a"b'),)]
+	assert histogram == dict(count=4, sum=6.5, buckets=[(1, 1), (2, 3), (float('inf'), 4)])
+	assert 'latency_bucket{path="a\\"b",le="2"} 3' in to_prometheus(metrics)
+
+# ------------------------------------------------------------------------------
+import datetime
+import decimal
+
+class DumperTag(Schema):
+	label = fields.String(dump_to='Label')
+	weight = fields.Integer()
+
+class DumperRecord(Schema):
+	title = fields.String(attribute='name')
+	city = fields.String(attribute='address.city')
+	missing_default = fields.String(default='n/a')
+	missing_callable = fields.Integer(default=lambda: 7)
+	price = fields.Decimal(places=2, as_string=True)
+	created = fields.DateTime()
+	email = fields.Email()
+	secret = fields.String(load_only=True)
+	raw = fields.Raw()
+	shout = fields.Method('get_shout')
+	tags = fields.Nested(DumperTag, many=True, exclude=('weight',))
+	labels = Nested(DumperTag, only='label', many=True, attribute='tags')
+	parent = Nested('self', only=('title', 'parent'))
+	summary = TemplateString("{{ title }} ({{ tags|length }})")
+
+	def get_shout(self, obj):
+		return obj['name'].upper()
+
+dumper_records = [
+	dict(name='a', address=dict(city='Paris'), price='1.5', created=datetime.datetime(2020, 1, 2), email='a@b.co',
+	     secret='x', raw=[1, {'b': 2}], tags=[dict(label='x', weight=1), dict(label='y')], parent=dict(name='p', parent=dict(name='q'))),
+	dict(name=u'\xe9t\xe9', address=dict(), price=decimal.Decimal('3'), email='not an email', tags=[], parent=None),
+]
+
+def _dump_both(smores, schema_class, obj, **kwargs):
+	expected = schema_class(context=dict(env=smores.env), **kwargs).dump(obj).data
+	compiled = compile_dumper(schema_class(context=dict(env=smores.env, compiled_dumps=True), **kwargs))(obj)
+	return expected, compiled
+
+@pytest.mark.parametrize("obj", dumper_records)
+@pytest.mark.parametrize("kwargs", [{}, dict(only=('title', 'tags', 'summary')), dict(exclude=('parent',)), dict(many=True)])
+def test_compiled_dumper_matches_dump(smores_instance, obj, kwargs):
+	obj = [obj, obj] if kwargs.get('many') else obj
+	expected, compiled = _dump_both(smores_instance, DumperRecord, obj, **kwargs)
+	assert compiled == expected
+
+@pytest.mark.parametrize("user", users)
+def test_compiled_dumper_matches_dump_sample_data(smores_instance, user):
+	for schema_class in (schemas_module.User, schemas_module.Dog, schemas_module.Address):
+		expected, compiled = _dump_both(smores_instance, schema_class, user)
+		assert compiled == expected
+
+def test_compiled_dumper_matches_dump_models(smores_instance):
+	with db_session:
+		for user in select(u for u in User):
+			expected, compiled = _dump_both(smores_instance, schemas_module.User, user)
+			assert compiled == expected
+
+@pytest.mark.parametrize("input, output", default_template_cases + non_default_template_strings)
+def test_render_compiled_dumps(smores_instance, input, output):
+	smores = Smores(compiled_dumps=True)
+	smores.add_module_schemas(schemas_module)
+	assert smores.render(dict(user=users[0]), input) == output
+	with db_session:
+		assert smores.render(dict(user=User[1]), input) == smores_instance.render(dict(user=User[1]), input)
+
+# ------------------------------------------------------------------------------
+@pytest.mark.parametrize("input, output", default_template_cases + non_default_template_strings)
+def test_render_plain(smores_instance, input, output):
+	assert smores_instance.render(dict(user=users[0]), input, plain=True) == output
+	with db_session:
+		assert smores_instance.render(dict(user=User[1]), input, plain=True) == smores_instance.render(dict(user=User[1]), input)
+
+def test_dump_plain_matches_dump(smores_instance):
+	record = dumper_records[0]
+	schema = DumperRecord(context=dict(env=smores_instance.env))
+	assert dump_plain(schema, record) == schema.dump(record).data
+	assert dump_plain(schema, record)['price'] == '1.50'
+
+	# values of simple fields are used as is, without validation
+	invalid = dumper_records[1]
+	assert dump_plain(schema, invalid)['email'] == 'not an email'
+	assert 'email' not in schema.dump(invalid).data
+
+@pytest.mark.parametrize("options, render_options", [({}, {}), ({}, dict(lazy=True)),
+                                                     (dict(compiled_dumps=True), {}), ({}, dict(plain=True))])
+def test_render_schema_processors(options, render_options):
+	class ProcCompany(Schema):
+		name = fields.String()
+
+		@post_dump
+		def shout(self, data):
+			data['name'] = data['name'].upper()
+			return data
+
+	class ProcUser(Schema):
+		company = Nested(ProcCompany)
+
+	smores = Smores(**options)
+	data = dict(procuser=dict(company=dict(name='acme')), proccompany=dict(name='acme'))
+	with smores.with_schemas([ProcUser, ProcCompany]):
+		assert smores.render(data, "{procuser.company.name} {proccompany.name}", **render_options) == 'ACME ACME'
+
+def test_render_plain_schema_meta():
+	class PlainCompany(Schema):
+		name = fields.String()
+		since = fields.Date()
+		_default_template = TemplateString("{{ name }} {{ since }}")
+
+		class Meta:
+			plain_dicts = True
+
+	class PlainUser(Schema):
+		name = fields.Email()
+		company = Nested(PlainCompany)
+
+	smores = Smores()
+	data = dict(plainuser=dict(name='not an email', company=dict(name=1, since=datetime.date(2020, 1, 2))))
+	with smores.with_schemas([PlainUser, PlainCompany]):
+		assert PlainCompany.opts.plain_dicts and not PlainUser.opts.plain_dicts
+		assert smores.render(data, "{plainuser.name}|{plainuser.company}") == "|1 2020-01-02"
+		assert smores.render(data, "{plainuser.name}|{plainuser.company}", plain=True) == "not an email|1 2020-01-02"
+		assert smores.render(data, "{plainuser.name}|{plainuser.company}", plain=False) == "|1 2020-01-02"
+
+# ------------------------------------------------------------------------------
+def _user_columns():
+	paths = ['id', 'name', 'email', 'phone', 'website', 'address.street', 'address.city', 'address.suite',
+	         'address.zipcode', 'address.geo.lat', 'address.geo.lng', 'company.name', 'company.catchPhrase', 'company.bs']
+
+	def value(user, path):
+		for attr in path.split('.'):
+			user = user[attr]
+		return user
+
+	return dict((path, tuple(value(user, path) for user in users)) for path in paths)
+
+@pytest.mark.parametrize("template", [
+	"{user}", "{user.address}", "{user.company}", "{user.basic}", "{user.long_template}",
+	"{user.name} {user.address.geo.lat} {user.COMPANY.catchphrase} {user.nope}",
+	"{% if user.id > 5 %}{user.name}{% endif %}",
+])
+def test_render_columns(smores_instance, template):
+	outputs = smores_instance.render_columns(_user_columns(), template)
+	assert not isinstance(outputs, list)
+	assert list(outputs) == [smores_instance.render(dict(user=user), template) for user in users]
+
+@pytest.mark.parametrize("order", [1, -1])
+def test_render_columns_exact_column_first(order):
+	columns = OrderedDict(sorted(dict(address=['here'], **{'address.city': ['there']}).items())[::order])
+	smores = Smores()
+	smores.add_module_schemas(schemas_module)
+	assert list(smores.render_columns(columns, "{user.address}|{user.address.city}")) == ['here|']
+
+def test_render_columns_template_fields_use_render_wrappers():
+	metrics = Metrics()
+	smores = Smores(fragment_cache=FragmentCache(), metrics=metrics)
+	smores.add_module_schemas(schemas_module)
+	columns = _user_columns()
+
+	assert list(smores.render_columns(columns, "{user.basic}")) == [smores.render(dict(user=user), "{user.basic}")
+	                                                                for user in users]
+	assert smores.fragment_cache.counters['User.basic']['misses'] == 2 * len(users)
+	field_seconds = metrics.snapshot()['histograms']['smores_template_field_seconds']
+	assert field_seconds[(('field', 'User.basic'),)]['count'] == 2 * len(users)
+	with pytest.raises(RenderLimitExceeded):
+		list(smores.render_columns(columns, "{user.basic}", limits=RenderLimits(max_depth=0)))
+
+def test_render_columns_without_schema_and_limits(smores_instance):
+	columns = dict(name=['a', 'b', 'c'], score=[1, 2, 3])
+	assert list(smores_instance.render_columns(columns, "{row.name}={row.score}", root='row')) == ['a=1', 'b=2', 'c=3']
+	with pytest.raises(RenderLimitExceeded):
+		list(smores_instance.render_columns(columns, "{row.name}", root='row', limits=RenderLimits(max_output_bytes=0)))
+	with pytest.raises(ValueError):
+		list(smores_instance.render_columns(dict(name=['a'], score=[]), "{row.name}", root='row'))
+
+# ------------------------------------------------------------------------------
+incremental_template = """Hi {user.name}!
+{user}
+{% for dog in user.dogs %}{dog.name}, {% endfor %}
+{{ user.company.name|upper }} {user.address.city} {user.address}
+"""
+
+def test_render_incremental(smores_instance):
+	user = copy.deepcopy(users[0])
+	data = dict(user=user)
+	preview = smores_instance.render_incremental(data, incremental_template)
+	assert preview.output == smores_instance.render(data, incremental_template)
+
+	user['name'] = 'Someone Else'
+	assert preview.update(['user.name']) == smores_instance.render(data, incremental_template)
+	assert 'Someone Else---Sincere@april.biz' in preview.output
+
+	user['dogs'][1]['name'] = 'Lassie'
+	user['address']['city'] = 'Paris'
+	assert preview.update(['user.dogs:2.name', 'User.Address.City']) == smores_instance.render(data, incremental_template)
+
+	data['user'] = copy.deepcopy(users[1])
+	assert preview.update(['user']) == smores_instance.render(data, incremental_template)
+
+def test_render_incremental_only_rerenders_affected_segments(smores_instance):
+	class TrackedUser(dict):
+		accessed = []
+		def __getitem__(self, key):
+			self.accessed.append(key)
+			return super(TrackedUser, self).__getitem__(key)
+
+	user = TrackedUser(copy.deepcopy(users[0]))
+	preview = smores_instance.render_incremental(dict(user=user), "{user.name} {user.website} {user.address.city}")
+	del TrackedUser.accessed[:]
+
+	user['website'] = 'example.org'
+	assert preview.update(['user.website']) == 'Leanne Graham example.org Gwenborough'
+	assert TrackedUser.accessed == ['website']
+	assert preview.update([]) == preview.output and TrackedUser.accessed == ['website']
+
+@pytest.mark.parametrize("template, changed, change", [
+	("{user.long_template}", 'user.phone', lambda user: user.update(phone='555-0100')),
+	("{user.basic}", 'user.name', lambda user: user.update(name='Someone Else')),
+	("{user.dogs:1.with_greeting}", 'user.dogs:1.name', lambda user: user['dogs'][0].update(name='Lassie')),
+])
+def test_render_incremental_template_fields(smores_instance, template, changed, change):
+	user = copy.deepcopy(users[0])
+	data = dict(user=user)
+	preview = smores_instance.render_incremental(data, template)
+	before = preview.output
+	change(user)
+	assert preview.update([changed]) == smores_instance.render(data, template) != before
+
+@pytest.mark.parametrize("template", [
+	"{% set name = user.name %}{{ name }} {user.email}",
+	"{%- if user %} {user.name} {% endif -%} !",
+	"{# comment #}{user.name}\n\n",
+])
+def test_render_incremental_whole_template_segments(smores_instance, template):
+	user = copy.deepcopy(users[0])
+	data = dict(user=user)
+	preview = smores_instance.render_incremental(data, template)
+	assert preview.output == smores_instance.render(data, template)
+	user['name'] = 'Someone Else'
+	assert preview.update(['user.name']) == smores_instance.render(data, template)
+
+# ------------------------------------------------------------------------------
+simple_template_cases = [t for t, _ in default_template_cases + non_default_template_strings] + [
+	"Hi {User.Name}, {user.dogs:1.name} {user.dogs:2} {user.dogs:9.name} {user.dogs:0.name}\n",
+	"{ user.company} {nobody.name} {user.name.first} {range} {user.address.geo.lat:1}\n\n",
+	"{user.website} {user.id} }} { not a tag } {user.notarealtag}",
+]
+
+@pytest.mark.parametrize("fallback_value", [None, "INVALID_TAG", lambda tag: "!!%s!!" % tag])
+@pytest.mark.parametrize("template", simple_template_cases)
+def test_simple_templates_match_jinja(smores_instance, template, fallback_value):
+	compiled = smores_instance._get_template(template, fallback_value)
+	assert isinstance(compiled, _SimpleTemplate)
+	jinja_template = smores_instance.env.from_string(to_jinja_template(template, default=fallback_value))
+
+	user = copy.deepcopy(users[0])
+	user['website'] = None
+	for lazy in (False, True):
+		schema = schemas_module.User(context=dict(env=smores_instance.env))
+		context = dict(user=SchemaProxy(schema, user) if lazy else schema.dump(user).data)
+		assert compiled.render(**context) == jinja_template.render(**context)
+
+def _render_outcome(template, context):
+	try:
+		return template.render(**context)
+	except Exception as e:
+		return type(e), str(e)
+
+@pytest.mark.parametrize("template", [
+	"{user.dogs:2.name}", "{user.dogs:2}", "{nobody.name:1}", "{nobody.name.first}", "{user.name:1.x}",
+	"{user.address.geo.lat:1.x}", "{{user}}", "{user.name}{{user.name}}", "{user.name} {{ user", "{{user.name}",
+])
+def test_simple_templates_match_jinja_errors(smores_instance, template):
+	jinja_source = to_jinja_template(template)
+	try:
+		jinja_template = smores_instance.env.from_string(jinja_source)
+	except TemplateSyntaxError:
+		# syntax spanning the tags leaves the template to jinja, which raises the same error
+		with pytest.raises(TemplateSyntaxError):
+			smores_instance._get_template(template)
+		return
+
+	compiled = smores_instance._get_template(template)
+	assert isinstance(compiled, _SimpleTemplate)
+	user = copy.deepcopy(users[0])
+	del user['dogs']
+	schema = schemas_module.User(context=dict(env=smores_instance.env))
+	for context in (dict(user=schema.dump(user).data), dict(user=SchemaProxy(schema, user))):
+		assert _render_outcome(compiled, context) == _render_outcome(jinja_template, context)
+
+@pytest.mark.parametrize("template", ["{% if user %}{user.name}{% endif %}", "{{ user.name }}", "{# {user.name} #}",
+                                      "{user.name} {% raw %}{user.name}{% endraw %}"])
+def test_templates_with_jinja_syntax_use_jinja(smores_instance, template):
+	assert not isinstance(smores_instance._get_template(template), _SimpleTemplate)
+
+def test_autocomplete_keeps_index_tags(smores_instance):
+	smores_instance.autocomplete("user.dogs:1.na")
+	assert to_jinja_template("{user.dogs:1.name}") == "{{user.dogs[0].name | default('')}}"
+
+def test_get_tags_many_within_many():
+	class TagLeaf(Schema):
+		label = fields.String()
+
+	class TagBranch(Schema):
+		leaves = Nested(TagLeaf, many=True)
+
+	class TagTree(Schema):
+		branches = Nested(TagBranch, many=True)
+
+	smores = Smores()
+	smores.add_schemas([TagLeaf, TagBranch, TagTree])
+	assert 'tagtree.branches:1.leaves:1.label' in smores.get_tags()
+
+# ------------------------------------------------------------------------------
+def _write_records(tmpdir, records):
+	path = tmpdir.join('records.jsonl')
+	path.write('\n'.join(record if isinstance(record, str) else json.dumps(record) for record in records) + '\n\n')
+	return str(path)
+
+def test_cli_jsonl(tmpdir, capsys):
+	path = _write_records(tmpdir, users[:2] + ['{"name": not json}'])
+	status = cli.main(['--schemas', schemas_module.__name__, '--root', 'user', '--input', path,
+	                   '--template', '{user.name} <{user.email}>', '--name-key', 'id'])
+	out, err = capsys.readouterr()
+	results = [json.loads(line) for line in out.splitlines()]
+
+	assert status == 1
+	assert results[:2] == [dict(line=1, name=1, output='Leanne Graham <Sincere@april.biz>'),
+	                       dict(line=2, name=2, output='Ervin Howell <Shanna@melissa.tv>')]
+	assert results[2]['line'] == 3 and 'error' in results[2]
+	assert 'rendered 2 records (1 failed)' in err
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_cli_output_dir(tmpdir, capsys, workers):
+	path = _write_records(tmpdir, [dict(user=user) for user in users])
+	output_dir = tmpdir.join('out')
+	status = cli.main(['--schemas', schemas_module.__name__, '--input', path, '--template', '{user.name}',
+	                   '--output-dir', str(output_dir), '--workers', str(workers), '--chunk-size', '2'])
+
+	assert status == 0
+	assert sorted(f.basename for f in output_dir.listdir()) == sorted('%s.txt' % i for i in range(1, len(users) + 1))
+	assert output_dir.join('2.txt').read() == users[1]['name']
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_cli_output_dir_name_collisions(tmpdir, workers):
+	ids = [1, 1, '../1', 'a/b', 'a_b', 'A_B', '1-2', '']
+	path = _write_records(tmpdir, [dict(id=id, name='record %s' % line) for line, id in enumerate(ids, 1)])
+	output_dir = tmpdir.join('out')
+	status = cli.main(['--schemas', schemas_module.__name__, '--input', path, '--root', 'user', '--template',
+	                   '{user.name}', '--output-dir', str(output_dir), '--name-key', 'id', '--workers', str(workers)])
+
+	assert status == 0
+	names = ['1.txt', '1-2.txt', '_1.txt', 'a_b.txt', 'a_b-5.txt', 'A_B-6.txt', '1-2-7.txt', '8.txt']
+	assert sorted(f.basename for f in output_dir.listdir()) == sorted(names)
+	for line, name in enumerate(names, 1):
+		assert output_dir.join(name).read() == 'record %s' % line
+
+# ------------------------------------------------------------------------------
+class CountingDog(object):
+	reads = 0
+
+	def __init__(self, name, dog=None):
+		self._name = name
+		self.dog = dog
+
+	@property
+	def name(self):
+		CountingDog.reads += 1
+		return self._name
+
+def _dog_chain(length):
+	dog = None
+	for i in reversed(range(length)):
+		dog = CountingDog('dog %s' % i, dog)
+	return dog
+
+@pytest.mark.parametrize("options, render_options", [({}, {}), (dict(memoize_dumps=False), {}),
+                                                     (dict(compiled_dumps=True), {}), ({}, dict(plain=True))])
+def test_render_cyclic_dogs(options, render_options):
+	rufus = dict(name='Rufus')
+	snoopy = dict(name='Snoopy', dog=rufus)
+	rufus['dog'] = snoopy
+
+	smores = Smores(**options)
+	smores.add_module_schemas(schemas_module)
+	result = smores.render(dict(dog=rufus), "{dog.name}|{dog.dog.name}|{dog.dog.dog.name}|{dog.dog.with_greeting}|{dog}",
+	                       **render_options)
+	assert result == 'Rufus|Snoopy||Hi, this is my dog Snoopy|Name: Rufus'
+
+def test_render_memoizes_dumps(smores_instance):
+	template = "{dog.dog.dog.dog.dog.dog.name} {dog.with_greeting}"
+	CountingDog.reads = 0
+	assert smores_instance.render(dict(dog=_dog_chain(6)), template) == 'dog 5 Hi, this is my dog dog 0'
+	# each dog is dumped once in full and once for its TemplateString fields
+	assert CountingDog.reads == 2 * 6
+
+	smores = Smores(memoize_dumps=False)
+	smores.add_module_schemas(schemas_module)
+	CountingDog.reads = 0
+	assert smores.render(dict(dog=_dog_chain(6)), template) == 'dog 5 Hi, this is my dog dog 0'
+	assert CountingDog.reads > 2 ** 6
+
+def test_render_max_dump_depth():
+	smores = Smores(max_dump_depth=1)
+	smores.add_module_schemas(schemas_module)
+	assert smores.render(dict(dog=_dog_chain(3)), "{dog.name}|{dog.dog.name}|{dog.dog.dog.name}") == 'dog 0|dog 1|'
+
+# ------------------------------------------------------------------------------
+def test_freeze_warms_caches(monkeypatch):
+	template = "{% if user %}{user.basic}{user.dogs:1.with_greeting}{% endif %}"
+	smores = Smores(compiled_dumps=True)
+	smores.add_module_schemas(schemas_module)
+	smores.freeze(templates=[template])
+
+	assert smores.frozen
+	assert schemas_module.Dog._declared_fields['with_greeting'].template_string in smores.env.field_templates
+
+	def compile_template(*args, **kwargs):
+		raise AssertionError('template compiled after freeze')
+	monkeypatch.setattr(smores.env, 'from_string', compile_template)
+	expected = users[0]['name'] + 'Hi, this is my dog Rufus'
+	assert smores.render(dict(user=users[0]), template) == \
+	       '<div>Leanne Graham</div><div>Sincere@april.biz</div>Hi, this is my dog Rufus'
+	assert smores.render(dict(user=users[0]), "{user.name}{user.dogs:1.with_greeting}") == expected
+
+def test_freeze_makes_schemas_read_only():
+	smores = Smores()
+	smores.add_module_schemas(schemas_module)
+	smores.freeze()
+
+	with pytest.raises(RuntimeError):
+		smores.add_schemas(DumperTag)
+	with pytest.raises(RuntimeError):
+		smores.remove_schemas(schemas_module.Dog)
+	assert schemas_module.Dog in smores.schemas
+
+# ------------------------------------------------------------------------------
+class TreeOwner(Schema):
+	name = fields.String()
+	pet = Nested(schemas_module.Dog, only=('name', 'dog'))
+	pets = Nested(schemas_module.Dog, many=True, exclude=('with_greeting',))
+	company = Nested(schemas_module.Company)
+
+@pytest.mark.parametrize("only, exclude", [(None, None), (['user'], None), (None, ['dog'])])
+def test_tag_tree_expands_to_tags(smores_instance, only, exclude):
+	tree = smores_instance.get_tag_tree(only=only, exclude=exclude)
+	assert expand_tag_tree(json.loads(json.dumps(tree))) == smores_instance.get_tags(only=only, exclude=exclude)
+
+def test_tag_tree_describes_each_schema_once():
+	smores = Smores()
+	smores.add_schemas([TreeOwner, schemas_module.Dog])
+	tree = smores.get_tag_tree()
+
+	assert tree['roots'] == ['dog', 'treeowner']
+	assert sorted(tree['schemas']) == ['company', 'dog', 'treeowner']
+	assert tree['schemas']['dog']['nested'] == dict(dog=dict(schema='dog', many=False, self=True, only=None, exclude=[]))
+	assert tree['schemas']['treeowner']['nested']['pets'] == dict(schema='dog', many=True, self=False, only=None,
+	                                                               exclude=['with_greeting'])
+
+	tags = expand_tag_tree(tree)
+	assert tags == smores.get_tags()
+	assert 'treeowner.pet.dog.name' in tags and 'treeowner.pet.with_greeting' not in tags
+	assert 'treeowner.pets:1.dog.with_greeting' in tags and 'treeowner.pets:1.with_greeting' not in tags
+
+def test_tag_tree_etag():
+	smores = Smores()
+	smores.add_schemas([TreeOwner, schemas_module.Dog])
+	other = Smores()
+	other.add_schemas([schemas_module.Dog, TreeOwner])
+
+	etag = smores.get_tag_tree()['etag']
+	assert smores.get_tag_tree() is smores.get_tag_tree()
+	assert other.get_tag_tree()['etag'] == etag
+	with smores.with_schemas(schemas_module.Company):
+		assert smores.get_tag_tree()['etag'] != etag
+	assert smores.get_tag_tree()['etag'] == etag
+
+# ------------------------------------------------------------------------------
+search_tag_cases = [
+	("greeting", ['dog.with_greeting', 'dog.dog.with_greeting', 'user.dogs:1.with_greeting', 'user.dogs:1.dog.with_greeting']),
+	("Name", ['company.name', 'dog.name', 'user.name', 'dog.dog.name', 'user.company.name', 'user.dogs:1.name',
+	          'user.dogs:1.dog.name']),
+	("catch", ['company.catchphrase', 'user.company.catchphrase']),
+	("adress", ['address', 'user.address']),
+	("geo.lat", ['address.geo.lat']),
+	("user.dogs.dog.name", ['user.dogs:1.dog.name']),
+	("nosuchfield", []),
+	("", []),
+]
+
+@pytest.mark.parametrize("query, tags", search_tag_cases)
+def test_search_tags(smores_instance, query, tags):
+	assert smores_instance.search_tags(query, limit=8) == tags
+
+def test_search_tags_only_and_exclude(smores_instance):
+	assert smores_instance.search_tags('name', only=['user']) == ['user.name', 'user.company.name', 'user.dogs:1.name',
+	                                                              'user.dogs:1.dog.name']
+	assert 'dog.name' not in smores_instance.search_tags('name', exclude=['dog'])
+
+def test_search_tags_follows_registered_schemas():
+	smores = Smores()
+	smores.add_schemas(schemas_module.Dog)
+	assert smores.search_tags('pets') == []
+	dog_paths = smores._tag_index._roots[schemas_module.Dog]
+
+	with smores.with_schemas(TreeOwner):
+		assert smores.search_tags('pets.name') == ['treeowner.pets:1.name']
+		# only the added root is indexed
+		assert smores._tag_index._roots[schemas_module.Dog] is dog_paths
+	assert smores.search_tags('pets') == []
+	assert smores.search_tags('greeting') == ['dog.with_greeting', 'dog.dog.with_greeting']
+
+# ------------------------------------------------------------------------------
+snapshot_templates = [t for t, _ in default_template_cases + non_default_template_strings] + [
+	"{User.Name}: {user.dogs:1.name} {user.dogs:1.dog.with_greeting} {user.address.geo.lat}",
+	"{% for dog in user.dogs %}{{ dog.Name }} {{ dog }}{% endfor %}",
+]
+
+def test_render_snapshot(smores_instance):
+	snapshot = smores_instance.snapshot(dict(user=users[0]))
+	stored = to_bytes(snapshot)
+	assert from_bytes(stored) == snapshot
+	assert snapshot['user']['address']['geo']['lat'] == decimal.Decimal('-37.3159')
+
+	for template in snapshot_templates:
+		expected = smores_instance.render(dict(user=users[0]), template)
+		assert smores_instance.render_snapshot(snapshot, template) == expected
+		assert smores_instance.render_snapshot(stored, template) == expected
+
+def test_render_snapshot_of_models(smores_instance):
+	with db_session:
+		stored = to_bytes(smores_instance.snapshot(dict(user=User[1])))
+		expected = [smores_instance.render(dict(user=User[1]), template) for template in snapshot_templates]
+	# rendered outside of the db session
+	assert [smores_instance.render_snapshot(stored, template) for template in snapshot_templates] == expected
+
+def test_snapshot_from_bytes_rejects_other_data():
+	with pytest.raises(ValueError):
+		from_bytes(b'not a snapshot')
+
+# ------------------------------------------------------------------------------
+def test_render_bundle(smores_instance):
+	templates = dict(('t%s' % i, template) for i, template in enumerate(snapshot_templates))
+	outputs = smores_instance.render_bundle(dict(user=users[0]), templates)
+	assert outputs == dict((name, smores_instance.render(dict(user=users[0]), t)) for name, t in templates.items())
+
+def test_render_bundle_serializes_fields_once(smores_instance):
+	templates = dict(subject="{dog.name}", body="{dog.name} {dog.with_greeting}", sms="{dog}")
+	CountingDog.reads = 0
+	outputs = smores_instance.render_bundle(dict(dog=_dog_chain(2)), templates)
+
+	assert outputs == dict(subject='dog 0', body='dog 0 Hi, this is my dog dog 0', sms='Name: dog 0')
+	assert CountingDog.reads == 1
+
+def test_render_bundle_limits(smores_instance):
+	limits = RenderLimits(max_output_bytes=10)
+	outputs = smores_instance.render_bundle(dict(user=users[0]), dict(short="{user.id}"), limits=limits)
+	assert outputs == dict(short='1')
+	with pytest.raises(RenderLimitExceeded):
+		smores_instance.render_bundle(dict(user=users[0]), dict(short="{user.id}", long="{user.long_template}"),
+		                              limits=limits)
+
+# ------------------------------------------------------------------------------
+profile_templates = [
+	("{user.name} {user.dogs} {user.dogs:2.name}", {'user.name', 'user.dogs', 'user.dogs:2.name'}),
+	("{% for dog in user.dogs %}{dog.name}{% endfor %} {user.dogs} {user.dogs:2.name} {{ 1 + 2 }}",
+	 {'dog.name', 'user.dogs', 'user.dogs:2.name'}),
+]
+
+@pytest.mark.parametrize("template, tags", profile_templates)
+def test_render_profile(smores_instance, template, tags):
+	profile = RenderProfile()
+	result = smores_instance.render(dict(user=users[0]), template, lazy=True, profile=profile)
+	assert result == smores_instance.render(dict(user=users[0]), template, lazy=True)
+
+	rows = dict(((row['kind'], row['name']), row) for row in profile.report())
+	assert set(name for kind, name in rows if kind == 'tag') == tags
+	assert ('field', 'Dog._default_template') in rows
+	assert rows['field', 'Dog._default_template']['calls'] == len(users[0]['dogs'])
+	# the dogs' default templates are rendered for the tag {user.dogs}
+	assert rows['tag', 'user.dogs']['seconds'] >= rows['field', 'Dog._default_template']['seconds']
+	assert rows['tag', 'user.dogs']['allocations'] > 0
+	assert all(row['self_seconds'] <= row['seconds'] for row in rows.values())
+	assert profile.seconds >= rows['tag', 'user.dogs']['seconds']
+
+	report = profile.report()
+	assert report == sorted(report, key=lambda row: -row['seconds'])
+	assert 'Dog._default_template' in profile.format(limit=10)
+
+def test_render_profile_eager_dumps(smores_instance):
+	profile = RenderProfile()
+	smores_instance.render(dict(user=users[0]), "{user.long_template}", profile=profile)
+	rows = dict(((row['kind'], row['name']), row) for row in profile.report())
+	assert rows['dump', 'user']['calls'] == 1
+	assert rows['field', 'User.long_template']['calls'] == 1
+	assert rows['tag', 'user.long_template']['calls'] == 1
+
+def test_render_profile_accumulates_and_skips_render_cache():
+	smores = Smores(render_cache=LRUCache())
+	smores.add_module_schemas(schemas_module)
+	profile = RenderProfile()
+	for _ in range(2):
+		smores.render(dict(user=users[0]), "{user.name}", profile=profile)
+	assert [(row['name'], row['calls']) for row in profile.report() if row['kind'] == 'tag'] == [('user.name', 2)]
+
+	profile.reset()
+	assert profile.report() == []
+
+# ------------------------------------------------------------------------------
+@pytest.mark.parametrize("tags", [
+	lambda smores: smores.get_tags(),
+	lambda smores: expand_tag_tree(smores.get_tag_tree()),
+	lambda smores: smores.search_tags('value', limit=100),
+])
+def test_tag_caches_built_while_schemas_change(monkeypatch, tags):
+	class Early(Schema):
+		value = fields.String()
+
+	class Late(Schema):
+		value = fields.String()
+
+	smores = Smores()
+	smores.add_schemas(Early)
+	filter_schemas = smores._filter_schemas
+
+	def filter_and_register(schemas, only=None, exclude=None):
+		# another thread registers a schema while the tags are built
+		if Late not in smores.schemas:
+			smores.add_schemas(Late)
+		return filter_schemas(schemas, only=only, exclude=exclude)
+
+	monkeypatch.setattr(smores, '_filter_schemas', filter_and_register)
+	assert 'late.value' not in tags(smores)
+	assert 'late.value' in tags(smores)